@@ -1,43 +1,300 @@
-from flask import Flask, request, session, jsonify, send_from_directory
+from flask import Flask, current_app, request, session, jsonify, send_from_directory, Response, stream_with_context, json, abort
 from flask_restful import Api, Resource
 from flask_cors import CORS
-from config import app, db
-from models import User, Cocktail, Ingredient, CocktailIngredient, Review
-from sqlalchemy.exc import IntegrityError
+import click
+from flask.cli import with_appcontext
+from config import configure, db, init_migrate, DEV_SECRET_KEY
+from engines import init_engines
+from models import (User, Cocktail, Ingredient, CocktailIngredient, Review, likes,
+                    COCKTAIL_DETAIL_LOADERS, REVIEW_LIST_LOADERS, USER_LOADERS, reconcile_aggregates, add_cocktail_ingredients,
+                    load_recipe, sync_cocktail_ingredients,
+                    UserSchema, IngredientSchema, CocktailSchema, CocktailIngredientSchema,
+                    ReviewSchema, CocktailDetailSchema, json_encoder, columns_for)
+from search import search_cocktails
+from makeable import makeable_index, MakeableIndex
+from similar import similar_index, SimilarIndex
+from leaderboards import leaderboards, Leaderboards
+from response_cache import response_cache, ResponseCache, LRUBackend, CachelibBackend
+from cachelib import FileSystemCache
+from sqlalchemy import select, exists, insert, update, delete
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import configure_mappers
+import hmac
 import os
-from flask_session import Session
-
-api = Api(app)
-CORS(app, supports_credentials=True)
-
-# Configure server-side session
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_USE_SIGNER'] = True
-app.config['SESSION_COOKIE_SECURE'] = True  # Use only with HTTPS
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-Session(app)
-
-# Serve React app
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    if path != "" and os.path.exists(app.static_folder + '/' + path):
-        return send_from_directory(app.static_folder, path)
+from urllib.parse import urlencode, parse_qsl
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+from passwords import PasswordHasher, LoginThrottle, HasherBusy
+from profiling import RequestProfiler, serialization
+from like_buffer import like_buffer, LikeBuffer
+from static_assets import static_manifest, StaticManifest
+from catalog import export_catalog, import_catalog
+from sqlalchemy_serializer import SerializerMixin
+
+# Resources are added at the bottom of this module and registered on each
+# app that create_app() builds
+api = Api()
+
+def create_app():
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
+    init_engines(app, db)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        init_migrate(app)
+    api.init_app(app)
+    CORS(app, supports_credentials=True)
+    if app.config['SESSION_BACKEND'] == 'cookie':
+        if app.secret_key == DEV_SECRET_KEY:
+            # Anyone could sign a session with the public fallback key
+            raise RuntimeError('SESSION_BACKEND=cookie needs SECRET_KEY to be set')
     else:
-        return send_from_directory(app.static_folder, 'index.html')
+        # Flask-Session is only needed by the server-side backends
+        from sessions import init_session
+        init_session(app)
+
+    # Each app gets its own indexes, caches and pools in app.extensions; the
+    # module-level names (makeable_index, response_cache, ...) are proxies
+    # to the current app's
+    MakeableIndex().init_app(app)
+    SimilarIndex().init_app(app)
+    Leaderboards().init_app(app)
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['BCRYPT_WORKERS'], app.config['BCRYPT_MAX_PENDING'], app.config['BCRYPT_LOG_ROUNDS'])
+    app.extensions['login_throttle'] = LoginThrottle(
+        app.config['LOGIN_MAX_FAILURES_PER_USER'], app.config['LOGIN_MAX_FAILURES_PER_IP'],
+        app.config['LOGIN_FAILURE_WINDOW'])
+
+    # Registered before the response cache so cache hits are measured too
+    if app.config['PROFILING']:
+        RequestProfiler().init_app(app, db, api, serializers=(SerializerMixin,))
+
+    cache = ResponseCache()
+    for endpoint, tags in CACHE_TAGS.items():
+        cache.register(endpoint, tags)
+
+    # Also ahead of the response cache: a user's GET must flush their buffered
+    # likes before a cached page can answer it
+    LikeBuffer().init_app(app, on_flush=lambda ids: cache.invalidate(
+        'cocktails', *(f'cocktail:{id}' for id in ids)))
+
+    cache.init_app(app, response_cache_backend(app))
+
+    # Serve React app
+    StaticManifest().init_app(app)
+    app.add_url_rule('/', 'serve', serve, defaults={'path': ''})
+    app.add_url_rule('/<path:path>', 'serve', serve)
+
+    for command in CLI_COMMANDS:
+        app.cli.add_command(command)
+
+    configure_mappers()
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
+def __getattr__(name):
+    # `from app import app` (and `gunicorn app:app`) build the app on first
+    # use, so importing this module for create_app() doesn't build a second one
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def response_cache_backend(app):
+    kind = app.config['RESPONSE_CACHE']
+    if kind == 'lru':
+        return LRUBackend(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TIMEOUT'])
+    if kind == 'filesystem':
+        cache = FileSystemCache(app.config['RESPONSE_CACHE_DIR'],
+                                threshold=app.config['RESPONSE_CACHE_SIZE'],
+                                default_timeout=app.config['RESPONSE_CACHE_TIMEOUT'])
+        return CachelibBackend(cache, app.config['RESPONSE_CACHE_TIMEOUT'])
+    return None
+
+def warm_up(app):
+    """Run the hot read plans once, so their statements are compiled into the
+    engine's cache at boot rather than by the first requests."""
+    with app.app_context():
+        try:
+            cocktails, _, _ = run_plan(cocktail_page_plan(*parse_cocktail_page_args(MultiDict({'limit': 1}))))
+            if cocktails:
+                run_plan(cocktail_details_plan([cocktails[0]['id']]))
+        except SQLAlchemyError:
+            app.logger.info('Skipped warming up the read queries: the database has no schema yet')
+        # A pre-fork server may fork workers from this process; they must not
+        # share its connections. The compiled statements stay on the engines.
+        for engine in db.engines.values():
+            engine.dispose()
+
+def serve(path):
+    return static_manifest.serve(path, fallback='index.html')
+
+# Serialization
+# The user's reviews and their cocktails are part of the auth responses; the
+# users who liked those cocktails are listed without their own reviews, which
+# would otherwise recurse back through the same cocktails
+USER_RULES = ('-liked_cocktails', '-reviews.cocktail.likes.reviews')
+COCKTAIL_LIST_RULES = ('-reviews', '-ingredients', '-likes')
+COCKTAIL_DETAIL_RULES = (
+    '-reviews.cocktail', '-reviews.user.reviews', '-reviews.user.liked_cocktails',
+    '-ingredients.cocktail', '-ingredients.ingredient.cocktails',
+    '-likes.liked_cocktails', '-likes.reviews',
+)
+REVIEW_RULES = ('-user.reviews', '-user.liked_cocktails', '-cocktail')
+
+USER_COLUMNS = columns_for(UserSchema, User)
+INGREDIENT_COLUMNS = columns_for(IngredientSchema, Ingredient)
+COCKTAIL_COLUMNS = columns_for(CocktailSchema, Cocktail)
+COCKTAIL_INGREDIENT_COLUMNS = columns_for(CocktailIngredientSchema, CocktailIngredient)
+REVIEW_COLUMNS = columns_for(ReviewSchema, Review)
+
+def use_msgspec():
+    return current_app.config['SERIALIZER'] == 'msgspec'
+
+def encoded(obj, status=200, headers=None):
+    with serialization():
+        body = json_encoder.encode(obj)
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+def split_row(row, width):
+    return row[:width], row[width:]
+
+# Query plans: generators that yield each statement they need run and are
+# sent its result back. run_plan() drives one with the request's session;
+# asgi.py drives the same plans with an async session.
+
+def run_plan(plan):
+    try:
+        stmt = next(plan)
+        while True:
+            stmt = plan.send(db.session.execute(stmt))
+    except StopIteration as done:
+        return done.value
+
+def reviews_by_cocktail_plan(cocktail_ids):
+    """{cocktail id: its reviews} for every id in ``cocktail_ids``."""
+    stmt = (select(*REVIEW_COLUMNS, *USER_COLUMNS)
+            .join(Review.user)
+            .where(Review.cocktail_id.in_(cocktail_ids))
+            .order_by(Review.id))
+    width = len(REVIEW_COLUMNS)
+    reviews = {cocktail_id: [] for cocktail_id in cocktail_ids}
+    for row in (yield stmt):
+        review, user = split_row(row, width)
+        review = ReviewSchema(*review, user=UserSchema(*user))
+        reviews[review.cocktail_id].append(review)
+    return reviews
+
+def reviews_plan(cocktail_id):
+    return (yield from reviews_by_cocktail_plan([cocktail_id]))[cocktail_id]
+
+def cocktail_details_plan(ids):
+    """{id: CocktailDetailSchema} for the ``ids`` that exist, with one query
+    per table however many ids are asked for."""
+    rows = (yield select(*COCKTAIL_COLUMNS).where(Cocktail.id.in_(ids))).all()
+    found = [row.id for row in rows]
+    if not found:
+        return {}
+
+    stmt = (select(*COCKTAIL_INGREDIENT_COLUMNS, *INGREDIENT_COLUMNS)
+            .join(CocktailIngredient.ingredient)
+            .where(CocktailIngredient.cocktail_id.in_(found))
+            .order_by(CocktailIngredient.id))
+    width = len(COCKTAIL_INGREDIENT_COLUMNS)
+    ingredients = {id: [] for id in found}
+    for ingredient_row in (yield stmt):
+        link, ingredient = split_row(ingredient_row, width)
+        link = CocktailIngredientSchema(*link, ingredient=IngredientSchema(*ingredient))
+        ingredients[link.cocktail_id].append(link)
+
+    stmt = (select(likes.c.cocktail_id, *USER_COLUMNS)
+            .join(likes, likes.c.user_id == User.id)
+            .where(likes.c.cocktail_id.in_(found))
+            .order_by(User.id))
+    liked_by = {id: [] for id in found}
+    for cocktail_id, *user in (yield stmt):
+        liked_by[cocktail_id].append(UserSchema(*user))
+
+    reviews = yield from reviews_by_cocktail_plan(found)
+    return {row.id: CocktailDetailSchema(*row, reviews=reviews[row.id], ingredients=ingredients[row.id],
+                                         likes=liked_by[row.id])
+            for row in rows}
+
+def cocktail_detail_plan(id):
+    details = yield from cocktail_details_plan([id])
+    if id not in details:
+        abort(404)
+    return details[id]
+
+def cocktails_by_ids_plan(ids):
+    """Details of ``ids`` in the order given, None for ids that don't exist."""
+    details = yield from cocktail_details_plan(ids)
+    return [details.get(id) for id in ids]
+
+def load_reviews(cocktail_id):
+    return run_plan(reviews_plan(cocktail_id))
+
+def load_cocktail_detail(id):
+    return run_plan(cocktail_detail_plan(id))
+
+def ingredient_items(cocktail_id, ingredients):
+    return [(cocktail_id, item['name'], item.get('amount', '')) for item in ingredients]
+
+def render_cocktail_detail(id):
+    if use_msgspec():
+        return encoded(load_cocktail_detail(id))
+    cocktail = Cocktail.query.options(*COCKTAIL_DETAIL_LOADERS).populate_existing().get_or_404(id)
+    return cocktail.to_dict(rules=COCKTAIL_DETAIL_RULES), 200
+
+def legacy_cocktail_details(ids):
+    cocktails = (Cocktail.query.options(*COCKTAIL_DETAIL_LOADERS).populate_existing()
+                 .filter(Cocktail.id.in_(ids)))
+    return {cocktail.id: cocktail.to_dict(rules=COCKTAIL_DETAIL_RULES) for cocktail in cocktails}
+
+def legacy_reviews_by_cocktail(cocktail_ids):
+    reviews = {cocktail_id: [] for cocktail_id in cocktail_ids}
+    query = (Review.query.options(*REVIEW_LIST_LOADERS)
+             .filter(Review.cocktail_id.in_(cocktail_ids)).order_by(Review.id))
+    for review in query:
+        reviews[review.cocktail_id].append(review.to_dict(rules=REVIEW_RULES))
+    return reviews
+
+def is_liked(user_id, cocktail_id):
+    stmt = select(exists().where(likes.c.user_id == user_id, likes.c.cocktail_id == cocktail_id))
+    return db.session.scalar(stmt)
+
+def cocktail_exists_or_404(id):
+    if not db.session.scalar(select(exists().where(Cocktail.id == id))):
+        abort(404)
+
+def like_count_or_404(id):
+    like_count = db.session.scalar(select(Cocktail.like_count).where(Cocktail.id == id))
+    if like_count is None:
+        abort(404)
+    return like_count
+
+def adjust_like_count(id, delta):
+    stmt = (update(Cocktail.__table__)
+            .where(Cocktail.id == id)
+            .values(like_count=Cocktail.like_count + delta)
+            .returning(Cocktail.like_count))
+    return db.session.execute(stmt).scalar_one()
 
 # API Routes
 class AuthStatus(Resource):
     def get(self):
         if 'user_id' not in session:
             return {'isAuthenticated': False, 'user': None}, 200
-        user = User.query.get(session['user_id'])
+        user = User.query.options(*USER_LOADERS).get(session['user_id'])
         if user:
-            return {'isAuthenticated': True, 'user': user.to_dict(rules=('-liked_cocktails',))}, 200
+            return {'isAuthenticated': True, 'user': user.to_dict(rules=USER_RULES)}, 200
         return {'isAuthenticated': False, 'user': None}, 200
 
+def hasher_busy():
+    return {'error': 'Server busy, please try again shortly'}, 503, {'Retry-After': '1'}
+
 class Signup(Resource):
     def post(self):
         data = request.get_json()
@@ -50,28 +307,163 @@ class Signup(Resource):
             db.session.add(user)
             db.session.commit()
             session['user_id'] = user.id
-            return user.to_dict(rules=('-liked_cocktails',)), 201
+            return user.to_dict(rules=USER_RULES), 201
+        except HasherBusy:
+            return hasher_busy()
         except IntegrityError:
             return {'error': 'Username or email already exists'}, 422
 
 class Login(Resource):
     def post(self):
         data = request.get_json()
-        user = User.query.filter_by(username=data['username']).first()
-        if user and user.check_password(data['password']):
-            session['user_id'] = user.id
-            return user.to_dict(rules=('-liked_cocktails',)), 200
-        return {'error': 'Invalid username or password'}, 401
+        username = data['username']
+        # Refuse throttled attempts before spending any bcrypt time on them
+        login_throttle = current_app.extensions['login_throttle']
+        retry_after = login_throttle.retry_after(username, request.remote_addr)
+        if retry_after:
+            return {'error': 'Too many failed login attempts'}, 429, {'Retry-After': str(retry_after)}
+        user = User.query.options(*USER_LOADERS).filter_by(username=username).first()
+        try:
+            valid = user is not None and user.check_password(data['password'])
+        except HasherBusy:
+            return hasher_busy()
+        if not valid:
+            login_throttle.failed(username, request.remote_addr)
+            return {'error': 'Invalid username or password'}, 401
+        login_throttle.succeeded(username)
+        if db.session.is_modified(user):
+            db.session.commit()  # rehashed with the current work factor
+        session['user_id'] = user.id
+        return user.to_dict(rules=USER_RULES), 200
 
 class Logout(Resource):
     def post(self):
         session.pop('user_id', None)
         return '', 204
 
+COCKTAIL_LIST_FIELDS = ('id', 'name', 'instructions', 'image_url', 'glass_type',
+                        'like_count', 'review_count', 'rating_sum', 'average_rating')
+# Columns PATCH /api/cocktails/<id> may set; the aggregates belong to the write paths
+COCKTAIL_EDITABLE_FIELDS = ('name', 'instructions', 'image_url', 'glass_type')
+
+def parse_fields(raw, allowed):
+    if not raw:
+        return allowed
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def parse_cocktail_page_args(args):
+    """(fields, after, limit) from GET /api/cocktails' query string; raises
+    ValueError with the message for a 400 response."""
+    fields = parse_fields(args.get('fields'), COCKTAIL_LIST_FIELDS)
+    try:
+        after = int(args.get('after', 0))
+        limit = int(args['limit']) if 'limit' in args else None
+    except ValueError:
+        raise ValueError('after and limit must be integers') from None
+    return fields, after, limit
+
+def parse_ids(raw):
+    """Cocktail ids from an ``ids=1,2,3`` parameter, without duplicates;
+    raises ValueError with the message for a 400 response."""
+    try:
+        ids = list(dict.fromkeys(int(id) for id in raw.split(',') if id.strip()))
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers') from None
+    limit = current_app.config['BATCH_MAX_ITEMS']
+    if not ids or len(ids) > limit:
+        raise ValueError(f'ids must list between 1 and {limit} cocktails')
+    return ids
+
+def cocktail_list_statement(fields, after):
+    # Always select the id so the keyset cursor can advance, even when
+    # the client did not ask for it.
+    columns = [Cocktail.id] + [getattr(Cocktail, f) for f in fields if f != 'id']
+    names = ['id'] + [f for f in fields if f != 'id']
+    include_id = 'id' in fields
+    stmt = select(*columns).where(Cocktail.id > after).order_by(Cocktail.id)
+    return stmt, names, include_id
+
+def cocktail_row_dict(row, names, include_id):
+    data = dict(zip(names, row))
+    if not include_id:
+        del data['id']
+    return data
+
+def cocktail_page_plan(fields, after, limit):
+    """Returns (cocktails, page size, cursor of the next page or None)."""
+    stmt, names, include_id = cocktail_list_statement(fields, after)
+    page_size = current_app.config['COCKTAILS_PAGE_SIZE'] if limit is None else limit
+    page_size = max(1, min(page_size, current_app.config['COCKTAILS_MAX_PAGE_SIZE']))
+    rows = (yield stmt.limit(page_size + 1)).all()
+    cursor = rows[page_size - 1][0] if len(rows) > page_size else None
+    cocktails = [cocktail_row_dict(row, names, include_id) for row in rows[:page_size]]
+    return cocktails, page_size, cursor
+
+def next_page_headers(path, args, cursor, page_size):
+    if cursor is None:
+        return {}
+    args = args.to_dict()
+    args.update(after=cursor, limit=page_size)
+    query = urlencode(args)
+    return {'X-Next-Cursor': str(cursor), 'Link': f'<{path}?{query}>; rel="next"'}
+
+def wants_ndjson(args, accept_mimetypes):
+    return args.get('format') == 'ndjson' or accept_mimetypes.best == 'application/x-ndjson'
+
 class CocktailList(Resource):
     def get(self):
-        cocktails = Cocktail.query.all()
-        return [cocktail.to_dict(rules=('-reviews', '-ingredients', '-likes')) for cocktail in cocktails], 200
+        if 'ids' in request.args:
+            return self.get_by_ids(request.args['ids'])
+        try:
+            fields, after, limit = parse_cocktail_page_args(request.args)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        if wants_ndjson(request.args, request.accept_mimetypes):
+            stmt, names, include_id = cocktail_list_statement(fields, after)
+            if limit is not None:
+                stmt = stmt.limit(max(limit, 0))
+            return self.stream(stmt, names, include_id)
+
+        cocktails, page_size, cursor = run_plan(cocktail_page_plan(fields, after, limit))
+        headers = next_page_headers(request.path, request.args, cursor, page_size)
+        if use_msgspec():
+            return encoded(cocktails, headers=headers)
+        return cocktails, 200, headers
+
+    def get_by_ids(self, raw):
+        """Details of several cocktails, in the order asked for, with null
+        for ids that don't exist."""
+        try:
+            ids = parse_ids(raw)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if use_msgspec():
+            return encoded(run_plan(cocktails_by_ids_plan(ids)))
+        details = legacy_cocktail_details(ids)
+        return [details.get(id) for id in ids], 200
+
+    def stream(self, stmt, names, include_id):
+        chunk = current_app.config['COCKTAILS_STREAM_CHUNK']
+        if use_msgspec():
+            dumps = json_encoder.encode
+            newline = b'\n'
+        else:
+            dumps = lambda obj: json.dumps(obj, separators=(',', ':'))
+            newline = '\n'
+
+        def generate():
+            result = db.session.execute(stmt.execution_options(yield_per=chunk))
+            for partition in result.partitions():
+                yield newline.join(
+                    dumps(cocktail_row_dict(row, names, include_id)) for row in partition
+                ) + newline
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
     def post(self):
         if 'user_id' not in session:
@@ -84,55 +476,119 @@ class CocktailList(Resource):
             glass_type=data.get('glass_type', '')
         )
         db.session.add(new_cocktail)
-        
-        for ingredient_data in data.get('ingredients', []):
-            ingredient = Ingredient.query.filter_by(name=ingredient_data['name']).first()
-            if not ingredient:
-                ingredient = Ingredient(name=ingredient_data['name'])
-                db.session.add(ingredient)
-            
-            cocktail_ingredient = CocktailIngredient(
-                cocktail=new_cocktail,
-                ingredient=ingredient,
-                amount=ingredient_data.get('amount', '')
-            )
-            db.session.add(cocktail_ingredient)
-        
+        db.session.flush()
+        add_cocktail_ingredients(ingredient_items(new_cocktail.id, data.get('ingredients', [])))
         db.session.commit()
-        return new_cocktail.to_dict(rules=('-reviews', '-ingredients', '-likes')), 201
+        response_cache.invalidate('cocktails')
+        makeable_index.refresh(new_cocktail.id)
+        return new_cocktail.to_dict(rules=COCKTAIL_LIST_RULES), 201
+
+class CocktailSearch(Resource):
+    """GET /api/cocktails/search?q=...[&prefix=0][&fields=...][&limit=...][&offset=...]
+
+    Results are ranked by relevance, except for queries matching more than
+    SEARCH_RANK_WINDOW cocktails, which come in catalog (id) order. The
+    X-Search-Order header says which: 'rank' or 'catalog'.
+    """
+    def get(self):
+        q = request.args.get('q', '').strip()
+        if not q:
+            return {'error': 'q is required'}, 400
+        try:
+            fields = parse_fields(request.args.get('fields'), COCKTAIL_LIST_FIELDS)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        try:
+            offset = max(int(request.args.get('offset', 0)), 0)
+            limit = int(request.args.get('limit', current_app.config['SEARCH_PAGE_SIZE']))
+        except ValueError:
+            return {'error': 'offset and limit must be integers'}, 400
+        limit = max(1, min(limit, current_app.config['COCKTAILS_MAX_PAGE_SIZE']))
+        prefix = request.args.get('prefix', '1') != '0'
+
+        columns = [getattr(Cocktail, f) for f in fields]
+        rows, ranked = search_cocktails(q, columns, limit + 1, offset, prefix=prefix,
+                                        rank_window=current_app.config['SEARCH_RANK_WINDOW'])
+        headers = {'X-Search-Order': 'rank' if ranked else 'catalog'}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            args = request.args.to_dict()
+            args.update(offset=offset + limit, limit=limit)
+            headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+        results = [dict(zip(fields, row)) for row in rows]
+        if use_msgspec():
+            return encoded(results, headers=headers)
+        return results, 200, headers
+
+class MakeableCocktails(Resource):
+    def post(self):
+        data = request.get_json() or {}
+        names = data.get('ingredients')
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            return {'error': 'ingredients must be a list of ingredient names'}, 400
+        try:
+            max_missing = int(data.get('max_missing', 0))
+            limit = int(data.get('limit', current_app.config['MAKEABLE_PAGE_SIZE']))
+        except (TypeError, ValueError):
+            return {'error': 'max_missing and limit must be integers'}, 400
+        if max_missing < 0:
+            return {'error': 'max_missing must not be negative'}, 400
+        limit = max(1, min(limit, current_app.config['COCKTAILS_MAX_PAGE_SIZE']))
+
+        have = db.session.scalars(select(Ingredient.id).where(Ingredient.name.in_(names))).all()
+        matches = makeable_index.match(have, max_missing)
+        # Closest to makeable first
+        page = sorted(matches.items(), key=lambda item: (len(item[1]), item[0]))[:limit]
+        if not page:
+            return [], 200, {'X-Total-Count': '0'}
+
+        columns = [getattr(Cocktail, f) for f in COCKTAIL_LIST_FIELDS]
+        rows = db.session.execute(select(*columns).where(Cocktail.id.in_([cid for cid, _ in page])))
+        cocktails = {row[0]: dict(zip(COCKTAIL_LIST_FIELDS, row)) for row in rows}
+        missing_ids = set().union(*(missing for _, missing in page))
+        ingredient_names = dict(db.session.execute(
+            select(Ingredient.id, Ingredient.name).where(Ingredient.id.in_(missing_ids))
+        ).all()) if missing_ids else {}
+
+        results = []
+        for cocktail_id, missing in page:
+            cocktail = cocktails.get(cocktail_id)
+            if cocktail is None:
+                continue  # deleted by another worker since the index was built
+            cocktail['missing'] = sorted(ingredient_names[i] for i in missing if i in ingredient_names)
+            results.append(cocktail)
+        headers = {'X-Total-Count': str(len(matches))}
+        if use_msgspec():
+            return encoded(results, headers=headers)
+        return results, 200, headers
 
 class CocktailResource(Resource):
     def get(self, id):
-        cocktail = Cocktail.query.get_or_404(id)
-        return cocktail.to_dict(rules=('-reviews.cocktail', '-ingredients.cocktail', '-likes.liked_cocktails')), 200
+        return render_cocktail_detail(id)
 
     def patch(self, id):
         if 'user_id' not in session:
             return {'error': 'Unauthorized'}, 401
         cocktail = Cocktail.query.get_or_404(id)
         data = request.get_json()
-        for key, value in data.items():
-            if key != 'ingredients':
-                setattr(cocktail, key, value)
-        
+        if not isinstance(data, dict):
+            return {'error': 'Expected a JSON object'}, 400
+        unknown = sorted(set(data) - set(COCKTAIL_EDITABLE_FIELDS) - {'ingredients'})
+        if unknown:
+            return {'error': f'Fields cannot be edited: {", ".join(unknown)}'}, 400
+        for key in COCKTAIL_EDITABLE_FIELDS:
+            if key in data:
+                setattr(cocktail, key, data[key])
+
         if 'ingredients' in data:
-            CocktailIngredient.query.filter_by(cocktail_id=cocktail.id).delete()
-            
-            for ingredient_data in data['ingredients']:
-                ingredient = Ingredient.query.filter_by(name=ingredient_data['name']).first()
-                if not ingredient:
-                    ingredient = Ingredient(name=ingredient_data['name'])
-                    db.session.add(ingredient)
-                
-                cocktail_ingredient = CocktailIngredient(
-                    cocktail=cocktail,
-                    ingredient=ingredient,
-                    amount=ingredient_data.get('amount', '')
-                )
-                db.session.add(cocktail_ingredient)
-        
+            items = [(item['name'], item.get('amount', '')) for item in data['ingredients']]
+            sync_cocktail_ingredients(cocktail.id, items)
+
         db.session.commit()
-        return cocktail.to_dict(rules=('-reviews.cocktail', '-ingredients.cocktail', '-likes.liked_cocktails')), 200
+        response_cache.invalidate('cocktails', f'cocktail:{id}')
+        if 'ingredients' in data:
+            makeable_index.refresh(id)
+        return render_cocktail_detail(id)
 
     def delete(self, id):
         if 'user_id' not in session:
@@ -140,34 +596,174 @@ class CocktailResource(Resource):
         cocktail = Cocktail.query.get_or_404(id)
         db.session.delete(cocktail)
         db.session.commit()
+        response_cache.invalidate('cocktails', f'cocktail:{id}', f'reviews:{id}')
+        makeable_index.set_recipe(id, ())
+        similar_index.remove(id)
+        leaderboards.remove(id)
         return '', 204
 
+def pointer_to_name(path):
+    # JSON Pointer with a single reference token: "/Lime Juice"
+    if not isinstance(path, str) or not path.startswith('/') or path.count('/') != 1 or len(path) < 2:
+        raise ValueError(f'Invalid ingredient path: {path!r}')
+    return path[1:].replace('~1', '/').replace('~0', '~')
+
+class CocktailIngredientPatch(Resource):
+    """JSON-Patch style edits to a single cocktail's recipe.
+
+    The recipe is treated as an object of ingredient name -> amount, e.g.
+    [{"op": "add", "path": "/Lime Juice", "value": "1 oz"},
+     {"op": "remove", "path": "/Sugar"}]
+    """
+    def patch(self, id):
+        if 'user_id' not in session:
+            return {'error': 'Unauthorized'}, 401
+        cocktail_exists_or_404(id)
+        ops = request.get_json()
+        if not isinstance(ops, list):
+            return {'error': 'Expected a list of patch operations'}, 400
+
+        current = load_recipe(id)
+        recipe = {name: amount for _, name, amount in current}
+        for op in ops:
+            try:
+                name = pointer_to_name(op.get('path'))
+            except (AttributeError, ValueError) as e:
+                return {'error': str(e)}, 400
+            kind = op.get('op')
+            if kind == 'add':
+                recipe[name] = op.get('value', '')
+            elif kind == 'replace':
+                if name not in recipe:
+                    return {'error': f'{name} is not in this recipe'}, 422
+                recipe[name] = op.get('value', '')
+            elif kind == 'remove':
+                if name not in recipe:
+                    return {'error': f'{name} is not in this recipe'}, 422
+                del recipe[name]
+            else:
+                return {'error': f'Unsupported op: {kind!r}'}, 400
+
+        sync_cocktail_ingredients(id, recipe.items(), current)
+        db.session.commit()
+        # Search results match on ingredient names
+        response_cache.invalidate('cocktails', f'cocktail:{id}')
+        makeable_index.refresh(id)
+        return render_cocktail_detail(id)
+
 class LikeCocktail(Resource):
     def post(self, id):
         if 'user_id' not in session:
             return {'error': 'Unauthorized'}, 401
-        cocktail = Cocktail.query.get_or_404(id)
-        user = User.query.get(session['user_id'])
-        if user not in cocktail.likes:
-            cocktail.likes.append(user)
-            db.session.commit()
-        return {'likes': len(cocktail.likes)}, 200
+        like_count = like_count_or_404(id)
+        user_id = session['user_id']
+        if like_buffer.enabled:
+            delta, changed = like_buffer.toggle(user_id, id, True, lambda: is_liked(user_id, id))
+            similar_index.set_like(user_id, id, True)
+            if changed:
+                leaderboards.liked(id)
+            return {'likes': like_count + delta}, 200
+        if not is_liked(user_id, id):
+            try:
+                db.session.execute(insert(likes).values(user_id=user_id, cocktail_id=id))
+                like_count = adjust_like_count(id, 1)
+                db.session.commit()
+                response_cache.invalidate('cocktails', f'cocktail:{id}')
+                similar_index.set_like(user_id, id, True)
+                leaderboards.liked(id)
+            except IntegrityError:
+                # A concurrent request liked it first
+                db.session.rollback()
+                like_count = like_count_or_404(id)
+        return {'likes': like_count}, 200
 
 class UnlikeCocktail(Resource):
     def post(self, id):
         if 'user_id' not in session:
             return {'error': 'Unauthorized'}, 401
-        cocktail = Cocktail.query.get_or_404(id)
-        user = User.query.get(session['user_id'])
-        if user in cocktail.likes:
-            cocktail.likes.remove(user)
+        like_count = like_count_or_404(id)
+        user_id = session['user_id']
+        if like_buffer.enabled:
+            delta, changed = like_buffer.toggle(user_id, id, False, lambda: is_liked(user_id, id))
+            similar_index.set_like(user_id, id, False)
+            if changed:
+                # The like may still be buffered, so its time is unknown
+                leaderboards.unliked(id)
+            return {'likes': like_count + delta}, 200
+        if is_liked(user_id, id):
+            liked_at = db.session.scalar(delete(likes)
+                                         .where(likes.c.user_id == user_id, likes.c.cocktail_id == id)
+                                         .returning(likes.c.created_at))
+            if liked_at is not None:
+                like_count = adjust_like_count(id, -1)
             db.session.commit()
-        return {'likes': len(cocktail.likes)}, 200
+            response_cache.invalidate('cocktails', f'cocktail:{id}')
+            similar_index.set_like(user_id, id, False)
+            if liked_at is not None:
+                leaderboards.unliked(id, liked_at)
+        return {'likes': like_count}, 200
+
+def ranked_cocktails(ranking, key):
+    """List fields of the ranked (cocktail id, score) pairs, in order, with
+    each score added as ``key``; cocktails deleted since they were ranked
+    are skipped."""
+    if not ranking:
+        return []
+    columns = [getattr(Cocktail, f) for f in COCKTAIL_LIST_FIELDS]
+    rows = db.session.execute(select(*columns).where(Cocktail.id.in_([cid for cid, _ in ranking])))
+    cocktails = {row[0]: dict(zip(COCKTAIL_LIST_FIELDS, row)) for row in rows}
+    results = []
+    for cocktail_id, score in ranking:
+        cocktail = cocktails.get(cocktail_id)
+        if cocktail is not None:
+            cocktail[key] = score
+            results.append(cocktail)
+    return results
+
+class SimilarCocktails(Resource):
+    def get(self, id):
+        try:
+            limit = int(request.args.get('limit', current_app.config['SIMILAR_TOP_K']))
+        except ValueError:
+            return {'error': 'limit must be an integer'}, 400
+        cocktail_exists_or_404(id)
+        results = ranked_cocktails(similar_index.similar(id, max(1, limit)), 'co_likes')
+        if use_msgspec():
+            return encoded(results)
+        return results, 200
+
+def leaderboard_limit(args):
+    limit = int(args.get('limit', current_app.config['LEADERBOARD_PAGE_SIZE']))
+    return max(1, min(limit, current_app.config['COCKTAILS_MAX_PAGE_SIZE']))
+
+class TrendingCocktails(Resource):
+    def get(self):
+        try:
+            limit = leaderboard_limit(request.args)
+        except ValueError:
+            return {'error': 'limit must be an integer'}, 400
+        results = ranked_cocktails(leaderboards.top_trending(limit), 'score')
+        if use_msgspec():
+            return encoded(results)
+        return results, 200
+
+class TopRatedCocktails(Resource):
+    def get(self):
+        try:
+            limit = leaderboard_limit(request.args)
+        except ValueError:
+            return {'error': 'limit must be an integer'}, 400
+        results = ranked_cocktails(leaderboards.top_rated_cocktails(limit), 'score')
+        if use_msgspec():
+            return encoded(results)
+        return results, 200
 
 class ReviewList(Resource):
     def get(self, cocktail_id):
-        reviews = Review.query.filter_by(cocktail_id=cocktail_id).all()
-        return [review.to_dict(rules=('-user.reviews', '-cocktail')) for review in reviews], 200
+        if use_msgspec():
+            return encoded(load_reviews(cocktail_id))
+        reviews = Review.query.options(*REVIEW_LIST_LOADERS).filter_by(cocktail_id=cocktail_id).all()
+        return [review.to_dict(rules=REVIEW_RULES) for review in reviews], 200
 
     def post(self, cocktail_id):
         if 'user_id' not in session:
@@ -180,8 +776,191 @@ class ReviewList(Resource):
             cocktail_id=cocktail_id
         )
         db.session.add(new_review)
+        db.session.execute(
+            update(Cocktail.__table__)
+            .where(Cocktail.id == cocktail_id)
+            .values(review_count=Cocktail.review_count + 1,
+                    rating_sum=Cocktail.rating_sum + new_review.rating)
+        )
         db.session.commit()
-        return new_review.to_dict(rules=('-user.reviews', '-cocktail')), 201
+        response_cache.invalidate('cocktails', f'cocktail:{cocktail_id}', f'reviews:{cocktail_id}')
+        leaderboards.reviewed(cocktail_id, new_review.rating)
+        return new_review.to_dict(rules=REVIEW_RULES), 201
+
+def is_admin():
+    token = current_app.config['ADMIN_TOKEN']
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+def catalog_imported():
+    response_cache.invalidate('cocktails')
+    makeable_index.invalidate()
+    similar_index.invalidate()
+    leaderboards.invalidate()
+
+class Catalog(Resource):
+    def get(self):
+        if not is_admin():
+            return {'error': 'Forbidden'}, 403
+        lines = export_catalog(current_app.config['CATALOG_CHUNK_SIZE'])
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    def post(self):
+        if not is_admin():
+            return {'error': 'Forbidden'}, 403
+        try:
+            stats = import_catalog(request.stream, current_app.config['CATALOG_CHUNK_SIZE'])
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        catalog_imported()
+        return stats, 200
+
+class BatchItemError(Exception):
+    def __init__(self, status, error):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+
+def route_batch_item(adapter, item):
+    """(kind, ids) for a batchable sub-request; raises BatchItemError."""
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        raise BatchItemError(400, 'Each request needs a path')
+    if str(item.get('method', 'GET')).upper() != 'GET':
+        raise BatchItemError(405, 'Only GET requests can be batched')
+    path, _, query = item['path'].partition('?')
+    try:
+        endpoint, view_args = adapter.match(path, 'GET')
+    except NotFound:
+        raise BatchItemError(404, 'Not found') from None
+    except MethodNotAllowed:
+        raise BatchItemError(405, 'Method not allowed') from None
+    if endpoint == 'cocktailresource':
+        return 'cocktail', [view_args['id']]
+    if endpoint == 'reviewlist':
+        return 'reviews', [view_args['cocktail_id']]
+    args = MultiDict(parse_qsl(query, keep_blank_values=True))
+    if endpoint == 'cocktaillist' and 'ids' in args:
+        try:
+            return 'cocktails', parse_ids(args['ids'])
+        except ValueError as e:
+            raise BatchItemError(400, str(e)) from None
+    raise BatchItemError(400, f'{path} cannot be batched')
+
+class Batch(Resource):
+    """Several GET sub-requests in one round trip.
+
+    Takes {"requests": [{"method": "GET", "path": "/api/cocktails/1"}, ...]}
+    and answers {"responses": [{"status": 200, "body": ...}, ...]} in the
+    same order. Cocktail details (/api/cocktails/<id> and
+    /api/cocktails?ids=...) and review lists (/api/cocktails/<id>/reviews)
+    can be batched; every sub-request is resolved together, with one IN
+    query per table. A failing item gets its own status (404 for a
+    missing cocktail) and does not fail the rest of the batch.
+    """
+
+    def post(self):
+        data = request.get_json(silent=True)
+        items = data.get('requests') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            return {'error': 'requests must be a list of {"method", "path"} objects'}, 400
+        limit = current_app.config['BATCH_MAX_ITEMS']
+        if len(items) > limit:
+            return {'error': f'At most {limit} requests per batch'}, 400
+        if like_buffer.enabled:
+            like_buffer.read_your_writes(session.get('user_id'))
+
+        adapter = current_app.url_map.bind_to_environ(request.environ)
+        routed = []
+        for item in items:
+            try:
+                routed.append(route_batch_item(adapter, item))
+            except BatchItemError as e:
+                routed.append(e)
+        wanted = {'cocktail': set(), 'reviews': set()}
+        for route in routed:
+            if not isinstance(route, BatchItemError):
+                kind, ids = route
+                wanted['reviews' if kind == 'reviews' else 'cocktail'].update(ids)
+
+        details, reviews = {}, {}
+        if use_msgspec():
+            if wanted['cocktail']:
+                details = run_plan(cocktail_details_plan(sorted(wanted['cocktail'])))
+            if wanted['reviews']:
+                reviews = run_plan(reviews_by_cocktail_plan(sorted(wanted['reviews'])))
+        else:
+            if wanted['cocktail']:
+                details = legacy_cocktail_details(sorted(wanted['cocktail']))
+            if wanted['reviews']:
+                reviews = legacy_reviews_by_cocktail(sorted(wanted['reviews']))
+
+        responses = []
+        for route in routed:
+            if isinstance(route, BatchItemError):
+                responses.append({'status': route.status, 'body': {'error': route.error}})
+                continue
+            kind, ids = route
+            if kind == 'reviews':
+                responses.append({'status': 200, 'body': reviews[ids[0]]})
+            elif kind == 'cocktails':
+                responses.append({'status': 200, 'body': [details.get(id) for id in ids]})
+            elif ids[0] in details:
+                responses.append({'status': 200, 'body': details[ids[0]]})
+            else:
+                responses.append({'status': 404, 'body': {'error': 'Cocktail not found'}})
+        if use_msgspec():
+            return encoded({'responses': responses})
+        return {'responses': responses}, 200
+
+class CacheStats(Resource):
+    def get(self):
+        return response_cache.stats(), 200
+
+@click.command('reconcile-aggregates')
+@with_appcontext
+def reconcile_aggregates_command():
+    """Repair drift in the cocktail like/review counters."""
+    repaired = reconcile_aggregates()
+    print(f'Repaired aggregates for {repaired} cocktail(s).')
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static_command():
+    """Write precompressed .gz/.br copies of the static files."""
+    written = static_manifest.compress()
+    print(f'Wrote {written} precompressed file(s) for {len(static_manifest.assets)} static file(s).')
+
+@click.command('export-catalog')
+@with_appcontext
+@click.argument('output', type=click.File('wb'), default='-')
+def export_catalog_command(output):
+    """Write the catalog as NDJSON to OUTPUT (default stdout)."""
+    for lines in export_catalog(current_app.config['CATALOG_CHUNK_SIZE']):
+        output.write(lines)
+
+@click.command('import-catalog')
+@with_appcontext
+@click.argument('input', type=click.File('rb'), default='-')
+def import_catalog_command(input):
+    """Load an NDJSON catalog from INPUT (default stdin)."""
+    try:
+        stats = import_catalog(input, current_app.config['CATALOG_CHUNK_SIZE'])
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    catalog_imported()
+    print(', '.join(f'{count} {kind}' for kind, count in stats.items()))
+
+@click.command('sweep-sessions')
+@with_appcontext
+def sweep_sessions_command():
+    """Delete expired rows from the sessions table."""
+    if current_app.config['SESSION_BACKEND'] != 'sqlalchemy':
+        print('Session backend does not store sessions in the database.')
+        return
+    deleted = current_app.session_interface._delete_expired_sessions()
+    print(f'Deleted {deleted} expired session(s).')
+
+CLI_COMMANDS = (reconcile_aggregates_command, compress_static_command, export_catalog_command,
+                import_catalog_command, sweep_sessions_command)
 
 # Add resources to API
 api.add_resource(AuthStatus, '/api/auth/status')
@@ -189,10 +968,30 @@ api.add_resource(Signup, '/api/signup')
 api.add_resource(Login, '/api/login')
 api.add_resource(Logout, '/api/logout')
 api.add_resource(CocktailList, '/api/cocktails')
+api.add_resource(CocktailSearch, '/api/cocktails/search')
+api.add_resource(MakeableCocktails, '/api/cocktails/makeable')
+api.add_resource(TrendingCocktails, '/api/cocktails/trending')
+api.add_resource(TopRatedCocktails, '/api/cocktails/top-rated')
 api.add_resource(CocktailResource, '/api/cocktails/<int:id>')
+api.add_resource(CocktailIngredientPatch, '/api/cocktails/<int:id>/ingredients')
 api.add_resource(LikeCocktail, '/api/cocktails/<int:id>/like')
 api.add_resource(UnlikeCocktail, '/api/cocktails/<int:id>/unlike')
+api.add_resource(SimilarCocktails, '/api/cocktails/<int:id>/similar')
 api.add_resource(ReviewList, '/api/cocktails/<int:cocktail_id>/reviews')
+api.add_resource(CacheStats, '/api/cache/stats')
+api.add_resource(Catalog, '/api/catalog')
+api.add_resource(Batch, '/api/batch')
+
+# Cached read endpoints and the data each one is built from; the write
+# handlers above invalidate these tags after committing
+CACHE_TAGS = {
+    'cocktaillist': lambda: ['cocktails'],
+    'cocktailsearch': lambda: ['cocktails'],
+    'trendingcocktails': lambda: ['cocktails'],
+    'topratedcocktails': lambda: ['cocktails'],
+    'cocktailresource': lambda id: [f'cocktail:{id}'],
+    'reviewlist': lambda cocktail_id: [f'reviews:{cocktail_id}'],
+}
 
 if __name__ == '__main__':
-    app.run(port=5555, debug=True)
\ No newline at end of file
+    create_app().run(port=5555, debug=True)
\ No newline at end of file
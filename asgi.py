@@ -0,0 +1,202 @@
+"""ASGI entry point: ``uvicorn asgi:application``.
+
+The hot read endpoints (GET /api/cocktails, including its ?ids= multi-get,
+/api/cocktails/<id> and /api/cocktails/<id>/reviews) are answered on the
+event loop. They run the same query plans as the Flask views through
+SQLAlchemy's async engine (aiosqlite, or asyncpg for Postgres), so waiting
+on the database ties up a coroutine instead of a thread. They return the
+same bytes and headers as Flask, including the response cache's ETag and
+its 304 for If-None-Match, but do not read from or fill the response cache.
+
+Everything else goes to the Flask app on a pool of DB_WORKER_THREADS
+threads, including every request whose answer the fast path cannot
+reproduce exactly:
+
+* errors (404, 400), which Flask renders
+* NDJSON streams
+* the legacy serializer
+* CORS requests
+* profiled requests
+* users with write-behind likes still pending
+
+ASYNC_READS=0 sends every request to Flask.
+"""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.datastructures import MultiDict, MIMEAccept
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import http_date, parse_accept_header, parse_etags
+
+from app import (app, json_encoder, parse_cocktail_page_args, cocktail_page_plan, next_page_headers,
+                 wants_ndjson, cocktail_detail_plan, reviews_plan, parse_ids, cocktails_by_ids_plan)
+from config import db
+from engines import database_profile, engine_options, is_memory_sqlite, set_sqlite_pragmas, WRITER_PRAGMAS
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+wsgi_executor = ThreadPoolExecutor(app.config['DB_WORKER_THREADS'], thread_name_prefix='wsgi')
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread by default; use a
+    # pool sized like a threaded WSGI server instead
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+                                 thread_sensitive=False, executor=wsgi_executor)
+
+
+def async_read_engine():
+    """Async twin of the engine the GET handlers read from, or None when
+    the database has no async driver here."""
+    with app.app_context():
+        engine = db.engines.get('reader', db.engine)
+    url = engine.url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or is_memory_sqlite(url):
+        return None  # an in-memory database is private to its connection
+    profile = app.config['DB_PROFILE'] or database_profile(url)
+    options = engine_options(profile, app.config['ASYNC_DB_CONNECTIONS'])
+    if driver == 'sqlite+aiosqlite':
+        # aiosqlite defaults to opening a connection per checkout
+        options['poolclass'] = AsyncAdaptedQueuePool
+    async_engine = create_async_engine(url.set(drivername=driver), **options)
+    if driver == 'sqlite+aiosqlite':
+        set_sqlite_pragmas(async_engine.sync_engine, {
+            name: value for name, value in app.config['SQLITE_PRAGMAS'].items() if name not in WRITER_PRAGMAS})
+    return async_engine
+
+
+async def run_plan(session, plan):
+    """Async counterpart of app.run_plan."""
+    try:
+        stmt = next(plan)
+        while True:
+            stmt = plan.send(await session.execute(stmt))
+    except StopIteration as done:
+        return done.value
+
+
+async def cocktail_list(session, path, args, accept):
+    if 'ids' in args:
+        return await run_plan(session, cocktails_by_ids_plan(parse_ids(args['ids']))), {}
+    if wants_ndjson(args, accept):
+        return None
+    fields, after, limit = parse_cocktail_page_args(args)
+    cocktails, page_size, cursor = await run_plan(session, cocktail_page_plan(fields, after, limit))
+    return cocktails, next_page_headers(path, args, cursor, page_size)
+
+
+async def cocktail_detail(session, path, args, accept, id):
+    return await run_plan(session, cocktail_detail_plan(id)), {}
+
+
+async def review_list(session, path, args, accept, cocktail_id):
+    return await run_plan(session, reviews_plan(cocktail_id)), {}
+
+
+# Flask endpoint -> async GET handler returning (body object, headers), or
+# None to leave the request to Flask
+ASYNC_VIEWS = {
+    'cocktaillist': cocktail_list,
+    'cocktailresource': cocktail_detail,
+    'reviewlist': review_list,
+}
+
+
+class Application:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.url_adapter = flask_app.url_map.bind('localhost')
+        self.engine = async_read_engine() if flask_app.config['ASYNC_READS'] else None
+        self.sessions = async_sessionmaker(self.engine) if self.engine is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and self.sessions is not None and await self.handle(scope, send):
+            return
+        await ThreadedWsgiInstance(self.flask_app)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                wsgi_executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def async_view(self, scope, headers):
+        if scope['method'] != 'GET' or b'origin' in headers:
+            return None
+        config = self.flask_app.config
+        if config['SERIALIZER'] != 'msgspec' or config['PROFILING']:
+            return None
+        # The session is not decoded here, so any cookie might belong to a
+        # user whose buffered likes must be flushed before they read
+        like_buffer = self.flask_app.extensions['like_buffer']
+        if like_buffer.enabled and like_buffer.has_pending() and b'cookie' in headers:
+            return None
+        try:
+            endpoint, view_args = self.url_adapter.match(scope['path'], 'GET')
+        except HTTPException:
+            return None
+        view = ASYNC_VIEWS.get(endpoint)
+        return (view, view_args) if view is not None else None
+
+    async def handle(self, scope, send):
+        """Answer the request on the event loop; False leaves it to Flask."""
+        headers = {}
+        for name, value in scope['headers']:
+            name = name.lower()
+            headers[name] = headers[name] + b',' + value if name in headers else value
+        found = self.async_view(scope, headers)
+        if found is None:
+            return False
+        view, view_args = found
+
+        args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        accept = parse_accept_header(headers.get(b'accept', b'').decode('latin-1'), MIMEAccept)
+        try:
+            # The plans shared with app.py read settings from current_app
+            with self.flask_app.app_context():
+                async with self.sessions() as session:
+                    result = await view(session, scope['path'], args, accept, **view_args)
+        except (HTTPException, ValueError):
+            return False  # 404 / 400: Flask renders the error
+        if result is None:
+            return False
+
+        obj, extra_headers = result
+        body = json_encoder.encode(obj)
+        # flask-cors adds nothing to a request without an Origin header
+        response_headers = [(b'content-type', b'application/json')]
+        response_headers += [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                             for name, value in extra_headers.items()]
+        status = 200
+        if self.flask_app.extensions['response_cache'].backend is not None:
+            # The validators ResponseCache gives a freshly stored response
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            response_headers += [(b'etag', f'"{etag}"'.encode()),
+                                 (b'last-modified', http_date(time.time()).encode()),
+                                 (b'cache-control', b'no-cache')]
+            if_none_match = headers.get(b'if-none-match')
+            if if_none_match is not None and parse_etags(if_none_match.decode('latin-1')).contains_weak(etag):
+                status, body = 304, b''
+        if status == 200:
+            response_headers.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return True
+
+
+application = Application(app)
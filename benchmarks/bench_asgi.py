@@ -0,0 +1,163 @@
+"""Sync vs async serving of the read endpoints under high concurrency.
+
+Usage: python benchmarks/bench_asgi.py [--scale N] [--concurrency 64,256,1024]
+           [--duration S] [--processes P]
+
+Seeds a throwaway SQLite database, then serves ``asgi:application`` with
+uvicorn twice:
+
+* sync  - ASYNC_READS=0, so every request runs in the Flask app on the
+  DB_WORKER_THREADS thread pool, as it would under a threaded WSGI server.
+* async - the GET list, detail and reviews endpoints are answered on the
+  event loop through the async engine.
+
+For each concurrency level, P client processes hold that many keep-alive
+connections open between them. Each connection sends list, detail and
+reviews requests back to back for --duration seconds. The table shows
+throughput, latency percentiles and failed requests. The clients share the
+machine with the server, so very high levels partly measure the clients.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {'sync': {'ASYNC_READS': '0'}, 'async': {'ASYNC_READS': '1'}}
+
+
+def request_paths(n_cocktails, rng):
+    while True:
+        # Popular cocktails get most of the traffic, as in bench_load
+        id = min(int(rng.paretovariate(1.2)), n_cocktails)
+        yield f'/api/cocktails?limit=20&after={rng.randrange(n_cocktails)}'
+        yield f'/api/cocktails/{id}'
+        yield f'/api/cocktails/{id}/reviews'
+
+
+async def connection(port, paths, deadline, latencies, failures):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        failures.append('connect')
+        return
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(f'GET {next(paths)} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            head = await reader.readuntil(b'\r\n\r\n')
+            status = int(head.split(b' ', 2)[1])
+            length = 0
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures.append(status)
+    except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+        failures.append(type(e).__name__)
+    finally:
+        writer.close()
+
+
+async def run_connections(port, connections, duration, n_cocktails, seed):
+    rng = random.Random(seed)
+    latencies, failures = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        connection(port, request_paths(n_cocktails, random.Random(rng.random())), deadline, latencies, failures)
+        for _ in range(connections)))
+    return latencies, failures
+
+
+def client_worker(job):
+    return asyncio.run(run_connections(*job))
+
+
+def start_server(mode, env, port):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+         '--log-level', 'warning', '--no-access-log', '--backlog', '4096'],
+        cwd=ROOT, env={**os.environ, **env})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                sys.exit(f'{mode} server exited with status {process.returncode}')
+            time.sleep(0.2)
+    process.kill()
+    sys.exit(f'{mode} server did not start')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e3 if samples else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=5000, help='cocktails (and users) to seed')
+    parser.add_argument('--concurrency', default='64,256,1024', help='comma-separated connection counts')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode and level')
+    parser.add_argument('--processes', type=int, default=4, help='client processes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ['RESPONSE_CACHE'] = 'none'  # measure the endpoints, not the cache
+
+    from app import app
+    from config import db
+    from seed import seed_scaled
+
+    with app.app_context():
+        db.create_all()
+        seed_scaled(args.scale, seed=args.seed)
+
+    print(f'{args.scale} cocktails, {args.duration:g}s per run, {args.processes} client processes\n')
+    print(f'{"mode":<6} {"conns":>6} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"failed":>7}')
+    with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+        for mode, env in MODES.items():
+            port = free_port()
+            server = start_server(mode, env, port)
+            try:
+                for level in levels:
+                    shares = [level // args.processes + (i < level % args.processes)
+                              for i in range(args.processes)]
+                    jobs = [(port, share, args.duration, args.scale, args.seed + i)
+                            for i, share in enumerate(shares) if share]
+                    start = time.perf_counter()
+                    batches = pool.map(client_worker, jobs)
+                    elapsed = time.perf_counter() - start
+                    latencies = sorted(latency for batch, _ in batches for latency in batch)
+                    failed = sum(len(failures) for _, failures in batches)
+                    print(f'{mode:<6} {level:>6} {len(latencies) / elapsed:>9.1f} '
+                          f'{percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f} {failed:>7}')
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
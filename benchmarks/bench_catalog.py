@@ -0,0 +1,74 @@
+"""Time an NDJSON export and re-import of a scaled synthetic catalog.
+
+Usage: python benchmarks/bench_catalog.py [--scale N] [--chunk-size N] [--seed S]
+
+Seeds a throwaway SQLite database with ``seed.py``'s --scale generator and
+exports it to a file with ``flask export-catalog``'s code path. It then
+imports that file into a second, empty database, and imports it again to
+time the idempotent no-op pass. Rows counts users, cocktails, recipe rows,
+reviews and likes. The default scale gives about a million rows. Peak RSS
+is printed so you can check that memory does not grow with the catalog.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=50000, help='cocktails (and users) to seed')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows per export partition / import chunk')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+    source = 'sqlite:///' + os.path.join(tmpdir, 'source.db')
+    os.environ['DATABASE_URL'] = source
+
+    from app import app
+    from config import db
+    from catalog import export_catalog, import_catalog
+    from seed import seed_scaled
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed_scaled(args.scale, seed=args.seed)
+        print(f'Seeded {args.scale} cocktails in {time.perf_counter() - start:.1f}s '
+              f'(peak RSS {peak_rss_mb():.0f} MB)')
+
+        path = os.path.join(tmpdir, 'catalog.ndjson')
+        start = time.perf_counter()
+        with open(path, 'wb') as f:
+            for lines in export_catalog(args.chunk_size):
+                f.write(lines)
+        elapsed = time.perf_counter() - start
+        print(f'export   {elapsed:7.2f}s  {os.path.getsize(path) / 2**20:.0f} MB  '
+              f'(peak RSS {peak_rss_mb():.0f} MB)')
+
+        # Import into an empty database: drop the source's tables and
+        # recreate them, so the same engine and pool settings are measured
+        db.drop_all()
+        db.create_all()
+        for label in ('import', 'reimport'):
+            start = time.perf_counter()
+            with open(path, 'rb') as f:
+                stats = import_catalog(f, args.chunk_size)
+            elapsed = time.perf_counter() - start
+            rows = sum(count for kind, count in stats.items() if kind != 'skipped')
+            print(f'{label:<8} {elapsed:7.2f}s  {rows / elapsed:9.0f} rows/s  {stats}  '
+                  f'(peak RSS {peak_rss_mb():.0f} MB)')
+
+
+if __name__ == '__main__':
+    main()
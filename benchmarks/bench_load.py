@@ -0,0 +1,366 @@
+"""Throughput and latency of every API route on a scaled synthetic catalog.
+
+Usage: python benchmarks/bench_load.py [--scale N] [--requests N]
+           [--driver client|http|both] [--processes P] [--compare RESULTS.json]
+
+Seeds a throwaway SQLite database with ``seed.py``'s --scale generator, then
+drives every route registered with ``api.add_resource`` through two drivers:
+
+* client - the Flask test client, in process and one request at a time, so
+  it measures the handler without any HTTP overhead.
+* http   - P spawned processes sending keep-alive HTTP requests to a
+  threaded local server, so requests overlap as they do in production.
+
+Each route/method reports throughput (excluding untimed setup requests
+such as the login before each logout) and p50/p95/p99 latency. Results are
+written as JSON (default benchmarks/results/load-<commit>.json) and
+--compare prints the change against an earlier file.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BASE_URL = 'https://localhost'  # session cookies are Secure
+LOGIN = {'username': 'seeduser1', 'password': 'password'}  # see seed.SEED_PASSWORD
+SEARCH_TERMS = ['ma', 'mar', 'mo', 'moj', 'gin', 'lime', 'sour', 'fizz', 'rum', 'mint', 'sweet']
+# Routes that run bcrypt get fewer requests, or a run would take minutes
+REQUEST_SHARE = {'signup': 0.1, 'login': 0.1}
+
+
+class Context:
+    """What a scenario needs to build a request against the seeded catalog."""
+
+    def __init__(self, n_cocktails, ingredients, seed):
+        self.n_cocktails = n_cocktails
+        self.ingredients = ingredients
+        self.rng = random.Random(seed)
+
+    def cocktail_id(self):
+        # Popular cocktails get most of the traffic, like the seeded likes
+        return min(int(self.rng.paretovariate(1.2)), self.n_cocktails)
+
+    def unique(self):
+        return f'{os.getpid()}-{self.rng.getrandbits(48):x}'
+
+
+def new_cocktail(ctx):
+    return {'name': f'Bench {ctx.unique()}', 'instructions': 'Stir.', 'image_url': '',
+            'glass_type': 'Coupe',
+            'ingredients': [{'name': name, 'amount': '1 oz'} for name in ctx.rng.sample(ctx.ingredients, 4)]}
+
+
+def delete_scenario(ctx, prepare):
+    created = prepare('POST', '/api/cocktails', new_cocktail(ctx))
+    return 'DELETE', f'/api/cocktails/{created["id"]}', None
+
+
+def logout_scenario(ctx, prepare):
+    prepare('POST', '/api/login', LOGIN)
+    return 'POST', '/api/logout', None
+
+
+# (endpoint, method) -> scenario(ctx, prepare) returning (method, path, json body).
+# ``prepare`` sends an untimed request and returns its JSON.
+SCENARIOS = {
+    ('authstatus', 'GET'): lambda ctx, prepare: ('GET', '/api/auth/status', None),
+    ('signup', 'POST'): lambda ctx, prepare: ('POST', '/api/signup', {
+        'username': f'bench-{ctx.unique()}', 'email': f'{ctx.unique()}@example.com', 'password': 'password'}),
+    ('login', 'POST'): lambda ctx, prepare: ('POST', '/api/login', LOGIN),
+    ('logout', 'POST'): logout_scenario,
+    ('cocktaillist', 'GET'): lambda ctx, prepare: (
+        'GET', f'/api/cocktails?limit=100&after={ctx.rng.randrange(ctx.n_cocktails)}', None),
+    ('cocktaillist', 'POST'): lambda ctx, prepare: ('POST', '/api/cocktails', new_cocktail(ctx)),
+    ('cocktailsearch', 'GET'): lambda ctx, prepare: (
+        'GET', f'/api/cocktails/search?q={ctx.rng.choice(SEARCH_TERMS)}&fields=id,name', None),
+    ('makeablecocktails', 'POST'): lambda ctx, prepare: ('POST', '/api/cocktails/makeable', {
+        'ingredients': ctx.rng.sample(ctx.ingredients, 20), 'max_missing': 1}),
+    ('cocktailresource', 'GET'): lambda ctx, prepare: ('GET', f'/api/cocktails/{ctx.cocktail_id()}', None),
+    ('cocktailresource', 'PATCH'): lambda ctx, prepare: (
+        'PATCH', f'/api/cocktails/{ctx.cocktail_id()}', {'glass_type': ctx.rng.choice(['Coupe', 'Rocks Glass'])}),
+    ('cocktailresource', 'DELETE'): delete_scenario,
+    ('cocktailingredientpatch', 'PATCH'): lambda ctx, prepare: (
+        'PATCH', f'/api/cocktails/{ctx.cocktail_id()}/ingredients',
+        [{'op': 'add', 'path': f'/{ctx.rng.choice(ctx.ingredients)}', 'value': '2 dash'}]),
+    ('likecocktail', 'POST'): lambda ctx, prepare: ('POST', f'/api/cocktails/{ctx.cocktail_id()}/like', None),
+    ('unlikecocktail', 'POST'): lambda ctx, prepare: ('POST', f'/api/cocktails/{ctx.cocktail_id()}/unlike', None),
+    ('similarcocktails', 'GET'): lambda ctx, prepare: (
+        'GET', f'/api/cocktails/{ctx.cocktail_id()}/similar', None),
+    ('trendingcocktails', 'GET'): lambda ctx, prepare: ('GET', '/api/cocktails/trending', None),
+    ('topratedcocktails', 'GET'): lambda ctx, prepare: ('GET', '/api/cocktails/top-rated?limit=50', None),
+    ('reviewlist', 'GET'): lambda ctx, prepare: ('GET', f'/api/cocktails/{ctx.cocktail_id()}/reviews', None),
+    ('reviewlist', 'POST'): lambda ctx, prepare: ('POST', f'/api/cocktails/{ctx.cocktail_id()}/reviews', {
+        'content': 'Benchmarked and enjoyed.', 'rating': ctx.rng.randint(1, 5)}),
+    ('batch', 'POST'): lambda ctx, prepare: ('POST', '/api/batch', {'requests': [
+        {'path': f'/api/cocktails/{ctx.cocktail_id()}'} for _ in range(5)] + [
+        {'path': f'/api/cocktails/{ctx.cocktail_id()}/reviews'} for _ in range(5)]}),
+    ('cachestats', 'GET'): lambda ctx, prepare: ('GET', '/api/cache/stats', None),
+}
+
+# Whole-catalog admin transfers, timed by bench_catalog.py instead
+UNBENCHED = {('catalog', 'GET'), ('catalog', 'POST')}
+
+
+def api_routes(app, api):
+    """(endpoint, method, rule) for every route registered with api.add_resource."""
+    routes = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in api.endpoints:
+            for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+                if (rule.endpoint, method) not in UNBENCHED:
+                    routes.append((rule.endpoint, method, rule.rule))
+    return sorted(routes)
+
+
+class ClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.logged_in = False
+
+    def send(self, method, path, body):
+        response = self.client.open(path, method=method, json=body, base_url=BASE_URL)
+        if path == '/api/login' and response.status_code == 200:
+            self.logged_in = True
+        elif path == '/api/logout':
+            self.logged_in = False
+        return response.status_code, response.get_data()
+
+
+class HttpDriver:
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookie = None
+        self.logged_in = False
+
+    def send(self, method, path, body):
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request(method, path, body=data, headers=headers)
+        response = self.connection.getresponse()
+        payload = response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if path == '/api/login' and response.status == 200:
+            self.logged_in = True
+        elif path == '/api/logout':
+            self.logged_in = False
+        return response.status, payload
+
+
+def run_scenario(driver, ctx, key, count):
+    """Send ``count`` requests for scenario ``key``. Returns a (latency s,
+    status, bytes) sample per request and the time spent on untimed setup
+    requests (logging in, creating a cocktail to delete)."""
+    setup = 0.0
+
+    def prepare(method, path, body):
+        nonlocal setup
+        start = time.perf_counter()
+        status, payload = driver.send(method, path, body)
+        setup += time.perf_counter() - start
+        return json.loads(payload) if payload else None
+
+    scenario = SCENARIOS[key]
+    samples = []
+    for _ in range(count):
+        if not driver.logged_in:
+            prepare('POST', '/api/login', LOGIN)
+        method, path, body = scenario(ctx, prepare)
+        start = time.perf_counter()
+        status, payload = driver.send(method, path, body)
+        samples.append((time.perf_counter() - start, status, len(payload)))
+    return samples, setup
+
+
+_http_driver = None
+
+
+def http_worker(job):
+    """Run in a driver process: one keep-alive connection per process."""
+    global _http_driver
+    host, port, key, count, n_cocktails, ingredients, seed = job
+    if _http_driver is None:
+        _http_driver = HttpDriver(host, port)
+    ctx = Context(n_cocktails, ingredients, seed)
+    return run_scenario(_http_driver, ctx, key, count)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _, _ in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e3
+
+    return {
+        'requests': len(samples),
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+        'mean_bytes': sum(size for _, _, size in samples) / len(samples),
+        'statuses': statuses,
+    }
+
+
+def request_count(endpoint, requests):
+    return max(1, int(requests * REQUEST_SHARE.get(endpoint, 1.0)))
+
+
+def bench_client(app, routes, ctx, requests):
+    driver = ClientDriver(app)
+    results = {}
+    for endpoint, method, rule in routes:
+        start = time.perf_counter()
+        samples, setup = run_scenario(driver, ctx, (endpoint, method), request_count(endpoint, requests))
+        results[f'{method} {rule}'] = summarize(samples, time.perf_counter() - start - setup)
+    return results
+
+
+def bench_http(app, routes, ctx, requests, processes, seed):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    results = {}
+    try:
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            for endpoint, method, rule in routes:
+                count = request_count(endpoint, requests)
+                shares = [count // processes + (i < count % processes) for i in range(processes)]
+                jobs = [(host, port, (endpoint, method), share, ctx.n_cocktails, ctx.ingredients, seed + i)
+                        for i, share in enumerate(shares) if share]
+                start = time.perf_counter()
+                batches = pool.map(http_worker, jobs)
+                elapsed = time.perf_counter() - start
+                # Setup requests ran in parallel too; take out the average share
+                elapsed -= sum(setup for _, setup in batches) / len(batches)
+                samples = [sample for batch, _ in batches for sample in batch]
+                results[f'{method} {rule}'] = summarize(samples, elapsed)
+    finally:
+        server.shutdown()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(driver, results):
+    print(f'\n[{driver}]')
+    print(f'{"route":<48}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}  statuses')
+    for route, stats in results.items():
+        statuses = ' '.join(f'{code}x{count}' for code, count in sorted(stats['statuses'].items()))
+        print(f'{route:<48}{stats["throughput"]:>9.1f}{stats["p50_ms"]:>9.2f}'
+              f'{stats["p95_ms"]:>9.2f}{stats["p99_ms"]:>9.2f}  {statuses}')
+
+
+def print_comparison(current, baseline):
+    print(f'\nCompared with {baseline["meta"].get("commit")} ({baseline["meta"].get("timestamp")})')
+    print(f'{"route":<56}{"req/s":>10}{"p50":>10}{"p99":>10}')
+    for driver, results in current['results'].items():
+        old = baseline['results'].get(driver, {})
+        for route, stats in results.items():
+            before = old.get(route)
+            if not before:
+                continue
+
+            def change(key):
+                return f'{(stats[key] / before[key] - 1) * 100:+.0f}%' if before[key] else 'n/a'
+
+            print(f'{driver + " " + route:<56}{change("throughput"):>10}{change("p50_ms"):>10}{change("p99_ms"):>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=5000, help='cocktails (and users) to seed')
+    parser.add_argument('--requests', type=int, default=300, help='requests per route and driver')
+    parser.add_argument('--driver', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--processes', type=int, default=4, help='HTTP driver processes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='results file (default benchmarks/results/load-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+    baseline = None
+    if args.compare:  # read first: the new results may overwrite the same file
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ.setdefault('RESPONSE_CACHE', 'none')  # measure the endpoints, not the cache
+
+    from app import app, api
+    from config import db
+    from models import Ingredient
+    from seed import seed_scaled
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed_scaled(args.scale, seed=args.seed)
+        print(f'Seeded {args.scale} cocktails in {time.perf_counter() - start:.1f}s')
+        ingredients = list(db.session.scalars(db.select(Ingredient.name).limit(200)))
+
+    routes = api_routes(app, api)
+    missing = [(endpoint, method) for endpoint, method, _ in routes if (endpoint, method) not in SCENARIOS]
+    if missing:
+        sys.exit(f'No benchmark scenario for: {missing}')
+
+    results = {}
+    if args.driver in ('client', 'both'):
+        results['client'] = bench_client(app, routes, Context(args.scale, ingredients, args.seed), args.requests)
+        print_results('client', results['client'])
+    if args.driver in ('http', 'both'):
+        results['http'] = bench_http(app, routes, Context(args.scale, ingredients, args.seed),
+                                     args.requests, args.processes, args.seed)
+        print_results(f'http x{args.processes}', results['http'])
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f'load-{commit or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if baseline is not None:
+        print_comparison(report, baseline)
+
+
+if __name__ == '__main__':
+    main()
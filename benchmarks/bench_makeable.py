@@ -0,0 +1,77 @@
+"""Query cost of the "what can I make" inverted index on a synthetic catalog.
+
+Usage: python benchmarks/bench_makeable.py [--cocktails N] [--ingredients N]
+
+Compares the bitset index with a straightforward scan of every recipe,
+which is what walking Cocktail.ingredients per cocktail amounts to.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from makeable import MakeableIndex  # noqa: E402
+
+
+def synthetic_pairs(n_cocktails, n_ingredients, rng):
+    # Popular ingredients (citrus, syrups, spirits) show up in far more
+    # recipes than obscure ones, so draw them from a skewed distribution.
+    weights = [1 / (rank + 1) for rank in range(n_ingredients)]
+    population = list(range(1, n_ingredients + 1))
+    for cocktail_id in range(1, n_cocktails + 1):
+        for ingredient_id in set(rng.choices(population, weights, k=rng.randint(3, 8))):
+            yield cocktail_id, ingredient_id
+
+
+def scan(recipes, have, max_missing):
+    return {cid: ings - have for cid, ings in recipes.items()
+            if ings & have and len(ings - have) <= max_missing}
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cocktails', type=int, default=100_000)
+    parser.add_argument('--ingredients', type=int, default=5_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    pairs = list(synthetic_pairs(args.cocktails, args.ingredients, rng))
+    index = MakeableIndex()
+    start = time.perf_counter()
+    index.build(pairs)
+    print(f'{args.cocktails} cocktails, {args.ingredients} ingredients, {len(pairs)} recipe rows')
+    print(f'index build: {(time.perf_counter() - start) * 1e3:.1f} ms\n')
+
+    print(f'{"pantry":>6} {"k":>2} {"matches":>8} {"index ms":>10} {"scan ms":>10}')
+    for pantry_size in (5, 20, 50, 200):
+        # Pantries lean towards common ingredients, like real bars
+        have = frozenset(rng.choices(range(1, args.ingredients + 1),
+                                     [1 / (r + 1) for r in range(args.ingredients)], k=pantry_size))
+        for max_missing in (0, 1, 2):
+            index_time, result = best_of(lambda: index.match(have, max_missing), args.repeat)
+            scan_time, expected = best_of(lambda: scan(index.recipes, have, max_missing), args.repeat)
+            assert result == expected
+            print(f'{len(have):>6} {max_missing:>2} {len(result):>8} '
+                  f'{index_time * 1e3:>10.2f} {scan_time * 1e3:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Typeahead latency of /api/cocktails/search over a synthetic catalog.
+
+Usage: python benchmarks/bench_search.py [--cocktails N] [--queries N]
+
+Runs against a throwaway SQLite database, never the instance database.
+Also reports how many responses were too broad to rank and came back in
+catalog order (X-Search-Order: catalog).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'bench.db')
+os.environ['RESPONSE_CACHE'] = 'none'  # measure the endpoint, not the response cache
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import app  # noqa: E402
+from config import db  # noqa: E402
+from models import Cocktail, Ingredient, CocktailIngredient  # noqa: E402
+
+SYLLABLES = ['ma', 'ri', 'ta', 'mo', 'ji', 'to', 'ne', 'gro', 'ni', 'sour', 'fizz', 'lime', 'rum',
+             'gin', 'bit', 'ter', 'sweet', 'ver', 'mouth', 'sy', 'rup', 'mint', 'co', 'la', 'da']
+GLASSES = ['Highball Glass', 'Coupe', 'Rocks Glass', 'Martini Glass', 'Collins Glass', 'Tiki Mug']
+VERBS = ['Shake', 'Stir', 'Build', 'Muddle', 'Blend', 'Strain', 'Garnish', 'Top', 'Float', 'Rinse']
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+
+def populate(n_cocktails, n_ingredients, rng):
+    db.create_all()
+    ingredient_names = list({word(rng).title() + ' ' + word(rng) for _ in range(n_ingredients * 2)})[:n_ingredients]
+    db.session.execute(insert(Ingredient.__table__), [{'name': name} for name in ingredient_names])
+    batch = 5000
+    for start in range(0, n_cocktails, batch):
+        rows = [{
+            'id': start + i + 1,
+            'name': f'{word(rng).title()} {word(rng).title()}',
+            'instructions': ' '.join(f'{rng.choice(VERBS)} with {word(rng)}.' for _ in range(4)),
+            'glass_type': rng.choice(GLASSES),
+        } for i in range(min(batch, n_cocktails - start))]
+        db.session.execute(insert(Cocktail.__table__), rows)
+        recipe = [{'cocktail_id': row['id'], 'ingredient_id': rng.randint(1, n_ingredients), 'amount': '1 oz'}
+                  for row in rows for _ in range(rng.randint(3, 7))]
+        db.session.execute(insert(CocktailIngredient.__table__), recipe)
+        db.session.commit()
+    return ingredient_names
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cocktails', type=int, default=100_000)
+    parser.add_argument('--ingredients', type=int, default=5_000)
+    parser.add_argument('--queries', type=int, default=2_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    with app.app_context():
+        populate(args.cocktails, args.ingredients, rng)
+    print(f'Indexed {args.cocktails} cocktails in {time.perf_counter() - start:.1f}s')
+
+    # Typeahead: each query is a progressively longer prefix of a real word
+    queries = []
+    while len(queries) < args.queries:
+        term = word(rng)
+        queries.extend(term[:n] for n in range(2, len(term) + 1))
+    queries = queries[:args.queries]
+
+    client = app.test_client()
+    latencies = []
+    unranked = 0
+    for q in queries:
+        begin = time.perf_counter()
+        response = client.get('/api/cocktails/search', query_string={'q': q, 'fields': 'id,name'})
+        latencies.append(time.perf_counter() - begin)
+        assert response.status_code == 200, response.data
+        unranked += response.headers['X-Search-Order'] == 'catalog'
+
+    print(f'{len(queries)} typeahead queries, limit {app.config["SEARCH_PAGE_SIZE"]}, '
+          f'{unranked} in catalog order (over {app.config["SEARCH_RANK_WINDOW"]} matches)')
+    for pct in (50, 95, 99):
+        print(f'  p{pct}: {percentile(latencies, pct) * 1e3:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Per-request encode cost of the msgspec and legacy SerializerMixin paths.
+
+Usage: python benchmarks/bench_serialization.py [--cocktails N] [--reviews N] [--repeat N]
+
+Runs against a throwaway SQLite database, never the instance database.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'bench.db')
+os.environ['RESPONSE_CACHE'] = 'none'  # measure the endpoint, not the response cache
+
+from app import app, load_cocktail_detail, load_reviews, COCKTAIL_DETAIL_RULES, REVIEW_RULES  # noqa: E402
+from config import db  # noqa: E402
+from models import User, Cocktail, Ingredient, CocktailIngredient, Review, json_encoder  # noqa: E402
+
+
+def populate(n_cocktails, n_reviews):
+    db.create_all()
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+             for i in range(n_reviews)]
+    ingredients = [Ingredient(name=f'Ingredient {i}') for i in range(20)]
+    db.session.add_all(users + ingredients)
+    for c in range(n_cocktails):
+        cocktail = Cocktail(name=f'Cocktail {c}', instructions='Shake with ice.' * 10,
+                            image_url=f'/static/{c}.jpeg', glass_type='Coupe')
+        db.session.add(cocktail)
+        for i, ingredient in enumerate(ingredients[:8]):
+            db.session.add(CocktailIngredient(cocktail=cocktail, ingredient=ingredient, amount=f'{i} oz'))
+        for user in users:
+            db.session.add(Review(content='Great drink ' * 5, rating=4, user=user, cocktail=cocktail))
+        cocktail.likes.extend(users)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cocktails', type=int, default=20)
+    parser.add_argument('--reviews', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with app.app_context():
+        populate(args.cocktails, args.reviews)
+
+        def legacy_detail():
+            db.session.expire_all()
+            app.json.dumps(db.session.get(Cocktail, 1).to_dict(rules=COCKTAIL_DETAIL_RULES))
+
+        def legacy_reviews():
+            db.session.expire_all()
+            app.json.dumps([r.to_dict(rules=REVIEW_RULES) for r in Review.query.filter_by(cocktail_id=1)])
+
+        cases = [
+            ('detail  encode', legacy_detail, lambda: json_encoder.encode(load_cocktail_detail(1))),
+            ('reviews encode', legacy_reviews, lambda: json_encoder.encode(load_reviews(1))),
+        ]
+        results = []
+        for name, legacy, fast in cases:
+            results.append((name, timed(legacy, args.repeat), timed(fast, args.repeat)))
+
+    client = app.test_client()
+    for path in ('/api/cocktails', '/api/cocktails/1', '/api/cocktails/1/reviews'):
+        per_mode = []
+        for mode in ('legacy', 'msgspec'):
+            app.config['SERIALIZER'] = mode
+            per_mode.append(timed(lambda: client.get(path), args.repeat))
+        results.append((f'GET {path}', *per_mode))
+
+    print(f'{args.cocktails} cocktails, {args.reviews} reviews/likes per cocktail, best of {args.repeat}')
+    print(f'{"case":<32}{"legacy ms":>12}{"msgspec ms":>12}{"speedup":>10}')
+    for name, legacy, fast in results:
+        print(f'{name:<32}{legacy * 1e3:>12.3f}{fast * 1e3:>12.3f}{legacy / fast:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Session load/save latency per session backend.
+
+Usage: python benchmarks/bench_sessions.py [--requests N] [--redis-url URL]
+
+Times opening a session from a request's cookie and saving a modified one
+for the signed-cookie, sqlalchemy and redis backends, with Flask-Session's
+filesystem store (the previous default) for comparison. Without --redis-url
+the redis backend talks to a small in-process stand-in server, which shows
+protocol and round-trip overhead but not a real server's performance.
+Also times sweeping a backlog of expired rows from the sessions table.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'bench.db')
+
+from flask import Response  # noqa: E402
+from flask.sessions import SecureCookieSessionInterface  # noqa: E402
+from flask_session.filesystem import FileSystemSessionInterface  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import app  # noqa: E402
+from config import db  # noqa: E402
+from models import sessions  # noqa: E402
+from sessions import SqlSessionInterface, RedisSessionInterface, RespClient, utcnow  # noqa: E402
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """In-memory server for the GET/SET/DEL/PING subset of the Redis protocol."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        store, lock = self.server.data, self.server.lock
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            with lock:
+                if command == b'GET':
+                    value, expires = store.get(args[1], (None, None))
+                    if value is None or (expires and expires < time.monotonic()):
+                        reply = b'$-1\r\n'
+                    else:
+                        reply = b'$%d\r\n%s\r\n' % (len(value), value)
+                elif command == b'SET':
+                    ttl = int(args[4]) if len(args) > 4 and args[3].upper() == b'EX' else None
+                    store[args[1]] = (args[2], time.monotonic() + ttl if ttl else None)
+                    reply = b'+OK\r\n'
+                elif command == b'DEL':
+                    reply = b':%d\r\n' % sum(store.pop(key, None) is not None for key in args[1:])
+                elif command == b'PING':
+                    reply = b'+PONG\r\n'
+                else:
+                    reply = b'-ERR unknown command\r\n'
+            self.wfile.write(reply)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6 for p in (50, 99)}
+
+
+def bench_backend(interface, n):
+    """Return (load, save) latency samples for ``interface``."""
+    app.session_interface = interface
+    cookie_name = app.config['SESSION_COOKIE_NAME']
+
+    # Log in once to get a cookie for the stored session
+    with app.test_request_context('/api/login', method='POST') as ctx:
+        session = interface.open_session(app, ctx.request)
+        session['user_id'] = 1
+        response = Response()
+        interface.save_session(app, session, response)
+    cookie = response.headers['Set-Cookie'].split(';', 1)[0].split('=', 1)[1]
+
+    loads, saves = [], []
+    for _ in range(n):
+        with app.test_request_context('/api/auth/status', headers={'Cookie': f'{cookie_name}={cookie}'}) as ctx:
+            start = time.perf_counter()
+            session = interface.open_session(app, ctx.request)
+            loads.append(time.perf_counter() - start)
+            assert session.get('user_id') == 1
+            session['user_id'] = 1  # mark modified so the save really writes
+            session.modified = True
+            start = time.perf_counter()
+            interface.save_session(app, session, Response())
+            saves.append(time.perf_counter() - start)
+    return loads, saves
+
+
+def bench_sweep(interface, rows):
+    expired = utcnow() - timedelta(days=1)
+    with db.engine.begin() as connection:
+        connection.execute(insert(sessions), [
+            {'session_id': f'session:expired-{i}', 'data': b'\x80', 'expiry': expired}
+            for i in range(rows)
+        ])
+    start = time.perf_counter()
+    deleted = interface._delete_expired_sessions()
+    return deleted, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--redis-url', help='benchmark a real server instead of the stand-in')
+    parser.add_argument('--sweep-rows', type=int, default=50_000)
+    args = parser.parse_args()
+
+    if args.redis_url:
+        redis_client = RespClient.from_url(args.redis_url)
+    else:
+        server = RespStandIn()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        redis_client = RespClient(*server.server_address)
+
+    with app.app_context():
+        db.create_all()
+        options = dict(use_signer=True, permanent=False)
+        backends = [
+            ('cookie', SecureCookieSessionInterface()),
+            ('filesystem', FileSystemSessionInterface(
+                app, cache_dir=os.path.join(_tmpdir, 'flask_session'), **options)),
+            ('sqlalchemy', SqlSessionInterface(app, cleanup_n_requests=0, **options)),
+            ('redis' if args.redis_url else 'redis (stand-in)',
+             RedisSessionInterface(app, redis_client, **options)),
+        ]
+
+        print(f'{args.requests} requests per backend, latency in microseconds\n')
+        print(f'{"backend":<18} {"load p50":>9} {"load p99":>9} {"save p50":>9} {"save p99":>9}')
+        for name, interface in backends:
+            loads, saves = bench_backend(interface, args.requests)
+            load, save = percentiles(loads), percentiles(saves)
+            print(f'{name:<18} {load[50]:>9.1f} {load[99]:>9.1f} {save[50]:>9.1f} {save[99]:>9.1f}')
+
+        sql_interface = backends[2][1]
+        deleted, elapsed = bench_sweep(sql_interface, args.sweep_rows)
+        print(f'\nsweep: {deleted} expired sessions deleted in {elapsed * 1e3:.1f} ms '
+              f'({sql_interface.sweep_batch} per transaction)')
+
+
+if __name__ == '__main__':
+    main()
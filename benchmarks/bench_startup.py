@@ -0,0 +1,92 @@
+"""Worker startup time: imports, app creation and time to first response.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--scale N]
+
+Seeds a throwaway SQLite database once, then starts N fresh interpreters, as
+a pre-fork server does for every worker it spawns or scales out to. Each
+interpreter times:
+
+* import   - ``import app``: the module and everything it imports
+* create   - ``create_app()``: config, extensions, routes, static manifest
+* first    - the first request to each hot read endpoint, with whatever is
+  still set up lazily (database connections, compiled statements)
+* warm     - the same requests again, for comparison
+
+``total`` is the wall time from spawning the interpreter to the end of its
+first requests, interpreter startup included. Medians and minimums across
+runs are printed in milliseconds. Run with WARM_UP=0 to see what the
+warm-up in create_app() saves the first requests.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATHS = ['/api/cocktails?limit=20', '/api/cocktails/1', '/api/cocktails/1/reviews', '/api/auth/status']
+
+
+def child():
+    """Runs in each fresh interpreter; prints its timings as JSON."""
+    timings = {}
+    start = time.perf_counter()
+    import app as app_module
+    timings['import'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = app_module.create_app()
+    timings['create'] = time.perf_counter() - start
+
+    client = app.test_client()
+    for phase in ('first', 'warm'):
+        for path in PATHS:
+            start = time.perf_counter()
+            response = client.get(path)
+            timings[f'{phase} {path}'] = time.perf_counter() - start
+            if response.status_code != 200:
+                sys.exit(f'{path} answered {response.status_code}')
+        if phase == 'first':
+            ready = time.time()
+    print(json.dumps({'ready': ready, 'timings': timings}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters to time')
+    parser.add_argument('--scale', type=int, default=1000, help='cocktails (and users) to seed')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    tmpdir = tempfile.mkdtemp(prefix='cocktail-bench-')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+               RESPONSE_CACHE='none', PYTHONPATH=ROOT)
+    seed = ('from app import create_app; from config import db; from seed import seed_scaled\n'
+            'with create_app().app_context():\n'
+            f'    db.create_all(); seed_scaled({args.scale})\n')
+    subprocess.run([sys.executable, '-c', seed], env=env, cwd=ROOT, check=True, capture_output=True)
+
+    runs = []
+    for _ in range(args.runs):
+        spawned = time.time()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                                env=env, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        result['timings']['total'] = result['ready'] - spawned
+        runs.append(result['timings'])
+
+    print(f'{"phase":<38}{"median ms":>10}{"min ms":>10}')
+    for phase in runs[0]:
+        samples = [run[phase] * 1000 for run in runs]
+        print(f'{phase:<38}{statistics.median(samples):10.1f}{min(samples):10.1f}')
+
+
+if __name__ == '__main__':
+    main()
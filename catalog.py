@@ -0,0 +1,237 @@
+"""Streaming NDJSON export and import of the whole catalog.
+
+One JSON object per line. Users come first, so later lines can refer to them
+by username:
+
+    {"type": "user", "username": "ann", "email": "ann@example.com"}
+    {"type": "cocktail", "name": "Mojito", "instructions": "...",
+     "image_url": "/static/mojito.jpeg", "glass_type": "Highball",
+     "ingredients": [{"name": "White Rum", "amount": "2 oz"}, "1 oz Lime Juice"],
+     "reviews": [{"user": "ann", "rating": 5, "content": "..."}],
+     "likes": ["ann"]}
+
+Ingredients may be written as seed.py-style strings ("<amount> <name>").
+Password hashes are never exported, so imported users must reset their
+password before they can log in.
+
+Both directions run in constant memory. Export reads cocktails ``yield_per``
+rows at a time and fetches each partition's ingredients, reviews and likes
+with one IN query apiece. Import reads ``chunk_size`` lines at a time and
+writes each chunk with multi-row inserts. The whole import is one
+transaction: a bad line rolls back everything imported before it.
+
+Import is idempotent by name. Users whose username or email exists are
+skipped, and so are cocktails whose name exists (in the database or earlier
+in the file), along with their ingredients, reviews and likes. Reviews and
+likes by unknown users are dropped.
+"""
+from contextlib import ExitStack
+from itertools import islice
+
+import msgspec
+from sqlalchemy import select, insert
+
+from config import db
+from models import (User, Cocktail, Ingredient, CocktailIngredient, Review, likes,
+                    insert_ignore, add_cocktail_ingredients, parse_ingredient, json_encoder)
+from search import search_index_rebuilt
+
+COCKTAIL_FIELDS = ('name', 'instructions', 'image_url', 'glass_type')
+
+
+def grouped(rows):
+    """{first column: [rest of the row, ...]} for rows sorted by it."""
+    groups = {}
+    for key, *rest in rows:
+        groups.setdefault(key, []).append(rest)
+    return groups
+
+
+def export_catalog(chunk_size=1000):
+    """Yield the catalog as NDJSON lines (bytes, newline included)."""
+    users = db.session.execute(select(User.username, User.email).order_by(User.id)
+                               .execution_options(yield_per=chunk_size))
+    for partition in users.partitions():
+        yield b''.join(json_encoder.encode({'type': 'user', 'username': username, 'email': email}) + b'\n'
+                       for username, email in partition)
+
+    cocktails = db.session.execute(select(Cocktail.id, *(getattr(Cocktail, field) for field in COCKTAIL_FIELDS))
+                                   .order_by(Cocktail.id)
+                                   .execution_options(yield_per=chunk_size))
+    connection = db.session.connection()
+    for partition in cocktails.partitions():
+        ids = [row.id for row in partition]
+        ingredients = grouped(connection.execute(
+            select(CocktailIngredient.cocktail_id, Ingredient.name, CocktailIngredient.amount)
+            .join(CocktailIngredient.ingredient)
+            .where(CocktailIngredient.cocktail_id.in_(ids))
+            .order_by(CocktailIngredient.cocktail_id, CocktailIngredient.id)))
+        reviews = grouped(connection.execute(
+            select(Review.cocktail_id, User.username, Review.rating, Review.content)
+            .join(User, User.id == Review.user_id)
+            .where(Review.cocktail_id.in_(ids))
+            .order_by(Review.cocktail_id, Review.id)))
+        liked = grouped(connection.execute(
+            select(likes.c.cocktail_id, User.username)
+            .join(User, User.id == likes.c.user_id)
+            .where(likes.c.cocktail_id.in_(ids))
+            .order_by(likes.c.cocktail_id, User.id)))
+        lines = []
+        for row in partition:
+            record = {'type': 'cocktail', **{field: getattr(row, field) for field in COCKTAIL_FIELDS}}
+            record['ingredients'] = [{'name': name, 'amount': amount}
+                                     for name, amount in ingredients.get(row.id, ())]
+            record['reviews'] = [{'user': username, 'rating': rating, 'content': content}
+                                 for username, rating, content in reviews.get(row.id, ())]
+            record['likes'] = [username for username, in liked.get(row.id, ())]
+            lines.append(json_encoder.encode(record) + b'\n')
+        yield b''.join(lines)
+
+
+def read_records(lines):
+    """(line number, decoded object) for each non-blank line."""
+    decoder = msgspec.json.Decoder(dict)
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = decoder.decode(line)
+        except msgspec.ValidationError:
+            raise ValueError(f'line {lineno}: expected a JSON object')
+        except msgspec.DecodeError as e:
+            raise ValueError(f'line {lineno}: {e}')
+        if record.get('type') not in ('user', 'cocktail'):
+            raise ValueError(f'line {lineno}: type must be "user" or "cocktail"')
+        yield lineno, record
+
+
+def import_catalog(lines, chunk_size=1000):
+    """Load NDJSON ``lines`` (str or bytes) into the database and commit.
+
+    Returns counts of what was inserted, plus ``skipped`` users and
+    cocktails that already existed. Raises ValueError, with nothing
+    written, if a line is malformed.
+    """
+    stats = dict.fromkeys(('users', 'cocktails', 'ingredients', 'reviews', 'likes', 'skipped'), 0)
+    records = read_records(lines)
+    try:
+        with ExitStack() as bulk_load:
+            loading = False
+
+            def start_bulk_load():
+                # Rebuilding the search index once beats a trigger per
+                # recipe row, but is wasted on a file of known cocktails
+                nonlocal loading
+                if not loading:
+                    bulk_load.enter_context(search_index_rebuilt(db.session.connection()))
+                    loading = True
+
+            while chunk := list(islice(records, chunk_size)):
+                import_users([(lineno, record) for lineno, record in chunk if record['type'] == 'user'], stats)
+                import_cocktails([(lineno, record) for lineno, record in chunk if record['type'] == 'cocktail'],
+                                 stats, start_bulk_load)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return stats
+
+
+def required(lineno, record, field):
+    value = record.get(field)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f'line {lineno}: {field} is required')
+    return value
+
+
+def import_users(chunk, stats):
+    rows = {}
+    for lineno, record in chunk:
+        username = required(lineno, record, 'username')
+        email = required(lineno, record, 'email')
+        if '@' not in email:
+            raise ValueError(f'line {lineno}: invalid email address')
+        rows.setdefault(username, {'username': username, 'email': email})
+    if rows:
+        # No conflict target: a clash on either unique column skips the row
+        inserted = db.session.execute(insert_ignore(User.__table__, None), list(rows.values())).rowcount
+        stats['users'] += inserted
+        stats['skipped'] += len(chunk) - inserted
+
+
+def recipe_items(lineno, record):
+    """The record's ingredients as (name, amount) pairs."""
+    items = []
+    for entry in record.get('ingredients') or ():
+        if isinstance(entry, str):
+            items.append(parse_ingredient(entry))
+        elif isinstance(entry, dict) and isinstance(entry.get('name'), str) and entry['name']:
+            items.append((entry['name'], entry.get('amount') or ''))
+        else:
+            raise ValueError(f'line {lineno}: ingredients must be strings or objects with a name')
+    return items
+
+
+def import_cocktails(chunk, stats, before_insert):
+    if not chunk:
+        return
+    names = {required(lineno, record, 'name') for lineno, record in chunk}
+    existing = set(db.session.scalars(select(Cocktail.name).where(Cocktail.name.in_(names))))
+    new = []
+    for lineno, record in chunk:
+        if record['name'] in existing:
+            stats['skipped'] += 1
+        else:
+            existing.add(record['name'])
+            new.append((lineno, record))
+    if not new:
+        return
+
+    usernames = {username for _, record in new for username in record.get('likes') or ()}
+    usernames.update(review.get('user') for _, record in new for review in record.get('reviews') or ()
+                     if isinstance(review, dict))
+    usernames.discard(None)
+    user_ids = dict(db.session.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
+
+    cocktails, recipes, reviews, liked = [], [], [], []
+    for lineno, record in new:
+        row = {field: record.get(field) for field in COCKTAIL_FIELDS}
+        row['instructions'] = required(lineno, record, 'instructions')
+        recipes.append(recipe_items(lineno, record))
+        cocktail_reviews = []
+        for review in record.get('reviews') or ():
+            rating = review.get('rating') if isinstance(review, dict) else None
+            if type(rating) is not int or not 1 <= rating <= 5:
+                raise ValueError(f'line {lineno}: reviews need a rating between 1 and 5')
+            if review.get('user') in user_ids:
+                cocktail_reviews.append({'user_id': user_ids[review['user']], 'rating': rating,
+                                         'content': review.get('content') or ''})
+        cocktail_likes = {user_ids[username] for username in record.get('likes') or () if username in user_ids}
+        reviews.append(cocktail_reviews)
+        liked.append(cocktail_likes)
+        row.update(like_count=len(cocktail_likes), review_count=len(cocktail_reviews),
+                   rating_sum=sum(review['rating'] for review in cocktail_reviews))
+        cocktails.append(row)
+
+    before_insert()
+    # Names are new and distinct, so they map the rows back to their ids.
+    # (An ordered INSERT ... RETURNING runs one statement per row on SQLite.)
+    db.session.execute(insert(Cocktail.__table__), cocktails)
+    ids_by_name = dict(db.session.execute(select(Cocktail.name, Cocktail.id)
+                                          .where(Cocktail.name.in_([row['name'] for row in cocktails]))).all())
+    ids = [ids_by_name[row['name']] for row in cocktails]
+    add_cocktail_ingredients((cocktail_id, name, amount)
+                             for cocktail_id, items in zip(ids, recipes) for name, amount in items)
+    review_rows = [{**review, 'cocktail_id': cocktail_id}
+                   for cocktail_id, cocktail_reviews in zip(ids, reviews) for review in cocktail_reviews]
+    if review_rows:
+        db.session.execute(insert(Review.__table__), review_rows)
+    like_rows = [{'user_id': user_id, 'cocktail_id': cocktail_id}
+                 for cocktail_id, liked_by in zip(ids, liked) for user_id in liked_by]
+    if like_rows:
+        db.session.execute(insert(likes), like_rows)
+
+    stats['cocktails'] += len(ids)
+    stats['ingredients'] += sum(len(items) for items in recipes)
+    stats['reviews'] += len(review_rows)
+    stats['likes'] += len(like_rows)
@@ -1,29 +1,148 @@
 import os
-from flask import Flask
-from flask_cors import CORS
-from flask_migrate import Migrate
-from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
-from flask_bcrypt import Bcrypt  # Import bcrypt
+from engines import RoutingSession, configure_engines
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.json.compact = False
+# Fallback for development; public, so it must never sign cookie sessions
+DEV_SECRET_KEY = 'your-secret-key'
 
-# Set a secret key for session management
-app.secret_key = os.environ.get('SECRET_KEY') or 'your-secret-key'
+def configure(app):
+    """Load the settings into ``app.config``; most can be overridden from the
+    environment."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Engine tuning (see engines.py). DB_PROFILE ('sqlite' or 'postgres') defaults
+    # to the database URL's dialect; pools are sized to the request threads each
+    # worker process runs
+    app.config['DB_PROFILE'] = os.environ.get('DB_PROFILE')
+    app.config['DB_WORKER_THREADS'] = int(os.environ.get('DB_WORKER_THREADS', 8))
+    app.config['SQLITE_PRAGMAS'] = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # durable at checkpoints rather than every commit, safe with WAL
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # in KiB
+        'busy_timeout': 5000,  # ms
+    }
+    # Route GET/HEAD queries to a separate read-only engine; SQLite reopens the
+    # same file read-only, other databases need DATABASE_READ_URL
+    app.config['DB_READ_ENGINE'] = os.environ.get('DB_READ_ENGINE') == '1'
+    app.config['DATABASE_READ_URL'] = os.environ.get('DATABASE_READ_URL')
+    # ASGI entry point (asgi.py): serve the hot GET endpoints from the event loop
+    # over an async engine with this many connections per process
+    app.config['ASYNC_READS'] = os.environ.get('ASYNC_READS', '1') == '1'
+    app.config['ASYNC_DB_CONNECTIONS'] = int(os.environ.get('ASYNC_DB_CONNECTIONS', 16))
+    configure_engines(app)
+    app.json.compact = False
+
+    # 'msgspec' encodes hot read endpoints from row tuples; 'legacy' falls back
+    # to SerializerMixin.to_dict
+    app.config['SERIALIZER'] = os.environ.get('SERIALIZER', 'msgspec')
+
+    # Keyset pagination for GET /api/cocktails
+    app.config['COCKTAILS_PAGE_SIZE'] = 100
+    app.config['COCKTAILS_MAX_PAGE_SIZE'] = 1000
+    app.config['COCKTAILS_STREAM_CHUNK'] = 500
+    # Cocktails per GET /api/cocktails?ids=..., and sub-requests per POST /api/batch
+    app.config['BATCH_MAX_ITEMS'] = 100
+    app.config['SEARCH_PAGE_SIZE'] = 20
+    # Queries matching more cocktails than this are paged in catalog order, not
+    # ranked, and answered with X-Search-Order: catalog (see search.py)
+    app.config['SEARCH_RANK_WINDOW'] = 1000
+
+    # "What can I make" index: rebuilt from the database after this many seconds
+    # so writes made by other worker processes are picked up
+    app.config['MAKEABLE_INDEX_MAX_AGE'] = 300
+    app.config['MAKEABLE_PAGE_SIZE'] = 50
+
+    # "Users who liked this also liked" index (see similar.py): neighbours kept
+    # per cocktail, users with more likes than this left out of the counts, and
+    # seconds before a background rebuild picks up other workers' likes
+    app.config['SIMILAR_TOP_K'] = 20
+    app.config['SIMILAR_MAX_USER_LIKES'] = 500
+    app.config['SIMILAR_INDEX_MAX_AGE'] = 600
+
+    # Trending and top-rated leaderboards (see leaderboards.py): seconds for a
+    # like's weight in trending to halve, reviews' worth of the mean rating that
+    # top-rated blends into each cocktail's average, and an optional snapshot
+    # file so a restart skips the rebuild when the snapshot is recent enough
+    app.config['TRENDING_HALF_LIFE'] = 24 * 3600
+    app.config['TOP_RATED_PRIOR_REVIEWS'] = 5
+    app.config['LEADERBOARD_SNAPSHOT'] = os.environ.get('LEADERBOARD_SNAPSHOT')
+    app.config['LEADERBOARD_SNAPSHOT_MAX_AGE'] = 3600
+    app.config['LEADERBOARD_PAGE_SIZE'] = 20
+
+    # Response cache for the read endpoints: 'lru' keeps entries in this process,
+    # 'filesystem' shares them (and their invalidations) between worker processes,
+    # 'none' turns caching off. Entries expire after RESPONSE_CACHE_TIMEOUT
+    # seconds, which bounds how stale an 'lru' worker can be after another
+    # worker's write
+    app.config['RESPONSE_CACHE'] = os.environ.get('RESPONSE_CACHE', 'lru')
+    app.config['RESPONSE_CACHE_SIZE'] = 1024
+    app.config['RESPONSE_CACHE_TIMEOUT'] = 300
+    app.config['RESPONSE_CACHE_DIR'] = os.environ.get('RESPONSE_CACHE_DIR', 'response_cache')
+
+    # Write-behind likes (see like_buffer.py): like/unlike are acknowledged at
+    # once and written in batches every LIKES_FLUSH_INTERVAL seconds, or sooner
+    # once LIKES_FLUSH_SIZE toggles are waiting
+    app.config['LIKES_WRITE_BEHIND'] = os.environ.get('LIKES_WRITE_BEHIND') == '1'
+    app.config['LIKES_FLUSH_INTERVAL'] = 0.5
+    app.config['LIKES_FLUSH_SIZE'] = 500
+
+    # Password hashing runs in a process pool (see passwords.py); requests beyond
+    # workers + max pending get a 503 instead of queueing
+    app.config['BCRYPT_LOG_ROUNDS'] = 12
+    app.config['BCRYPT_WORKERS'] = int(os.environ.get('BCRYPT_WORKERS', 2))
+    app.config['BCRYPT_MAX_PENDING'] = 16
+    # Failed logins allowed per username / client IP within the window (seconds)
+    app.config['LOGIN_MAX_FAILURES_PER_USER'] = 5
+    app.config['LOGIN_MAX_FAILURES_PER_IP'] = 20
+    app.config['LOGIN_FAILURE_WINDOW'] = 900
+
+    # Per-request profiling and /metrics (see profiling.py); off unless PROFILING=1
+    app.config['PROFILING'] = os.environ.get('PROFILING') == '1'
+    app.config['PROFILING_TOKEN'] = os.environ.get('PROFILING_TOKEN')  # X-Profile value that triggers cProfile
+    app.config['PROFILING_SAMPLE_RATE'] = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+    app.config['PROFILING_DIR'] = os.environ.get('PROFILING_DIR', 'profiles')
+
+    # Run the hot read queries once at startup, so the first requests don't
+    # pay for compiling them (see warm_up in app.py)
+    app.config['WARM_UP'] = os.environ.get('WARM_UP', '1') == '1'
+
+    # Admin endpoints (the /api/catalog import/export, see catalog.py) answer
+    # requests carrying X-Admin-Token: <ADMIN_TOKEN>; with no token set they are off
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+    app.config['CATALOG_CHUNK_SIZE'] = 1000
+
+    # Configure sessions: 'sqlalchemy', 'redis' or 'cookie' (see sessions.py).
+    # 'cookie' needs SECRET_KEY set: its cookies are the session itself
+    app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'sqlalchemy')
+    app.config['SESSION_REDIS_URL'] = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['SESSION_SWEEP_BATCH'] = 1000
+    # Sweep expired rows of the sessions table on average every N requests
+    app.config['SESSION_CLEANUP_N_REQUESTS'] = 1000
+    app.config['SESSION_PERMANENT'] = False
+    app.config['SESSION_USE_SIGNER'] = True
+    app.config['SESSION_COOKIE_SECURE'] = True  # Use only with HTTPS
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+    # Set a secret key for session management
+    app.secret_key = os.environ.get('SECRET_KEY') or DEV_SECRET_KEY
 
 metadata = MetaData(naming_convention={
+    "ix": "ix_%(column_0_label)s",
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
 })
-db = SQLAlchemy(metadata=metadata)
-migrate = Migrate(app, db)
-db.init_app(app)
-
-bcrypt = Bcrypt(app)  # Initialize bcrypt
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
 
-api = Api(app)
+def include_object(object, name, type_, reflected, compare_to):
+    # The full-text search tables (and FTS5's shadow tables) are created by
+    # hand-written DDL, so keep autogenerate from trying to drop them.
+    return not (type_ == 'table' and compare_to is None and name.startswith('cocktail_search'))
 
-CORS(app)
+def init_migrate(app):
+    # Flask-Migrate pulls in alembic, which only the `flask db` commands
+    # need, so web workers and scripts skip it (see create_app)
+    from flask_migrate import Migrate
+    Migrate(app, db, include_object=include_object)
@@ -0,0 +1,139 @@
+"""Database engine tuning: per-deployment pool profiles, SQLite pragmas and
+an optional read-only engine for the GET handlers.
+
+DB_PROFILE picks the engine options ('sqlite' or 'postgres', by default
+whichever matches the database URL). Pools keep one connection per request
+thread (DB_WORKER_THREADS) and may open as many again: a request can hold
+two at once, since the session store (sessions.py) runs on a connection of
+its own while ``db.session`` keeps one checked out until teardown.
+
+SQLite connections get SQLITE_PRAGMAS when they are opened. WAL lets
+readers run alongside the single writer, and busy_timeout makes a writer
+wait for the lock instead of failing with "database is locked".
+
+With DB_READ_ENGINE=1, GET and HEAD requests run their ORM queries through
+a second engine (the 'reader' bind). For SQLite it opens the same file with
+mode=ro, so a stray write from a read handler fails loudly. Elsewhere it
+connects to DATABASE_READ_URL (e.g. a replica). Everything else, including
+flushes and the session store, stays on the writer.
+"""
+from flask import request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_METHODS = frozenset(('GET', 'HEAD'))
+
+# Pragmas that persist in the database file or need write access, skipped on
+# the read-only engine
+WRITER_PRAGMAS = frozenset(('journal_mode',))
+
+
+def database_profile(uri):
+    """Default DB_PROFILE for a database URL."""
+    backend = make_url(uri).get_backend_name()
+    return {'sqlite': 'sqlite', 'postgresql': 'postgres'}.get(backend)
+
+
+def is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(profile, threads):
+    """SQLAlchemy engine options for a deployment profile, with the pool
+    sized for ``threads`` request threads per process."""
+    if profile == 'sqlite':
+        # SQLite serializes writers on the file lock, so connections past two
+        # per thread (see above) would only queue there instead of in the pool
+        return {'pool_size': threads, 'max_overflow': threads, 'pool_timeout': 30}
+    if profile == 'postgres':
+        return {
+            'pool_size': threads,
+            # A second connection per thread, opened only when needed
+            'max_overflow': threads,
+            'pool_timeout': 10,
+            # Reuse the most recently returned connection, so idle ones age
+            # out server-side instead of all being kept warm
+            'pool_use_lifo': True,
+            'pool_pre_ping': True,
+            # Below common proxy/load balancer idle timeouts
+            'pool_recycle': 1800,
+        }
+    if profile is None:
+        return {}
+    raise ValueError(f'Unknown DB_PROFILE {profile!r}')
+
+
+def read_only_url(uri):
+    """The SQLite database at ``uri`` opened read-only."""
+    url = make_url(uri)
+    # Relative paths stay relative: Flask-SQLAlchemy resolves file: URIs
+    # against the instance folder just like plain paths
+    return url.set(database=f'file:{url.database}', query={'mode': 'ro', 'uri': 'true'}).render_as_string()
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas.items()]
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+class RoutingSession(Session):
+    """Sends queries to the 'reader' bind while ``info['read_only']`` is set,
+    except during a flush, which always goes to the writer."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only') and not self._flushing:
+            return self._db.engines['reader']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def configure_engines(app):
+    """Fill in SQLALCHEMY_ENGINE_OPTIONS and the reader bind from the DB_*
+    settings; call before ``db.init_app``."""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    profile = app.config['DB_PROFILE'] or database_profile(uri)
+    options = {} if is_memory_sqlite(uri) else engine_options(profile, app.config['DB_WORKER_THREADS'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    if app.config['DB_READ_ENGINE']:
+        read_url = app.config['DATABASE_READ_URL']
+        if read_url is None:
+            if profile != 'sqlite' or is_memory_sqlite(uri):
+                raise ValueError('DB_READ_ENGINE needs DATABASE_READ_URL for this database')
+            read_url = read_only_url(uri)
+        app.config.setdefault('SQLALCHEMY_BINDS', {})['reader'] = {'url': read_url, **options}
+
+
+def init_engines(app, db):
+    """Register the pragma hooks and read routing; call after ``db.init_app``."""
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            if key == 'reader':
+                set_sqlite_pragmas(engine, {name: value for name, value in pragmas.items()
+                                            if name not in WRITER_PRAGMAS})
+            else:
+                set_sqlite_pragmas(engine, pragmas)
+        routed = 'reader' in db.engines
+
+    if routed:
+        @app.before_request
+        def route_reads():
+            db.session.info['read_only'] = request.method in READ_METHODS
+
+        @app.teardown_request
+        def end_read_routing(exc):
+            # The session outlives the request when an app context was
+            # already pushed (CLI commands, scripts driving the test client)
+            db.session.info.pop('read_only', None)
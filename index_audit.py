@@ -0,0 +1,143 @@
+"""Report foreign key columns and query lookup targets that lack an index.
+
+A column counts as indexed when it is the leading column of the primary key,
+a unique constraint or an index. Lookup targets are collected from the
+source files by looking for ``Model.query.filter_by(column=...)`` calls and
+``Model.column == ...`` / ``table.c.column == ...`` comparisons inside
+``filter()`` and ``where()``.
+
+Usage: python index_audit.py [source.py ...]
+"""
+import ast
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = ('app.py', 'seed.py')
+
+
+def leading_columns(table):
+    """Names of columns that can be looked up through an index on ``table``."""
+    leading = set()
+    pk = list(table.primary_key.columns)
+    if pk:
+        leading.add(pk[0].name)
+    for constraint in table.constraints:
+        if isinstance(constraint, type(table.primary_key)):
+            continue
+        columns = list(getattr(constraint, 'columns', []))
+        if columns and constraint.__visit_name__ == 'unique_constraint':
+            leading.add(columns[0].name)
+    for index in table.indexes:
+        columns = list(index.columns)
+        if columns:
+            leading.add(columns[0].name)
+    for column in table.columns:
+        if column.unique or column.index:
+            leading.add(column.name)
+    return leading
+
+
+def unindexed_foreign_keys(metadata):
+    findings = []
+    for table in metadata.sorted_tables:
+        indexed = leading_columns(table)
+        for fk in table.foreign_keys:
+            if fk.parent.name not in indexed:
+                findings.append((table.name, fk.parent.name, f'foreign key to {fk.target_fullname}'))
+    return findings
+
+
+class LookupCollector(ast.NodeVisitor):
+    """Collects (table-or-model name, column, lineno) lookup targets."""
+
+    def __init__(self):
+        self.lookups = []
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            if func.attr == 'filter_by':
+                model = self._query_model(func.value)
+                if model:
+                    for keyword in node.keywords:
+                        if keyword.arg:
+                            self.lookups.append((model, keyword.arg, node.lineno))
+            elif func.attr in ('filter', 'where'):
+                for arg in node.args:
+                    for compare in ast.walk(arg):
+                        if isinstance(compare, ast.Compare):
+                            target = self._column_ref(compare.left)
+                            if target:
+                                self.lookups.append((*target, node.lineno))
+        self.generic_visit(node)
+
+    @staticmethod
+    def _query_model(node):
+        # Model.query.filter_by(...) or Model.query.options(...).filter_by(...)
+        while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            node = node.func.value
+        if isinstance(node, ast.Attribute) and node.attr == 'query' and isinstance(node.value, ast.Name):
+            return node.value.id
+        return None
+
+    @staticmethod
+    def _column_ref(node):
+        if not isinstance(node, ast.Attribute):
+            return None
+        # table.c.column
+        if (isinstance(node.value, ast.Attribute) and node.value.attr == 'c'
+                and isinstance(node.value.value, ast.Name)):
+            return node.value.value.id, node.attr
+        # Model.column
+        if isinstance(node.value, ast.Name):
+            return node.value.id, node.attr
+        return None
+
+
+def unindexed_lookups(metadata, models, paths):
+    tables = dict(metadata.tables)
+    findings = []
+    seen = set()
+    for path in paths:
+        with open(path) as f:
+            tree = ast.parse(f.read(), filename=path)
+        collector = LookupCollector()
+        collector.visit(tree)
+        for name, column, lineno in collector.lookups:
+            if name in models:
+                table = models[name].__table__
+            elif name in tables:
+                table = tables[name]
+            else:
+                continue
+            if column not in table.columns:
+                continue
+            key = (table.name, column)
+            if key in seen or column in leading_columns(table):
+                continue
+            seen.add(key)
+            findings.append((table.name, column, f'looked up at {os.path.basename(path)}:{lineno}'))
+    return findings
+
+
+def audit(paths):
+    from config import db
+    import models  # noqa: F401  registers the mapped classes
+
+    model_classes = {mapper.class_.__name__: mapper.class_ for mapper in db.Model.registry.mappers}
+    return unindexed_foreign_keys(db.metadata) + unindexed_lookups(db.metadata, model_classes, paths)
+
+
+def main(argv):
+    paths = argv or [os.path.join(ROOT, name) for name in DEFAULT_SOURCES]
+    findings = audit(paths)
+    for table, column, reason in findings:
+        print(f'{table}.{column}: no index ({reason})')
+    if not findings:
+        print('All foreign keys and lookup columns are indexed.')
+    return 1 if findings else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
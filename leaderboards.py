@@ -0,0 +1,271 @@
+"""In-process trending and top-rated cocktail leaderboards.
+
+Each leaderboard keeps its cocktails in a list sorted by score, so reading
+the top N is a slice, and a score change moves one entry with bisect.
+
+* trending - likes weighted by age, halving every ``half_life`` seconds.
+  Scores use forward decay: a like at time t adds 2 ** ((t - epoch) /
+  half_life) for a fixed epoch, so a score never needs updating as time
+  passes, and the order of the list holds. Reads divide by the current
+  weight to report each score as of now.
+* top rated - the Bayesian average rating (rating_sum + m * mean) /
+  (review_count + m). This keeps a single five-star review from
+  outranking hundreds of good ones. ``m`` is ``prior_reviews``, and the
+  mean is taken over all reviews; the board is rescored whenever the
+  review count has grown by a tenth since the mean was last taken.
+
+The write paths call liked() / unliked() / reviewed() / remove(). On first
+use, each process loads the leaderboards from a snapshot file when one is
+configured and recent enough, or rebuilds them from the likes table and
+the cocktails' rating aggregates. Writes before that load are ignored,
+since the load reads them back. A snapshot is written at exit. As with the
+other in-process indexes, other workers' writes reach this process only
+through a reload.
+"""
+import atexit
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+import msgspec
+from flask import current_app
+from sqlalchemy import select
+from werkzeug.local import LocalProxy
+
+from config import db
+from models import Cocktail, likes
+
+# Likes older than this many half-lives weigh under a millionth of a new one
+HORIZON_HALF_LIVES = 20
+# Re-anchor the forward-decay epoch before weights get anywhere near
+# float overflow (2 ** 1024)
+REBASE_HALF_LIVES = 256
+# A trending score below this many fresh likes is rounding error (like times
+# are stored to the second), so it is dropped from the board
+MIN_TRENDING_SCORE = 1e-3
+# Prior mean rating while there are no reviews to take it from
+DEFAULT_MEAN_RATING = 3.0
+
+
+class Leaderboard:
+    """Cocktail ids ranked by score, highest first (ties by id)."""
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        self.ranked = sorted((-score, cocktail_id) for cocktail_id, score in self.scores.items())
+
+    def set(self, cocktail_id, score):
+        """Set the cocktail's score; None drops it from the board."""
+        old = self.scores.pop(cocktail_id, None)
+        if old is not None:
+            del self.ranked[bisect_left(self.ranked, (-old, cocktail_id))]
+        if score is not None:
+            self.scores[cocktail_id] = score
+            insort(self.ranked, (-score, cocktail_id))
+
+    def top(self, limit, offset=0):
+        return [(cocktail_id, -score) for score, cocktail_id in self.ranked[offset:offset + limit]]
+
+    def __len__(self):
+        return len(self.ranked)
+
+
+class LeaderboardSnapshot(msgspec.Struct):
+    saved_at: float
+    epoch: float
+    half_life: float
+    prior_reviews: int
+    trending: Dict[int, float]
+    ratings: Dict[int, Tuple[int, int]]
+
+
+class Leaderboards:
+    def __init__(self, half_life=24 * 3600, prior_reviews=5, snapshot_path=None, snapshot_max_age=3600):
+        self.half_life = half_life
+        self.prior_reviews = prior_reviews
+        self.snapshot_path = snapshot_path
+        self.snapshot_max_age = snapshot_max_age
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._exit_hook = False
+        self.epoch = 0.0
+        self.trending = Leaderboard()
+        self.top_rated = Leaderboard()
+        self.ratings = {}  # cocktail id -> (rating_sum, review_count)
+        self.total_rating = 0
+        self.total_reviews = 0
+        self.mean_rating = DEFAULT_MEAN_RATING
+        self._mean_reviews = 0  # total_reviews when mean_rating was taken
+
+    def init_app(self, app):
+        self.half_life = app.config.get('TRENDING_HALF_LIFE', self.half_life)
+        self.prior_reviews = app.config.get('TOP_RATED_PRIOR_REVIEWS', self.prior_reviews)
+        self.snapshot_path = app.config.get('LEADERBOARD_SNAPSHOT', self.snapshot_path)
+        self.snapshot_max_age = app.config.get('LEADERBOARD_SNAPSHOT_MAX_AGE', self.snapshot_max_age)
+        app.extensions['leaderboards'] = self
+
+    # Loading
+
+    def weight(self, t):
+        return 2.0 ** ((t - self.epoch) / self.half_life)
+
+    def rating_score(self, rating_sum, review_count):
+        m = self.prior_reviews
+        return (rating_sum + m * self.mean_rating) / (review_count + m)
+
+    def build(self, like_times, ratings, now=None):
+        """Replace both boards from like ``(cocktail id, unix time)`` pairs
+        and ``{cocktail id: (rating_sum, review_count)}``."""
+        now = time.time() if now is None else now
+        epoch = now
+        trending = {}
+        for cocktail_id, liked_at in like_times:
+            trending[cocktail_id] = trending.get(cocktail_id, 0.0) + 2.0 ** ((liked_at - epoch) / self.half_life)
+        self._install(epoch, trending, ratings)
+
+    def _install(self, epoch, trending, ratings):
+        with self._lock:
+            self.epoch = epoch
+            self.trending = Leaderboard(trending)
+            self.ratings = {cocktail_id: tuple(rating) for cocktail_id, rating in ratings.items() if rating[1]}
+            self.total_rating = sum(rating_sum for rating_sum, _ in self.ratings.values())
+            self.total_reviews = sum(count for _, count in self.ratings.values())
+            self._rescore()
+            self._loaded = True
+
+    def _rescore(self):
+        self.mean_rating = (self.total_rating / self.total_reviews if self.total_reviews
+                            else DEFAULT_MEAN_RATING)
+        self._mean_reviews = self.total_reviews
+        self.top_rated = Leaderboard({cocktail_id: self.rating_score(*rating)
+                                      for cocktail_id, rating in self.ratings.items()})
+
+    def rebuild(self):
+        """Build the boards from the database."""
+        now = time.time()
+        since = datetime.fromtimestamp(now - HORIZON_HALF_LIVES * self.half_life, timezone.utc)
+        stmt = (select(likes.c.cocktail_id, likes.c.created_at)
+                .where(likes.c.created_at >= since.replace(tzinfo=None))
+                .execution_options(yield_per=10000))
+        like_times = ((cocktail_id, created_at.replace(tzinfo=timezone.utc).timestamp())
+                      for cocktail_id, created_at in db.session.execute(stmt))
+        ratings = {cocktail_id: (rating_sum, review_count) for cocktail_id, rating_sum, review_count in
+                   db.session.execute(select(Cocktail.id, Cocktail.rating_sum, Cocktail.review_count)
+                                      .where(Cocktail.review_count > 0))}
+        self.build(like_times, ratings, now)
+
+    def load_snapshot(self):
+        """Load the snapshot file if it is usable; returns whether it was."""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = msgspec.msgpack.decode(f.read(), type=LeaderboardSnapshot)
+        except (OSError, msgspec.DecodeError):
+            return False
+        if (time.time() - snapshot.saved_at > self.snapshot_max_age or snapshot.half_life != self.half_life
+                or snapshot.prior_reviews != self.prior_reviews):
+            return False
+        self._install(snapshot.epoch, snapshot.trending, snapshot.ratings)
+        return True
+
+    def save_snapshot(self):
+        with self._lock:
+            if not self._loaded:
+                return
+            snapshot = LeaderboardSnapshot(time.time(), self.epoch, self.half_life, self.prior_reviews,
+                                           dict(self.trending.scores), dict(self.ratings))
+        data = msgspec.msgpack.encode(snapshot)
+        # Written aside and renamed, so a crash never leaves half a file
+        tmp = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.snapshot_path)
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if not (self.snapshot_path and self.load_snapshot()):
+                self.rebuild()
+            if self.snapshot_path and not self._exit_hook:
+                atexit.register(self.save_snapshot)
+                self._exit_hook = True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    # Reads
+
+    def top_trending(self, limit, offset=0):
+        """[(cocktail id, decayed like count as of now)], hottest first."""
+        self.ensure_loaded()
+        with self._lock:
+            scale = self.weight(time.time())
+            return [(cocktail_id, score / scale) for cocktail_id, score in self.trending.top(limit, offset)]
+
+    def top_rated_cocktails(self, limit, offset=0):
+        """[(cocktail id, Bayesian average rating)], best first."""
+        self.ensure_loaded()
+        with self._lock:
+            return self.top_rated.top(limit, offset)
+
+    # Write paths
+
+    def liked(self, cocktail_id, at=None):
+        with self._lock:
+            if not self._loaded:
+                return
+            at = time.time() if at is None else at
+            if at - self.epoch > REBASE_HALF_LIVES * self.half_life:
+                self._rebase(at)
+            self.trending.set(cocktail_id, self.trending.scores.get(cocktail_id, 0.0) + self.weight(at))
+
+    def unliked(self, cocktail_id, liked_at=None):
+        """Take back a like made at ``liked_at`` (a naive UTC datetime, as
+        stored), or at the current time's weight when it is unknown."""
+        with self._lock:
+            if not self._loaded:
+                return
+            at = time.time() if liked_at is None else liked_at.replace(tzinfo=timezone.utc).timestamp()
+            score = self.trending.scores.get(cocktail_id, 0.0) - self.weight(at)
+            # Rounding (or an unknown like time) must not leave a stray or
+            # negative score
+            self.trending.set(cocktail_id, score if score > MIN_TRENDING_SCORE * self.weight(time.time()) else None)
+
+    def reviewed(self, cocktail_id, rating):
+        with self._lock:
+            if not self._loaded:
+                return
+            rating_sum, review_count = self.ratings.get(cocktail_id, (0, 0))
+            self.ratings[cocktail_id] = (rating_sum + rating, review_count + 1)
+            self.total_rating += rating
+            self.total_reviews += 1
+            if self.total_reviews * 10 >= self._mean_reviews * 11:
+                self._rescore()
+            else:
+                self.top_rated.set(cocktail_id, self.rating_score(*self.ratings[cocktail_id]))
+
+    def remove(self, cocktail_id):
+        with self._lock:
+            if not self._loaded:
+                return
+            self.trending.set(cocktail_id, None)
+            self.top_rated.set(cocktail_id, None)
+            rating_sum, review_count = self.ratings.pop(cocktail_id, (0, 0))
+            self.total_rating -= rating_sum
+            self.total_reviews -= review_count
+
+    def _rebase(self, now):
+        factor = self.weight(now)
+        self.trending = Leaderboard({cocktail_id: score / factor
+                                     for cocktail_id, score in self.trending.scores.items()})
+        self.epoch = now
+
+
+# The current app's leaderboards (see create_app)
+leaderboards = LocalProxy(lambda: current_app.extensions['leaderboards'])
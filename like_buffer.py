@@ -0,0 +1,233 @@
+"""Write-behind buffering of like/unlike toggles (LIKES_WRITE_BEHIND=1).
+
+Each toggle becomes a pending (user, cocktail) -> liked entry in memory and
+is acknowledged straight away. Toggling the same pair again replaces the
+entry, and toggling it back to what the database already holds drops it,
+so a burst of clicks costs at most one row change. A background thread
+writes pending entries every ``interval`` seconds, or as soon as ``max_size``
+are waiting. Each batch is one transaction: a multi-row INSERT of new likes,
+a multi-row DELETE of removed ones, and a recount of ``like_count`` for the
+cocktails touched.
+
+Consistency:
+
+* Like/unlike responses add the cocktail's pending delta to the stored
+  ``like_count``.
+* A GET or HEAD from a user with pending toggles flushes the buffer first,
+  so that user reads their own likes back. The buffer is per process, so
+  this only holds across workers if a user's requests stay on one worker
+  (as they do with a single worker, or sticky sessions).
+* Pending toggles are flushed at interpreter exit. Toggles acknowledged
+  within the last ``interval`` seconds are lost if the process is killed
+  outright.
+"""
+import atexit
+import threading
+
+from flask import current_app, request, session
+from sqlalchemy import select, delete, update, func, tuple_
+from werkzeug.local import LocalProxy
+
+from config import db
+from models import Cocktail, likes, insert_ignore
+
+
+class LikeBuffer:
+    def __init__(self, interval=0.5, max_size=500):
+        self.interval = interval
+        self.max_size = max_size
+        self.enabled = False
+        self.flushes = 0
+        self.flushed_toggles = 0
+        self.app = None
+        self.on_flush = None
+        self._pending = {}    # (user id, cocktail id) -> liked
+        self._in_flight = {}  # the batch being written
+        self._deltas = {}     # cocktail id -> like_count change not yet written
+        self._users = {}      # user id -> number of pending or in-flight toggles
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one batch written at a time
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app, on_flush=None):
+        """``on_flush(cocktail_ids)`` is called after each batch commits."""
+        self.app = app
+        self.on_flush = on_flush
+        self.enabled = app.config.get('LIKES_WRITE_BEHIND', False)
+        self.interval = app.config.get('LIKES_FLUSH_INTERVAL', self.interval)
+        self.max_size = app.config.get('LIKES_FLUSH_SIZE', self.max_size)
+        if self.enabled:
+            app.before_request(self._read_your_writes)
+        app.extensions['like_buffer'] = self
+
+    # Request path
+
+    def state(self, user_id, cocktail_id):
+        """Pending liked state of the pair, or None when nothing is pending."""
+        key = (user_id, cocktail_id)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._in_flight.get(key)
+
+    def delta(self, cocktail_id):
+        with self._lock:
+            return self._deltas.get(cocktail_id, 0)
+
+    def toggle(self, user_id, cocktail_id, liked, stored):
+        """Record that the user (un)liked the cocktail. Returns the
+        cocktail's pending like_count delta and whether this call changed
+        the like (rather than repeating the current state).
+
+        ``stored()`` says whether the like exists in the database; it is only
+        called when nothing is pending for the pair.
+        """
+        current = self.state(user_id, cocktail_id)
+        if current is None:
+            current = stored()
+        key = (user_id, cocktail_id)
+        with self._lock:
+            if key in self._pending:
+                current = self._pending[key]
+            elif key in self._in_flight:
+                current = self._in_flight[key]
+            changed = current != liked
+            if changed:
+                if key in self._pending:
+                    # Back to the state before the pending toggle
+                    del self._pending[key]
+                    self._count_user(user_id, -1)
+                else:
+                    self._pending[key] = liked
+                    self._count_user(user_id, 1)
+                delta = self._deltas.get(cocktail_id, 0) + (1 if liked else -1)
+                if delta:
+                    self._deltas[cocktail_id] = delta
+                else:
+                    self._deltas.pop(cocktail_id, None)
+            full = len(self._pending) >= self.max_size
+            delta = self._deltas.get(cocktail_id, 0)
+        self._start()
+        if full:
+            self._wake.set()
+        return delta, changed
+
+    def has_pending(self):
+        return bool(self._users)
+
+    def _count_user(self, user_id, n):
+        count = self._users.get(user_id, 0) + n
+        if count:
+            self._users[user_id] = count
+        else:
+            del self._users[user_id]
+
+    def read_your_writes(self, user_id):
+        """Flush first if ``user_id`` has toggles pending, so what they read
+        next includes them."""
+        if user_id is not None and user_id in self._users:
+            self.flush()
+
+    def _read_your_writes(self):
+        if request.method in ('GET', 'HEAD') and self._users:
+            self.read_your_writes(session.get('user_id'))
+
+    # Writing batches
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Writing buffered likes failed; retrying')
+
+    def flush(self):
+        """Write every pending toggle; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._in_flight = self._pending
+                self._pending = {}
+            try:
+                with self.app.app_context():
+                    cocktail_ids = self._write(batch)
+            except BaseException:
+                self._requeue(batch)
+                raise
+            with self._lock:
+                self._in_flight = {}
+                for (user_id, cocktail_id), liked in batch.items():
+                    self._count_user(user_id, -1)
+                    delta = self._deltas.get(cocktail_id, 0) - (1 if liked else -1)
+                    if delta:
+                        self._deltas[cocktail_id] = delta
+                    else:
+                        self._deltas.pop(cocktail_id, None)
+                self.flushes += 1
+                self.flushed_toggles += len(batch)
+        if self.on_flush is not None:
+            self.on_flush(cocktail_ids)
+        return len(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._in_flight = {}
+            for key, liked in batch.items():
+                if key in self._pending:
+                    # Toggled back while in flight, so the pair is at its
+                    # stored state again (and its two deltas cancel out)
+                    del self._pending[key]
+                    self._count_user(key[0], -2)
+                else:
+                    self._pending[key] = liked
+
+    @staticmethod
+    def _write(batch):
+        cocktail_ids = sorted({cocktail_id for _, cocktail_id in batch})
+        connection = db.session.connection()
+        # Likes of cocktails deleted since the toggle are dropped
+        existing = set(connection.execute(select(Cocktail.id).where(Cocktail.id.in_(cocktail_ids))).scalars())
+        added = [{'user_id': user_id, 'cocktail_id': cocktail_id}
+                 for (user_id, cocktail_id), liked in batch.items() if liked and cocktail_id in existing]
+        removed = [key for key, liked in batch.items() if not liked]
+        if added:
+            connection.execute(insert_ignore(likes, ['user_id', 'cocktail_id']), added)
+        if removed:
+            connection.execute(delete(likes).where(tuple_(likes.c.user_id, likes.c.cocktail_id).in_(removed)))
+        # Recounting, rather than applying deltas, keeps like_count exact
+        # even when another process wrote some of the same pairs
+        like_count = (select(func.count()).select_from(likes)
+                      .where(likes.c.cocktail_id == Cocktail.id).scalar_subquery())
+        existing = sorted(existing)
+        if existing:
+            connection.execute(update(Cocktail.__table__)
+                               .where(Cocktail.id.in_(existing))
+                               .values(like_count=like_count))
+        db.session.commit()
+        return existing
+
+    def close(self):
+        """Stop the background thread and write what is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+
+# The current app's buffer (see create_app)
+like_buffer = LocalProxy(lambda: current_app.extensions['like_buffer'])
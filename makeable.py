@@ -0,0 +1,191 @@
+"""In-process inverted index answering "what can I make with these
+ingredients?".
+
+Each ingredient maps to a bitset (a Python int, bit n set = cocktail n uses
+it), and cocktails are grouped by recipe size into the same kind of bitset.
+A query adds the bitsets of the ingredients on hand into bit-sliced
+counters, so every cocktail's number of matched ingredients is computed
+with a handful of big-int operations per ingredient, independent of the
+catalog size in Python-level work. Cocktails missing at most ``k``
+ingredients are those whose match count is at least their recipe size
+minus ``k``.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+from werkzeug.local import LocalProxy
+
+from config import db
+from models import CocktailIngredient
+
+
+def bit_positions(bits):
+    """Indexes of the set bits of ``bits``, lowest first."""
+    digits = bin(bits)[:1:-1]  # least significant bit first, without '0b'
+    positions = []
+    i = digits.find('1')
+    while i != -1:
+        positions.append(i)
+        i = digits.find('1', i + 1)
+    return positions
+
+
+def bitset(ids):
+    """Big-int bitset with a bit set for every id in ``ids``."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buf = bytearray((max(ids) >> 3) + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+class MakeableIndex:
+    def __init__(self, max_age=None):
+        # Other worker processes write to the same tables, so a loaded index
+        # is rebuilt once it is older than max_age seconds.
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self.by_ingredient = {}   # ingredient id -> bitset of cocktail ids
+        self.by_size = {}         # recipe size -> bitset of cocktail ids
+        self.recipes = {}         # cocktail id -> frozenset of ingredient ids
+
+    def init_app(self, app):
+        self.max_age = app.config.get('MAKEABLE_INDEX_MAX_AGE', self.max_age)
+        app.extensions['makeable_index'] = self
+
+    def build(self, pairs):
+        """Replace the index with (cocktail id, ingredient id) ``pairs``."""
+        recipes = {}
+        for cocktail_id, ingredient_id in pairs:
+            recipes.setdefault(cocktail_id, set()).add(ingredient_id)
+        # Gather ids first and set bits in one pass per bitset; OR-ing single
+        # bits into a growing int would copy the whole int every time.
+        ingredient_ids, size_ids = {}, {}
+        for cocktail_id, ingredients in recipes.items():
+            for ingredient_id in ingredients:
+                ingredient_ids.setdefault(ingredient_id, []).append(cocktail_id)
+            size_ids.setdefault(len(ingredients), []).append(cocktail_id)
+        by_ingredient = {ingredient_id: bitset(ids) for ingredient_id, ids in ingredient_ids.items()}
+        by_size = {size: bitset(ids) for size, ids in size_ids.items()}
+        with self._lock:
+            self.recipes = {cid: frozenset(ings) for cid, ings in recipes.items()}
+            self.by_ingredient = by_ingredient
+            self.by_size = by_size
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+
+    def load(self):
+        """Build the index from the cocktail_ingredients table."""
+        stmt = select(CocktailIngredient.cocktail_id, CocktailIngredient.ingredient_id)
+        self.build(db.session.execute(stmt.execution_options(yield_per=10000)))
+
+    def is_fresh(self):
+        if not self._loaded:
+            return False
+        return self.max_age is None or time.monotonic() - self._loaded_at < self.max_age
+
+    def ensure_loaded(self):
+        if not self.is_fresh():
+            with self._lock:
+                if not self.is_fresh():
+                    self.load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def set_recipe(self, cocktail_id, ingredient_ids):
+        """Record the current ingredients of one cocktail (empty removes it)."""
+        with self._lock:
+            if not self._loaded:
+                return  # picked up by the next full load
+            self._remove(cocktail_id)
+            ingredient_ids = frozenset(ingredient_ids)
+            if not ingredient_ids:
+                return
+            bit = 1 << cocktail_id
+            for ingredient_id in ingredient_ids:
+                self.by_ingredient[ingredient_id] = self.by_ingredient.get(ingredient_id, 0) | bit
+            size = len(ingredient_ids)
+            self.by_size[size] = self.by_size.get(size, 0) | bit
+            self.recipes[cocktail_id] = ingredient_ids
+
+    def refresh(self, cocktail_id):
+        """Re-read one cocktail's recipe from the database."""
+        if not self._loaded:
+            return
+        stmt = (select(CocktailIngredient.ingredient_id)
+                .where(CocktailIngredient.cocktail_id == cocktail_id))
+        self.set_recipe(cocktail_id, db.session.scalars(stmt))
+
+    def _remove(self, cocktail_id):
+        old = self.recipes.pop(cocktail_id, None)
+        if not old:
+            return
+        mask = ~(1 << cocktail_id)
+        for ingredient_id in old:
+            remaining = self.by_ingredient[ingredient_id] & mask
+            if remaining:
+                self.by_ingredient[ingredient_id] = remaining
+            else:
+                del self.by_ingredient[ingredient_id]
+        remaining = self.by_size[len(old)] & mask
+        if remaining:
+            self.by_size[len(old)] = remaining
+        else:
+            del self.by_size[len(old)]
+
+    def match(self, ingredient_ids, max_missing=0):
+        """Map cocktail id -> missing ingredient ids for every cocktail that
+        lacks at most ``max_missing`` of its ingredients."""
+        self.ensure_loaded()
+        have = frozenset(ingredient_ids)
+        with self._lock:
+            # Bit-sliced counters: slices[i] holds bit i of each cocktail's
+            # match count, added ripple-carry style one ingredient at a time.
+            slices = []
+            for ingredient_id in have:
+                carry = self.by_ingredient.get(ingredient_id, 0)
+                for i in range(len(slices)):
+                    if not carry:
+                        break
+                    slices[i], carry = slices[i] ^ carry, slices[i] & carry
+                if carry:
+                    slices.append(carry)
+
+            # Only cocktails that use at least one of the ingredients on hand
+            relevant = 0
+            for bits in slices:
+                relevant |= bits
+
+            matched = 0
+            for size, cocktails in self.by_size.items():
+                needed = size - max_missing
+                if needed <= 0:
+                    matched |= cocktails
+                elif needed.bit_length() <= len(slices):
+                    matched |= cocktails & self._at_least(slices, needed)
+            recipes = self.recipes
+            return {cid: recipes[cid] - have for cid in bit_positions(matched & relevant)}
+
+    @staticmethod
+    def _at_least(slices, threshold):
+        """Bitset of cocktails whose bit-sliced count is >= ``threshold``."""
+        greater, equal = 0, -1
+        for i in range(len(slices) - 1, -1, -1):
+            if (threshold >> i) & 1:
+                equal &= slices[i]
+            else:
+                greater |= equal & slices[i]
+                equal &= ~slices[i]
+        return greater | equal
+
+
+# The current app's index (see create_app)
+makeable_index = LocalProxy(lambda: current_app.extensions['makeable_index'])
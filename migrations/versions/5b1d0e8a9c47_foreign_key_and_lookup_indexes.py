@@ -0,0 +1,42 @@
+"""Foreign key and lookup indexes
+
+Revision ID: 5b1d0e8a9c47
+Revises: 7e363ff23362
+Create Date: 2026-10-18 09:48:05.117342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1d0e8a9c47'
+down_revision = '7e363ff23362'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cocktail_ingredients', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cocktail_ingredients_cocktail_id'), ['cocktail_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_cocktail_ingredients_ingredient_id'), ['ingredient_id'], unique=False)
+
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.create_index('ix_likes_cocktail_id', ['cocktail_id'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_cocktail_id_id', ['cocktail_id', 'id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_reviews_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reviews_user_id'))
+        batch_op.drop_index('ix_reviews_cocktail_id_id')
+
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.drop_index('ix_likes_cocktail_id')
+
+    with op.batch_alter_table('cocktail_ingredients', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cocktail_ingredients_ingredient_id'))
+        batch_op.drop_index(batch_op.f('ix_cocktail_ingredients_cocktail_id'))
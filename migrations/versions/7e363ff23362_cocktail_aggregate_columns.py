@@ -0,0 +1,40 @@
+"""Cocktail like/review aggregate columns
+
+Revision ID: 7e363ff23362
+Revises: c7cc07942419
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e363ff23362'
+down_revision = 'c7cc07942419'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cocktails', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing likes and reviews
+    op.execute(
+        """
+        UPDATE cocktails SET
+            like_count = (SELECT COUNT(*) FROM likes WHERE likes.cocktail_id = cocktails.id),
+            review_count = (SELECT COUNT(*) FROM reviews WHERE reviews.cocktail_id = cocktails.id),
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.cocktail_id = cocktails.id)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('cocktails', schema=None) as batch_op:
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('review_count')
+        batch_op.drop_column('like_count')
@@ -0,0 +1,177 @@
+"""Cocktail full-text search index
+
+Revision ID: 9f2a6c3d1e85
+Revises: 5b1d0e8a9c47
+Create Date: 2026-10-18 10:31:47.205319
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f2a6c3d1e85'
+down_revision = '5b1d0e8a9c47'
+branch_labels = None
+depends_on = None
+
+SQLITE_DOCUMENT = """
+    SELECT c.id, c.name, c.instructions, c.glass_type,
+           (SELECT group_concat(i.name, ' ') FROM cocktail_ingredients ci
+            JOIN ingredients i ON i.id = ci.ingredient_id
+            WHERE ci.cocktail_id = c.id)
+    FROM cocktails c
+"""
+
+
+def sqlite_reindex(target):
+    return f"""
+        DELETE FROM cocktail_search WHERE rowid {target};
+        INSERT INTO cocktail_search(rowid, name, instructions, glass_type, ingredients)
+        {SQLITE_DOCUMENT} WHERE c.id {target};
+    """
+
+
+SQLITE_UPGRADE = [
+    """
+    CREATE VIRTUAL TABLE cocktail_search USING fts5(
+        name, instructions, glass_type, ingredients,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3 4 5'
+    )
+    """,
+    # ORDER BY rank uses bm25() weighted name, instructions, glass_type, ingredients
+    "INSERT INTO cocktail_search(cocktail_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 2.0, 5.0)')",
+    f"""
+    CREATE TRIGGER cocktail_search_cocktail_insert AFTER INSERT ON cocktails
+    BEGIN {sqlite_reindex('= new.id')} END
+    """,
+    f"""
+    CREATE TRIGGER cocktail_search_cocktail_update AFTER UPDATE OF name, instructions, glass_type ON cocktails
+    BEGIN {sqlite_reindex('= new.id')} END
+    """,
+    """
+    CREATE TRIGGER cocktail_search_cocktail_delete AFTER DELETE ON cocktails
+    BEGIN DELETE FROM cocktail_search WHERE rowid = old.id; END
+    """,
+    f"""
+    CREATE TRIGGER cocktail_search_recipe_insert AFTER INSERT ON cocktail_ingredients
+    BEGIN {sqlite_reindex('= new.cocktail_id')} END
+    """,
+    f"""
+    CREATE TRIGGER cocktail_search_recipe_update AFTER UPDATE OF cocktail_id, ingredient_id ON cocktail_ingredients
+    BEGIN {sqlite_reindex('= old.cocktail_id')} {sqlite_reindex('= new.cocktail_id')} END
+    """,
+    f"""
+    CREATE TRIGGER cocktail_search_recipe_delete AFTER DELETE ON cocktail_ingredients
+    BEGIN {sqlite_reindex('= old.cocktail_id')} END
+    """,
+    f"""
+    CREATE TRIGGER cocktail_search_ingredient_rename AFTER UPDATE OF name ON ingredients
+    BEGIN {sqlite_reindex('IN (SELECT cocktail_id FROM cocktail_ingredients WHERE ingredient_id = new.id)')} END
+    """,
+    f"""
+    INSERT INTO cocktail_search(rowid, name, instructions, glass_type, ingredients)
+    {SQLITE_DOCUMENT}
+    """,
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER cocktail_search_ingredient_rename",
+    "DROP TRIGGER cocktail_search_recipe_delete",
+    "DROP TRIGGER cocktail_search_recipe_update",
+    "DROP TRIGGER cocktail_search_recipe_insert",
+    "DROP TRIGGER cocktail_search_cocktail_delete",
+    "DROP TRIGGER cocktail_search_cocktail_update",
+    "DROP TRIGGER cocktail_search_cocktail_insert",
+    "DROP TABLE cocktail_search",
+]
+
+POSTGRES_UPGRADE = [
+    """
+    CREATE TABLE cocktail_search (
+        cocktail_id INTEGER PRIMARY KEY REFERENCES cocktails (id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX ix_cocktail_search_document ON cocktail_search USING GIN (document)",
+    """
+    CREATE FUNCTION cocktail_search_refresh(target INTEGER) RETURNS VOID AS $$
+    BEGIN
+        INSERT INTO cocktail_search (cocktail_id, document)
+        SELECT c.id,
+               setweight(to_tsvector('simple', coalesce(c.name, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce(
+                   (SELECT string_agg(i.name, ' ') FROM cocktail_ingredients ci
+                    JOIN ingredients i ON i.id = ci.ingredient_id
+                    WHERE ci.cocktail_id = c.id), '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(c.glass_type, '')), 'C') ||
+               setweight(to_tsvector('simple', coalesce(c.instructions, '')), 'D')
+        FROM cocktails c WHERE c.id = target
+        ON CONFLICT (cocktail_id) DO UPDATE SET document = EXCLUDED.document;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION cocktail_search_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'cocktails' THEN
+            PERFORM cocktail_search_refresh(NEW.id);
+        ELSIF TG_TABLE_NAME = 'ingredients' THEN
+            PERFORM cocktail_search_refresh(ci.cocktail_id)
+            FROM cocktail_ingredients ci WHERE ci.ingredient_id = NEW.id;
+        ELSE
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM cocktail_search_refresh(OLD.cocktail_id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM cocktail_search_refresh(NEW.cocktail_id);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER cocktail_search_cocktails AFTER INSERT OR UPDATE OF name, instructions, glass_type
+    ON cocktails FOR EACH ROW EXECUTE FUNCTION cocktail_search_trigger()
+    """,
+    """
+    CREATE TRIGGER cocktail_search_recipes AFTER INSERT OR UPDATE OR DELETE
+    ON cocktail_ingredients FOR EACH ROW EXECUTE FUNCTION cocktail_search_trigger()
+    """,
+    """
+    CREATE TRIGGER cocktail_search_ingredients AFTER UPDATE OF name
+    ON ingredients FOR EACH ROW EXECUTE FUNCTION cocktail_search_trigger()
+    """,
+    "SELECT cocktail_search_refresh(id) FROM cocktails",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP TRIGGER cocktail_search_ingredients ON ingredients",
+    "DROP TRIGGER cocktail_search_recipes ON cocktail_ingredients",
+    "DROP TRIGGER cocktail_search_cocktails ON cocktails",
+    "DROP FUNCTION cocktail_search_trigger()",
+    "DROP FUNCTION cocktail_search_refresh(INTEGER)",
+    "DROP TABLE cocktail_search",
+]
+
+
+def run(statements):
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        run(SQLITE_UPGRADE)
+    elif dialect == 'postgresql':
+        run(POSTGRES_UPGRADE)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        run(SQLITE_DOWNGRADE)
+    elif dialect == 'postgresql':
+        run(POSTGRES_DOWNGRADE)
@@ -0,0 +1,34 @@
+"""Session table
+
+Revision ID: d41b7c2e6f10
+Revises: 9f2a6c3d1e85
+Create Date: 2026-10-18 11:02:47.581930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b7c2e6f10'
+down_revision = '9f2a6c3d1e85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sessions',
+    sa.Column('session_id', sa.String(length=255), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('expiry', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('session_id')
+    )
+    with op.batch_alter_table('sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sessions_expiry'), ['expiry'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sessions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sessions_expiry'))
+
+    op.drop_table('sessions')
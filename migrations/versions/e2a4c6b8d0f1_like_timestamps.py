@@ -0,0 +1,29 @@
+"""Like timestamps
+
+Revision ID: e2a4c6b8d0f1
+Revises: d41b7c2e6f10
+Create Date: 2026-10-18 14:20:05.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a4c6b8d0f1'
+down_revision = 'd41b7c2e6f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite cannot ADD COLUMN with a non-constant default, so the table is
+    # rebuilt; existing likes are stamped with the time of the upgrade
+    with op.batch_alter_table('likes', schema=None, recreate='always') as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                                      nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.drop_column('created_at')
@@ -1,10 +1,32 @@
+from typing import List, Optional
+import msgspec
+from flask import current_app
 from sqlalchemy_serializer import SerializerMixin
-from sqlalchemy.orm import validates
-from config import db, bcrypt
+from sqlalchemy import select, insert, update, delete, bindparam, func, or_, case
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import validates, selectinload, joinedload
+from werkzeug.local import LocalProxy
+from config import db
+
+# The current app's hasher (see create_app); passwords.py itself stays free
+# of Flask for the sake of its pool's worker processes
+password_hasher = LocalProxy(lambda: current_app.extensions['password_hasher'])
 
 likes = db.Table('likes',
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('cocktail_id', db.Integer, db.ForeignKey('cocktails.id'), primary_key=True)
+    db.Column('cocktail_id', db.Integer, db.ForeignKey('cocktails.id'), primary_key=True),
+    # UTC; weighs likes by age in the trending leaderboard (see leaderboards.py)
+    db.Column('created_at', db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP')),
+    # The primary key leads with user_id; per-cocktail counts need their own index
+    db.Index('ix_likes_cocktail_id', 'cocktail_id'),
+)
+
+# Server-side session storage (see sessions.py); expiry is indexed so the
+# expiry sweep is a range scan instead of a full table scan
+sessions = db.Table('sessions',
+    db.Column('session_id', db.String(255), primary_key=True),
+    db.Column('data', db.LargeBinary, nullable=False),
+    db.Column('expiry', db.DateTime, nullable=False, index=True),
 )
 
 class User(db.Model, SerializerMixin):
@@ -20,10 +42,18 @@ class User(db.Model, SerializerMixin):
     serialize_rules = ('-password_hash', '-reviews.user', '-liked_cocktails.likes')
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        # Raises passwords.HasherBusy when the hashing pool is saturated
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        if self.password_hash is None:
+            return False  # imported without a password (see catalog.py)
+        # A hash made with an outdated work factor is upgraded in place;
+        # the caller commits it
+        matches, new_hash = password_hasher.verify(password, self.password_hash)
+        if new_hash:
+            self.password_hash = new_hash
+        return matches
 
     @validates('email')
     def validate_email(self, key, email):
@@ -39,11 +69,26 @@ class Cocktail(db.Model, SerializerMixin):
     instructions = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(200))
     glass_type = db.Column(db.String(50))
-    reviews = db.relationship('Review', back_populates='cocktail')
-    ingredients = db.relationship('CocktailIngredient', back_populates='cocktail')
+    # Denormalized aggregates, kept in step by the like/unlike/review write
+    # paths; reconcile_aggregates() repairs any drift.
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reviews = db.relationship('Review', back_populates='cocktail', cascade='all, delete-orphan')
+    ingredients = db.relationship('CocktailIngredient', back_populates='cocktail', cascade='all, delete-orphan')
     likes = db.relationship('User', secondary=likes, back_populates='liked_cocktails')
 
-    serialize_rules = ('-reviews.cocktail', '-ingredients.cocktail', '-likes.liked_cocktails')
+    serialize_rules = ('-reviews.cocktail', '-ingredients.cocktail', '-likes.liked_cocktails', 'average_rating')
+
+    @hybrid_property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @average_rating.expression
+    def average_rating(cls):
+        return case((cls.review_count > 0, cls.rating_sum * 1.0 / cls.review_count), else_=None)
 
 class Ingredient(db.Model, SerializerMixin):
     __tablename__ = 'ingredients'
@@ -58,8 +103,8 @@ class CocktailIngredient(db.Model, SerializerMixin):
     __tablename__ = 'cocktail_ingredients'
 
     id = db.Column(db.Integer, primary_key=True)
-    cocktail_id = db.Column(db.Integer, db.ForeignKey('cocktails.id'), nullable=False)
-    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
+    cocktail_id = db.Column(db.Integer, db.ForeignKey('cocktails.id'), nullable=False, index=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False, index=True)
     amount = db.Column(db.String(50))
     cocktail = db.relationship('Cocktail', back_populates='ingredients')
     ingredient = db.relationship('Ingredient', back_populates='cocktails')
@@ -68,11 +113,15 @@ class CocktailIngredient(db.Model, SerializerMixin):
 
 class Review(db.Model, SerializerMixin):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # Serves filter_by(cocktail_id=...) and keyset pagination of a cocktail's reviews
+        db.Index('ix_reviews_cocktail_id_id', 'cocktail_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     rating = db.Column(db.Integer, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     cocktail_id = db.Column(db.Integer, db.ForeignKey('cocktails.id'), nullable=False)
     user = db.relationship('User', back_populates='reviews')
     cocktail = db.relationship('Cocktail', back_populates='reviews')
@@ -83,4 +132,186 @@ class Review(db.Model, SerializerMixin):
     def validate_rating(self, key, rating):
         if not 1 <= rating <= 5:
             raise ValueError("Rating must be between 1 and 5")
-        return rating
\ No newline at end of file
+        return rating
+
+def reconcile_aggregates():
+    """Recompute the denormalized cocktail counters from the likes and reviews
+    tables, returning the number of cocktails that had drifted."""
+    like_count = (select(func.count()).select_from(likes)
+                  .where(likes.c.cocktail_id == Cocktail.id).scalar_subquery())
+    review_count = (select(func.count(Review.id))
+                    .where(Review.cocktail_id == Cocktail.id).scalar_subquery())
+    rating_sum = (select(func.coalesce(func.sum(Review.rating), 0))
+                  .where(Review.cocktail_id == Cocktail.id).scalar_subquery())
+    stmt = (update(Cocktail)
+            .where(or_(Cocktail.like_count != like_count,
+                       Cocktail.review_count != review_count,
+                       Cocktail.rating_sum != rating_sum))
+            .values(like_count=like_count, review_count=review_count, rating_sum=rating_sum)
+            .execution_options(synchronize_session=False))
+    result = db.session.execute(stmt)
+    db.session.commit()
+    return result.rowcount
+
+def insert_ignore(table, index_elements):
+    """INSERT that silently skips rows conflicting on ``index_elements``."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table).prefix_with('IGNORE', dialect='mysql')
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+
+def resolve_ingredients(names):
+    """Map ingredient names to ids, creating the missing ones.
+
+    Costs one SELECT ... IN for the names that already exist and, if any are
+    new, one multi-row INSERT ... ON CONFLICT DO NOTHING plus a re-read, so a
+    concurrent request creating the same ingredient is absorbed rather than
+    failing on the unique name constraint.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    table = Ingredient.__table__
+    with db.session.no_autoflush:
+        stmt = select(table.c.name, table.c.id).where(table.c.name.in_(names))
+        ids = dict(db.session.execute(stmt).all())
+        missing = [name for name in names if name not in ids]
+        if missing:
+            db.session.execute(insert_ignore(table, ['name']), [{'name': name} for name in missing])
+            stmt = select(table.c.name, table.c.id).where(table.c.name.in_(missing))
+            ids.update(db.session.execute(stmt).all())
+    return ids
+
+def parse_ingredient(ingredient_str):
+    """Split "2 oz White Rum" into its name and leading amount."""
+    parts = ingredient_str.split(' ', 1)
+    amount = parts[0] if len(parts) > 1 else ''
+    name = parts[1] if len(parts) > 1 else parts[0]
+    return name, amount
+
+def add_cocktail_ingredients(items):
+    """Bulk-insert (cocktail_id, ingredient name, amount) triples as
+    cocktail_ingredients rows, resolving every name in a single pass."""
+    items = list(items)
+    if not items:
+        return
+    ids = resolve_ingredients(name for _, name, _ in items)
+    rows = [{'cocktail_id': cocktail_id, 'ingredient_id': ids[name], 'amount': amount}
+            for cocktail_id, name, amount in items]
+    db.session.execute(insert(CocktailIngredient.__table__), rows)
+
+def load_recipe(cocktail_id):
+    """The cocktail's ingredient rows as (row id, ingredient name, amount)."""
+    stmt = (select(CocktailIngredient.id, Ingredient.name, CocktailIngredient.amount)
+            .join(CocktailIngredient.ingredient)
+            .where(CocktailIngredient.cocktail_id == cocktail_id)
+            .order_by(CocktailIngredient.id))
+    return db.session.execute(stmt).all()
+
+def sync_cocktail_ingredients(cocktail_id, items, current=None):
+    """Make the cocktail's ingredients match the (name, amount) pairs in
+    ``items`` with the fewest writes: rows whose ingredient and amount are
+    unchanged are left alone, changed amounts are updated in place, and only
+    genuinely added or dropped ingredients are inserted or deleted.
+
+    ``current`` may pass in rows already fetched with load_recipe().
+    """
+    if current is None:
+        current = load_recipe(cocktail_id)
+    existing = {}
+    for row_id, name, amount in current:
+        existing.setdefault(name, []).append((row_id, amount))
+
+    inserts, updates = [], []
+    for name, amount in items:
+        rows = existing.get(name)
+        if not rows:
+            inserts.append((cocktail_id, name, amount))
+            continue
+        row_id, old_amount = rows.pop(0)
+        if old_amount != amount:
+            updates.append({'row_id': row_id, 'new_amount': amount})
+    deletes = [row_id for rows in existing.values() for row_id, _ in rows]
+
+    table = CocktailIngredient.__table__
+    if deletes:
+        db.session.execute(delete(table).where(table.c.id.in_(deletes)))
+    if updates:
+        stmt = (update(table)
+                .where(table.c.id == bindparam('row_id'))
+                .values(amount=bindparam('new_amount')))
+        db.session.execute(stmt, updates)
+    add_cocktail_ingredients(inserts)
+    return len(inserts), len(updates), len(deletes)
+
+# Eager-loading strategies per endpoint, so serializing a response never
+# falls back to one lazy SELECT per relationship hop.
+COCKTAIL_DETAIL_LOADERS = (
+    selectinload(Cocktail.reviews).joinedload(Review.user),
+    selectinload(Cocktail.ingredients).joinedload(CocktailIngredient.ingredient),
+    selectinload(Cocktail.likes),
+)
+REVIEW_LIST_LOADERS = (joinedload(Review.user),)
+USER_LOADERS = (
+    selectinload(User.reviews).joinedload(Review.cocktail).options(
+        selectinload(Cocktail.ingredients).joinedload(CocktailIngredient.ingredient),
+        selectinload(Cocktail.likes),
+    ),
+)
+
+# Precompiled response schemas. Each struct's field order matches the column
+# order returned by columns_for(), so rows can be passed in positionally.
+
+class UserSchema(msgspec.Struct):
+    id: int
+    username: str
+    email: str
+
+class IngredientSchema(msgspec.Struct):
+    id: int
+    name: str
+
+class CocktailSchema(msgspec.Struct):
+    id: int
+    name: str
+    instructions: str
+    image_url: Optional[str]
+    glass_type: Optional[str]
+    like_count: int
+    review_count: int
+    rating_sum: int
+    average_rating: Optional[float]
+
+class CocktailIngredientSchema(msgspec.Struct):
+    id: int
+    cocktail_id: int
+    ingredient_id: int
+    amount: Optional[str]
+    ingredient: Optional[IngredientSchema] = None
+
+class ReviewSchema(msgspec.Struct):
+    id: int
+    content: str
+    rating: int
+    user_id: int
+    cocktail_id: int
+    user: Optional[UserSchema] = None
+
+class CocktailDetailSchema(CocktailSchema):
+    reviews: List[ReviewSchema] = []
+    ingredients: List[CocktailIngredientSchema] = []
+    likes: List[UserSchema] = []
+
+json_encoder = msgspec.json.Encoder()
+
+def columns_for(schema, model):
+    """Model columns (and hybrid attributes) in the positional order expected
+    by ``schema``."""
+    descriptors = model.__mapper__.all_orm_descriptors
+    return [getattr(model, name) for name in schema.__struct_fields__
+            if name in model.__table__.columns
+            or isinstance(descriptors.get(name), hybrid_property)]
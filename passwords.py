@@ -0,0 +1,150 @@
+"""Password hashing off the request threads, and login throttling.
+
+bcrypt is deliberately slow (~250 ms at the default work factor), so hashes
+are computed in a small process pool. Only ``workers`` hashes run at once
+and at most ``max_pending`` more may wait; beyond that ``HasherBusy`` is
+raised straight away so the endpoint can answer 503 instead of piling up
+blocked request threads. Keep this module free of Flask imports: the pool's
+worker processes import it.
+"""
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Every worker is busy and the wait queue is full."""
+
+
+def hash_rounds(password_hash):
+    # $2b$12$<salt+hash>
+    return int(password_hash.split('$')[2])
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, password_hash, rounds):
+    """(matches, new hash or None); a matching hash made with fewer than
+    ``rounds`` is rehashed in the same trip to the pool."""
+    if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+        return False, None
+    if hash_rounds(password_hash) < rounds:
+        return True, _hash(password, rounds)
+    return True, None
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, max_pending=16, rounds=12, timeout=30):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.timeout = timeout
+        self._pool = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn, not fork: forking a process that is running request
+            # threads can copy locks held by other threads
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_pending:
+                raise HasherBusy()
+            self._in_flight += 1
+            try:
+                try:
+                    future = self._executor().submit(fn, *args)
+                except BrokenProcessPool:
+                    self._pool = None
+                    future = self._executor().submit(fn, *args)
+            except BaseException:
+                self._in_flight -= 1
+                raise
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            # Only an alias of the builtin TimeoutError from Python 3.11
+            raise HasherBusy() from None
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        """Return (matches, new hash or None); see ``_verify``."""
+        return self._run(_verify, password, password_hash, self.rounds)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+class LoginThrottle:
+    """Sliding-window limit on failed logins per username and per client IP.
+
+    Checked before any hashing, so a blocked username or address costs no
+    bcrypt time. Counts are kept per process.
+    """
+
+    def __init__(self, max_per_user=5, max_per_ip=20, window=900, max_keys=100_000):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()  # key -> deque of failure times, oldest key first
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, username, ip):
+        """Seconds until another attempt is allowed, or 0."""
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for key, limit in ((f'user:{username}', self.max_per_user), (f'ip:{ip}', self.max_per_ip)):
+                failures = self._recent(key, now)
+                if failures is not None and len(failures) >= limit:
+                    wait = max(wait, failures[-limit] + self.window - now)
+        return int(wait) + 1 if wait else 0
+
+    def failed(self, username, ip):
+        now = time.monotonic()
+        with self._lock:
+            for key in (f'user:{username}', f'ip:{ip}'):
+                # Only the latest `limit` failures decide the wait
+                failures = self._failures.pop(key, None) or deque(maxlen=max(self.max_per_user, self.max_per_ip))
+                failures.append(now)
+                self._failures[key] = failures  # most recently failed last
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def succeeded(self, username):
+        with self._lock:
+            self._failures.pop(f'user:{username}', None)
+
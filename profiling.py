@@ -0,0 +1,307 @@
+"""Opt-in request profiling (PROFILING=1).
+
+For every request this records, per endpoint, wall time, the number of SQL
+statements and the time spent in them (engine events), time spent
+serializing (``to_dict``, msgspec encoding and Flask-RESTful's JSON output)
+and the response size. Values go into HDR-style histograms served in the
+Prometheus text format at ``/metrics``.
+
+A request carrying ``X-Profile: <PROFILING_TOKEN>``, or a random
+PROFILING_SAMPLE_RATE fraction of all requests, also runs under cProfile and
+leaves a ``.prof`` dump in PROFILING_DIR (named in the ``X-Profile-Dump``
+response header).
+
+When profiling is off nothing is registered, so the only cost left in the
+request path is the ``serialization()`` context-variable lookup.
+"""
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import current_app, request, Response
+from sqlalchemy import event
+from werkzeug.local import LocalProxy
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_nothing = nullcontext()
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers in the manner of
+    HdrHistogram: each bucket is at most 1/2**precision_bits of its own
+    magnitude wide, so percentiles keep that relative accuracy (about 3% at
+    5 bits) from microseconds to minutes with a few hundred buckets."""
+
+    def __init__(self, precision_bits=5):
+        self.precision_bits = precision_bits
+        self.counts = {}  # (shift, top bits) -> count
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        value = max(int(value), 0)
+        shift = max(value.bit_length() - self.precision_bits - 1, 0)
+        key = (shift, value >> shift)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @staticmethod
+    def _upper(key):
+        shift, top = key
+        return ((top + 1) << shift) - 1
+
+    def percentile(self, q):
+        """Highest value equivalent to the ``q`` quantile (0 < q <= 1)."""
+        if not self.count:
+            return 0
+        target = q * self.count
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(self._upper(key), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """Counts of values <= each bound (a value counts against the bound
+        its bucket's upper edge falls under)."""
+        edges = sorted((self._upper(key), count) for key, count in self.counts.items())
+        result, seen, i = [], 0, 0
+        for bound in bounds:
+            while i < len(edges) and edges[i][0] <= bound:
+                seen += edges[i][1]
+                i += 1
+            result.append(seen)
+        return result
+
+
+class RequestProfile:
+    __slots__ = ('sql_count', 'sql_time', 'serialize_time', 'serializing')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+    @contextmanager
+    def serialization(self):
+        if self.serializing:  # nested, already being timed
+            yield
+            return
+        self.serializing = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.serialize_time += time.perf_counter() - start
+            self.serializing = False
+
+
+def serialization():
+    """Context manager timing serialization for the current request profile."""
+    profile = _current.get()
+    return profile.serialization() if profile is not None else _nothing
+
+
+class EndpointStats:
+    def __init__(self):
+        self.duration = Histogram()    # microseconds
+        self.sql_time = Histogram()    # microseconds
+        self.sql_count = Histogram()
+        self.serialize_time = Histogram()  # microseconds
+        self.size = Histogram()        # bytes
+        self.statuses = {}
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.stats = {}  # (endpoint, method) -> EndpointStats
+        self.token = None
+        self.sample_rate = 0.0
+        self.dump_dir = 'profiles'
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()  # one cProfile run at a time
+
+    def init_app(self, app, db, api=None, serializers=()):
+        self.token = app.config.get('PROFILING_TOKEN')
+        self.sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+        self.dump_dir = app.config.get('PROFILING_DIR', self.dump_dir)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.metrics)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        for cls in serializers:
+            cls.to_dict = self._timed(cls.to_dict)
+        if api is not None:
+            for mediatype, output in list(api.representations.items()):
+                api.representations[mediatype] = self._timed(output)
+        app.extensions['profiler'] = self
+
+    @staticmethod
+    def _timed(fn):
+        if getattr(fn, 'profiled', False):
+            # Wrapped for another app already; the wrapper times whichever
+            # request is current, so once is enough
+            return fn
+        def timed(*args, **kwargs):
+            with serialization():
+                return fn(*args, **kwargs)
+        timed.__name__ = fn.__name__
+        timed.__doc__ = fn.__doc__
+        timed.profiled = True
+        return timed
+
+    # SQL
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        starts = conn.info.get('profile_query_start')
+        if profile is not None and starts:
+            profile.sql_count += 1
+            profile.sql_time += time.perf_counter() - starts.pop()
+
+    # Request hooks
+
+    def _start(self):
+        environ = request.environ
+        environ['profiling.start'] = time.perf_counter()
+        environ['profiling.token'] = _current.set(RequestProfile())
+        wanted = (self.token and request.headers.get('X-Profile') == self.token
+                  or self.sample_rate and random.random() < self.sample_rate)
+        if wanted and self._profiling.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            environ['profiling.cprofile'] = profiler
+            profiler.enable()
+
+    def _finish(self, response):
+        environ = request.environ
+        start = environ.get('profiling.start')
+        profile = _current.get()
+        if start is None or profile is None:
+            return response
+        duration = time.perf_counter() - start
+
+        profiler = environ.pop('profiling.cprofile', None)
+        if profiler is not None:
+            profiler.disable()
+            self._profiling.release()
+            response.headers['X-Profile-Dump'] = self._dump(profiler)
+
+        size = response.calculate_content_length() if not response.is_streamed else None
+        key = (request.endpoint or 'unmatched', request.method)
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = EndpointStats()
+            stats.duration.record(duration * 1e6)
+            stats.sql_count.record(profile.sql_count)
+            stats.sql_time.record(profile.sql_time * 1e6)
+            stats.serialize_time.record(profile.serialize_time * 1e6)
+            if size is not None:
+                stats.size.record(size)
+            stats.statuses[response.status_code] = stats.statuses.get(response.status_code, 0) + 1
+        return response
+
+    def _teardown(self, exc):
+        environ = request.environ
+        profiler = environ.pop('profiling.cprofile', None)
+        if profiler is not None:  # _finish never ran
+            profiler.disable()
+            self._profiling.release()
+        token = environ.pop('profiling.token', None)
+        if token is not None:
+            _current.reset(token)
+
+    def _dump(self, profiler):
+        os.makedirs(self.dump_dir, exist_ok=True)
+        name = f'{request.endpoint or "unmatched"}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof'
+        profiler.dump_stats(os.path.join(self.dump_dir, name))
+        return name
+
+    # Prometheus exposition
+
+    def metrics(self):
+        lines = []
+        with self._lock:
+            items = sorted(self.stats.items())
+            lines += self._histogram('http_request_duration_seconds', 'Request wall time',
+                                     items, 'duration', DURATION_BUCKETS, 1e-6)
+            lines += self._summary('http_request_duration_quantile_seconds',
+                                   'Request wall time percentiles', items, 'duration', 1e-6)
+            lines += self._histogram('http_request_sql_statements', 'SQL statements per request',
+                                     items, 'sql_count', STATEMENT_BUCKETS, 1)
+            lines += self._histogram('http_request_sql_duration_seconds', 'Time in SQL per request',
+                                     items, 'sql_time', DURATION_BUCKETS, 1e-6)
+            lines += self._histogram('http_request_serialization_seconds', 'Time serializing per request',
+                                     items, 'serialize_time', DURATION_BUCKETS, 1e-6)
+            lines += self._histogram('http_response_size_bytes', 'Response body size',
+                                     items, 'size', SIZE_BUCKETS, 1)
+            lines += ['# HELP http_requests_total Requests by status',
+                      '# TYPE http_requests_total counter']
+            for (endpoint, method), stats in items:
+                for status, count in sorted(stats.statuses.items()):
+                    labels = _labels(endpoint=endpoint, method=method, status=status)
+                    lines.append(f'http_requests_total{{{labels}}} {count}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _histogram(name, help, items, attr, bounds, scale):
+        lines = [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+        for (endpoint, method), stats in items:
+            histogram = getattr(stats, attr)
+            labels = _labels(endpoint=endpoint, method=method)
+            cumulative = histogram.cumulative([bound / scale for bound in bounds])
+            for bound, count in zip(bounds, cumulative):
+                lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.total * scale:g}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return lines
+
+    @staticmethod
+    def _summary(name, help, items, attr, scale):
+        lines = [f'# HELP {name} {help}', f'# TYPE {name} summary']
+        for (endpoint, method), stats in items:
+            histogram = getattr(stats, attr)
+            labels = _labels(endpoint=endpoint, method=method)
+            for q in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {histogram.percentile(q) * scale:g}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.total * scale:g}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return lines
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+# The current app's profiler (see create_app)
+profiler = LocalProxy(lambda: current_app.extensions['profiler'])
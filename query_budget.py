@@ -0,0 +1,125 @@
+"""SQL statement budgets per endpoint.
+
+Runs every read and like endpoint against a throwaway SQLite database with
+enough related rows that an N+1 pattern would blow the budget, and exits
+non-zero if any endpoint issues more statements than it is allowed, or
+answers with an empty list and so proves nothing.
+
+Usage: python query_budget.py
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# (method, path) -> maximum number of SQL statements for one request
+QUERY_BUDGETS = {
+    # The user, their reviews with the cocktails, and those cocktails'
+    # ingredients and likes
+    ('GET', '/api/auth/status'): 4,
+    ('GET', '/api/cocktails'): 1,
+    ('GET', '/api/cocktails/1'): 4,
+    ('GET', '/api/cocktails?ids=1,2'): 4,
+    ('GET', '/api/cocktails/1/reviews'): 1,
+    # Includes loading the likes into the similar-cocktails index on first use
+    ('GET', '/api/cocktails/1/similar'): 3,
+    # Includes rebuilding the leaderboards on first use
+    ('GET', '/api/cocktails/trending'): 3,
+    ('GET', '/api/cocktails/top-rated'): 3,
+    ('POST', '/api/cocktails/1/like'): 4,
+    ('POST', '/api/cocktails/1/unlike'): 4,
+}
+
+FIXTURE_USERS = 25
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect every statement executed on ``engine`` inside the block."""
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._record)
+
+
+def populate(db):
+    from models import User, Cocktail, Ingredient, CocktailIngredient, Review, reconcile_aggregates
+
+    db.create_all()
+    users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(FIXTURE_USERS)]
+    users[0].set_password('password')
+    cocktail = Cocktail(name='Mojito', instructions='Muddle and build.', glass_type='Highball Glass')
+    # Liked by some of the same users, so the similar-cocktails list is not empty
+    other = Cocktail(name='Daiquiri', instructions='Shake and strain.', glass_type='Coupe')
+    db.session.add_all(users + [cocktail, other])
+    for i in range(FIXTURE_USERS):
+        ingredient = Ingredient(name=f'Ingredient {i}')
+        db.session.add(CocktailIngredient(cocktail=cocktail, ingredient=ingredient, amount='1 oz'))
+        db.session.add(Review(content='Nice', rating=4, user=users[i], cocktail=cocktail))
+    cocktail.likes.extend(users[1:])
+    other.likes.extend(users[1:FIXTURE_USERS // 2])
+    db.session.commit()
+    # The rows above bypass the write paths that keep the counters in step,
+    # and top-rated only lists cocktails with reviews counted
+    reconcile_aggregates()
+
+
+def check_budgets():
+    from app import app
+    from config import db
+
+    with app.app_context():
+        populate(db)
+        engine = db.engine
+
+    failures = []
+    for serializer in ('msgspec', 'legacy'):
+        app.config['SERIALIZER'] = serializer
+        client = app.test_client()
+        client.post('/api/login', json={'username': 'user0', 'password': 'password'})
+        for (method, path), budget in QUERY_BUDGETS.items():
+            with count_queries(engine) as counter:
+                response = client.open(path, method=method)
+            # An empty list passes any budget without exercising the query
+            empty = method == 'GET' and response.is_json and response.get_json() == []
+            status = 'ok' if counter.count <= budget else 'OVER BUDGET'
+            if empty:
+                status += ' (EMPTY)'
+            print(f'[{serializer:<7}] {method:<4} {path:<32} {response.status_code} '
+                  f'{counter.count:>3}/{budget:<3} {status}')
+            if response.status_code >= 500 or counter.count > budget or empty:
+                failures.append((serializer, method, path, counter.statements))
+
+    for serializer, method, path, statements in failures:
+        print(f'\n{method} {path} ({serializer}) issued:', file=sys.stderr)
+        for statement in statements:
+            print('  ' + ' '.join(statement.split()), file=sys.stderr)
+    return not failures
+
+
+if __name__ == '__main__':
+    tmpdir = tempfile.mkdtemp(prefix='cocktail-queries-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'budget.db')
+    # Budgets are for the queries a request issues, not for cache hits
+    os.environ['RESPONSE_CACHE'] = 'none'
+    # ... nor for loading server-side sessions, so sessions ride in cookies
+    # signed with a throwaway key
+    os.environ['SESSION_BACKEND'] = 'cookie'
+    os.environ['SECRET_KEY'] = os.urandom(16).hex()
+    sys.exit(0 if check_budgets() else 1)
@@ -0,0 +1,198 @@
+"""Response cache for read endpoints.
+
+Cached responses are keyed by endpoint, view arguments and query string,
+plus the current generation of every tag the endpoint depends on (for
+example ``cocktail:3``). Write handlers call ``invalidate()`` with the tags
+they touched, which replaces those generations with fresh random tokens;
+older entries are never read again and age out of the backend. Generations
+are stored without expiry and kept out of the LRU's eviction, and one that
+goes missing anyway is replaced by a fresh token rather than a default, so
+a lost generation can only cause misses, never resurrect a stale entry.
+Because generations live in the backend itself, invalidation also reaches
+other processes sharing a cachelib backend. The in-process LRU backend's
+invalidation is local to its process: under several worker processes a
+write handled by one leaves the others' entries in place, so every LRU
+entry also expires ``timeout`` seconds (RESPONSE_CACHE_TIMEOUT) after it
+was stored, bounding how stale another worker's copy can get.
+
+Every cached response carries a strong ETag and a Last-Modified date and is
+made conditional, so revalidating clients get a 304 instead of the body.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, request, Response
+from werkzeug.local import LocalProxy
+
+# Response headers worth replaying from the cache
+CACHED_HEADERS = ('Content-Type', 'Link', 'X-Next-Cursor', 'X-Search-Order', 'X-Total-Count')
+
+
+def new_generation():
+    return uuid.uuid4().hex
+
+
+class LRUBackend:
+    """Bounded in-process cache; the least recently used entry is evicted,
+    and any entry expires ``timeout`` seconds after it was stored."""
+
+    def __init__(self, maxsize=1024, timeout=300):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._generations = {}  # never evicted
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.setdefault(key, new_generation())
+
+    def bump(self, key):
+        with self._lock:
+            self._generations[key] = new_generation()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generations.clear()
+
+
+class CachelibBackend:
+    """Adapter for any cachelib cache (FileSystemCache, RedisCache, ...)."""
+
+    evictions = None  # cachelib does not report evictions
+
+    def __init__(self, cache, timeout=300):
+        self.cache = cache
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.timeout)
+
+    def generation(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            # add() keeps a token another process stored first
+            token = new_generation()
+            self.cache.add(key, token, timeout=0)
+            value = self.cache.get(key) or token
+        return value
+
+    def bump(self, key):
+        self.cache.set(key, new_generation(), timeout=0)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.tag_functions = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def init_app(self, app, backend):
+        self.backend = backend
+        app.before_request(self._lookup)
+        app.after_request(self._store)
+        app.extensions['response_cache'] = self
+
+    def register(self, endpoint, tags):
+        """Cache GET responses of ``endpoint``; ``tags(**view_args)`` names
+        the data the response is built from."""
+        self.tag_functions[endpoint] = tags
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.bump(f'gen:{tag}')
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.backend.evictions if self.backend is not None else None,
+        }
+
+    def _key(self):
+        tags = self.tag_functions.get(request.endpoint)
+        if self.backend is None or tags is None or request.method != 'GET':
+            return None
+        if 'no-cache' in request.headers.get('Cache-Control', ''):
+            return None
+        view_args = request.view_args or {}
+        generations = ','.join(
+            f'{tag}={self.backend.generation(f"gen:{tag}")}' for tag in tags(**view_args)
+        )
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        accept = request.accept_mimetypes.best or ''
+        return f'response:{request.endpoint}:{sorted(view_args.items())}:{args}:{accept}:{generations}'
+
+    def _lookup(self):
+        key = self._key()
+        if key is None:
+            return None
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            # Picked up by _store once the view has produced the response
+            request.environ['response_cache.key'] = key
+            return None
+        self.hits += 1
+        body, status, headers, etag, last_modified = entry
+        response = Response(body, status=status, headers=headers)
+        return self._conditional(response, etag, last_modified)
+
+    def _store(self, response):
+        key = request.environ.pop('response_cache.key', None)
+        if key is None or response.status_code != 200 or response.is_streamed:
+            return response
+        body = response.get_data()
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        last_modified = int(time.time())
+        headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+        self.backend.set(key, (body, response.status_code, headers, etag, last_modified))
+        self.stores += 1
+        return self._conditional(response, etag, last_modified)
+
+    @staticmethod
+    def _conditional(response, etag, last_modified):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+
+# The current app's cache (see create_app)
+response_cache = LocalProxy(lambda: current_app.extensions['response_cache'])
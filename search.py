@@ -0,0 +1,241 @@
+"""Full-text search over cocktail names, instructions, glass types and
+ingredient names.
+
+SQLite uses an FTS5 table (``cocktail_search``, rowid = cocktail id) ranked
+with BM25; PostgreSQL uses a tsvector table with a GIN index ranked with
+ts_rank_cd. On both, triggers on cocktails, cocktail_ingredients and
+ingredients keep the index in step with every write, including the Core
+bulk statements used for recipes, so no application code has to remember
+to reindex.
+"""
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event, func, select, bindparam, literal_column, table, column
+
+from config import db
+from models import Cocktail
+
+# Relative weight of each indexed column: name, instructions, glass_type, ingredients
+BM25_WEIGHTS = (10.0, 1.0, 2.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SQLITE_INGREDIENTS = (
+    "(SELECT group_concat(i.name, ' ') FROM cocktail_ingredients ci "
+    "JOIN ingredients i ON i.id = ci.ingredient_id WHERE ci.cocktail_id = {id})"
+)
+
+def _sqlite_reindex(id_expr):
+    return (
+        f"DELETE FROM cocktail_search WHERE rowid = {id_expr}; "
+        f"INSERT INTO cocktail_search(rowid, name, instructions, glass_type, ingredients) "
+        f"SELECT c.id, c.name, c.instructions, c.glass_type, {_SQLITE_INGREDIENTS.format(id='c.id')} "
+        f"FROM cocktails c WHERE c.id = {id_expr};"
+    )
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cocktail_search USING fts5("
+    "name, instructions, glass_type, ingredients, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3 4 5')",
+    "INSERT INTO cocktail_search(cocktail_search, rank) VALUES ('rank', 'bm25({})')".format(
+        ', '.join(str(weight) for weight in BM25_WEIGHTS)),
+    f"CREATE TRIGGER IF NOT EXISTS cocktail_search_cocktail_insert AFTER INSERT ON cocktails "
+    f"BEGIN {_sqlite_reindex('new.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS cocktail_search_cocktail_update "
+    f"AFTER UPDATE OF name, instructions, glass_type ON cocktails "
+    f"BEGIN {_sqlite_reindex('new.id')} END",
+    "CREATE TRIGGER IF NOT EXISTS cocktail_search_cocktail_delete AFTER DELETE ON cocktails "
+    "BEGIN DELETE FROM cocktail_search WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS cocktail_search_recipe_insert AFTER INSERT ON cocktail_ingredients "
+    f"BEGIN {_sqlite_reindex('new.cocktail_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS cocktail_search_recipe_update "
+    f"AFTER UPDATE OF cocktail_id, ingredient_id ON cocktail_ingredients "
+    f"BEGIN {_sqlite_reindex('old.cocktail_id')} {_sqlite_reindex('new.cocktail_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS cocktail_search_recipe_delete AFTER DELETE ON cocktail_ingredients "
+    f"BEGIN {_sqlite_reindex('old.cocktail_id')} END",
+    "CREATE TRIGGER IF NOT EXISTS cocktail_search_ingredient_rename AFTER UPDATE OF name ON ingredients "
+    "BEGIN "
+    "DELETE FROM cocktail_search WHERE rowid IN "
+    "(SELECT cocktail_id FROM cocktail_ingredients WHERE ingredient_id = new.id); "
+    "INSERT INTO cocktail_search(rowid, name, instructions, glass_type, ingredients) "
+    f"SELECT c.id, c.name, c.instructions, c.glass_type, {_SQLITE_INGREDIENTS.format(id='c.id')} "
+    "FROM cocktails c WHERE c.id IN "
+    "(SELECT cocktail_id FROM cocktail_ingredients WHERE ingredient_id = new.id); "
+    "END",
+    # Index whatever is already in the catalog
+    "INSERT INTO cocktail_search(rowid, name, instructions, glass_type, ingredients) "
+    f"SELECT c.id, c.name, c.instructions, c.glass_type, {_SQLITE_INGREDIENTS.format(id='c.id')} "
+    "FROM cocktails c WHERE c.id NOT IN (SELECT rowid FROM cocktail_search)",
+]
+
+POSTGRES_DDL = [
+    "CREATE TABLE IF NOT EXISTS cocktail_search ("
+    "cocktail_id INTEGER PRIMARY KEY REFERENCES cocktails (id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_cocktail_search_document ON cocktail_search USING GIN (document)",
+    """
+    CREATE OR REPLACE FUNCTION cocktail_search_refresh(target INTEGER) RETURNS VOID AS $$
+    BEGIN
+        INSERT INTO cocktail_search (cocktail_id, document)
+        SELECT c.id,
+               setweight(to_tsvector('simple', coalesce(c.name, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce(
+                   (SELECT string_agg(i.name, ' ') FROM cocktail_ingredients ci
+                    JOIN ingredients i ON i.id = ci.ingredient_id
+                    WHERE ci.cocktail_id = c.id), '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(c.glass_type, '')), 'C') ||
+               setweight(to_tsvector('simple', coalesce(c.instructions, '')), 'D')
+        FROM cocktails c WHERE c.id = target
+        ON CONFLICT (cocktail_id) DO UPDATE SET document = EXCLUDED.document;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION cocktail_search_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'cocktails' THEN
+            PERFORM cocktail_search_refresh(NEW.id);
+        ELSIF TG_TABLE_NAME = 'ingredients' THEN
+            PERFORM cocktail_search_refresh(ci.cocktail_id)
+            FROM cocktail_ingredients ci WHERE ci.ingredient_id = NEW.id;
+        ELSE
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM cocktail_search_refresh(OLD.cocktail_id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM cocktail_search_refresh(NEW.cocktail_id);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS cocktail_search_cocktails ON cocktails",
+    "CREATE TRIGGER cocktail_search_cocktails AFTER INSERT OR UPDATE OF name, instructions, glass_type "
+    "ON cocktails FOR EACH ROW EXECUTE FUNCTION cocktail_search_trigger()",
+    "DROP TRIGGER IF EXISTS cocktail_search_recipes ON cocktail_ingredients",
+    "CREATE TRIGGER cocktail_search_recipes AFTER INSERT OR UPDATE OR DELETE "
+    "ON cocktail_ingredients FOR EACH ROW EXECUTE FUNCTION cocktail_search_trigger()",
+    "DROP TRIGGER IF EXISTS cocktail_search_ingredients ON ingredients",
+    "CREATE TRIGGER cocktail_search_ingredients AFTER UPDATE OF name "
+    "ON ingredients FOR EACH ROW EXECUTE FUNCTION cocktail_search_trigger()",
+    "SELECT cocktail_search_refresh(id) FROM cocktails",
+]
+
+SEARCH_DDL = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}
+
+SEARCH_TRIGGERS = {
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS cocktail_search_cocktail_insert",
+        "DROP TRIGGER IF EXISTS cocktail_search_cocktail_update",
+        "DROP TRIGGER IF EXISTS cocktail_search_cocktail_delete",
+        "DROP TRIGGER IF EXISTS cocktail_search_recipe_insert",
+        "DROP TRIGGER IF EXISTS cocktail_search_recipe_update",
+        "DROP TRIGGER IF EXISTS cocktail_search_recipe_delete",
+        "DROP TRIGGER IF EXISTS cocktail_search_ingredient_rename",
+    ],
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS cocktail_search_cocktails ON cocktails",
+        "DROP TRIGGER IF EXISTS cocktail_search_recipes ON cocktail_ingredients",
+        "DROP TRIGGER IF EXISTS cocktail_search_ingredients ON ingredients",
+    ],
+}
+
+
+def install_search_index(connection):
+    """Create the search table, its sync triggers, and index existing rows."""
+    for statement in SEARCH_DDL.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+@contextmanager
+def search_index_rebuilt(connection):
+    """Bulk-load mode: the sync triggers are dropped (they reindex a cocktail
+    once per inserted recipe row) and the index emptied, then triggers and
+    index are rebuilt in one pass when the block exits. Run it inside the
+    transaction doing the load so a failure rolls the triggers back too."""
+    dialect = connection.dialect.name
+    if dialect not in SEARCH_DDL:
+        yield
+        return
+    for statement in SEARCH_TRIGGERS[dialect]:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql("DELETE FROM cocktail_search")
+    yield
+    install_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _install_after_create_all(target, connection, **kw):
+    # db.create_all() (scratch databases, benchmarks) gets the index too;
+    # migrated databases get it from the migration.
+    install_search_index(connection)
+
+
+def tokenize(q):
+    return TOKEN_RE.findall(q.lower())
+
+
+def fts5_query(tokens, prefix):
+    # Quote every term so words like AND / NEAR are not read as FTS5 operators
+    terms = [f'"{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def tsquery(tokens, prefix):
+    terms = list(tokens)
+    if prefix:
+        terms[-1] += ':*'
+    return ' & '.join(terms)
+
+
+def search_cocktails(q, columns, limit, offset=0, prefix=True, rank_window=1000):
+    """``(rows, ranked)``: rows of ``columns`` for cocktails matching every
+    term of ``q``, best match first. With ``prefix`` the last term also
+    matches any word it starts, for typeahead.
+
+    Ranking costs time proportional to the number of matches (about 200 ms
+    for a two-letter prefix matching 70k of 100k cocktails), so a very broad
+    query (more than ``rank_window`` hits) is returned in catalog order
+    instead, which the index can stream without scoring every match;
+    ``ranked`` is then False. The same query falls back on every page, so
+    paging stays consistent.
+    """
+    tokens = tokenize(q)
+    if not tokens:
+        return [], True
+    q = bindparam('q')
+    if db.session.get_bind().dialect.name == 'postgresql':
+        index = table('cocktail_search', column('cocktail_id'), column('document'))
+        doc_id = index.c.cocktail_id
+        query = func.to_tsquery('simple', q)
+        match = index.c.document.op('@@')(query)
+        score = -func.ts_rank_cd(index.c.document, query)
+        params = {'q': tsquery(tokens, prefix)}
+    else:
+        index = table('cocktail_search', column('rowid'))
+        doc_id = index.c.rowid
+        match = literal_column('cocktail_search').op('MATCH')(q)
+        score = literal_column('rank')  # bm25() with BM25_WEIGHTS, configured on the table
+        params = {'q': fts5_query(tokens, prefix)}
+
+    probe = select(doc_id).where(match).limit(rank_window + 1)
+    ranked = len(db.session.execute(probe, params).all()) <= rank_window
+    if ranked:
+        order = (score, doc_id)
+    else:
+        score, order = doc_id, (doc_id,)
+
+    hits = (select(doc_id.label('id'), score.label('score'))
+            .where(match)
+            .order_by(*order)
+            .limit(limit)
+            .offset(offset)
+            .subquery())
+    stmt = (select(*columns)
+            .join_from(Cocktail, hits, hits.c.id == Cocktail.id)
+            .order_by(hits.c.score, hits.c.id))
+    return db.session.execute(stmt, params).all(), ranked
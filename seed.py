@@ -1,6 +1,14 @@
+import argparse
+import itertools
 import logging
-from config import app, db
-from models import User, Cocktail, Ingredient, CocktailIngredient, Review
+import random
+from sqlalchemy import select, insert, delete, func
+from app import create_app
+from config import db
+from models import (User, Cocktail, Ingredient, CocktailIngredient, Review, likes,
+                    add_cocktail_ingredients, resolve_ingredients, parse_ingredient,
+                    password_hasher)
+from search import search_index_rebuilt
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,6 +55,7 @@ def seed_data():
             # Add more cocktails here as needed
         ]
 
+        ingredient_rows = []
         for cocktail_data in cocktails:
             cocktail = Cocktail(
                 id=cocktail_data['id'],
@@ -58,23 +67,13 @@ def seed_data():
             db.session.add(cocktail)
             logger.debug(f"Added cocktail: {cocktail.name}")
 
-            # Add ingredients
             for ingredient_str in cocktail_data['ingredients']:
-                parts = ingredient_str.split(' ', 1)
-                amount = parts[0] if len(parts) > 1 else ''
-                name = parts[1] if len(parts) > 1 else parts[0]
-                
-                ingredient = Ingredient.query.filter_by(name=name).first()
-                if not ingredient:
-                    ingredient = Ingredient(name=name)
-                    db.session.add(ingredient)
-                
-                cocktail_ingredient = CocktailIngredient(
-                    cocktail=cocktail,
-                    ingredient=ingredient,
-                    amount=amount
-                )
-                db.session.add(cocktail_ingredient)
+                name, amount = parse_ingredient(ingredient_str)
+                ingredient_rows.append((cocktail.id, name, amount))
+
+        # Resolve every ingredient name at once and bulk-insert the amounts
+        db.session.flush()
+        add_cocktail_ingredients(ingredient_rows)
 
         db.session.commit()
         logger.info("Cocktail data seeded successfully!")
@@ -83,7 +82,118 @@ def seed_data():
         db.session.rollback()
         logger.error(f"An error occurred while seeding data: {e}")
 
+# Building blocks for synthetic catalogs
+SYLLABLES = ['ma', 'ri', 'ta', 'mo', 'ji', 'to', 'ne', 'gro', 'ni', 'sour', 'fizz', 'lime', 'rum',
+             'gin', 'bit', 'ter', 'sweet', 'ver', 'mouth', 'sy', 'rup', 'mint', 'co', 'la', 'da']
+GLASSES = ['Highball Glass', 'Coupe', 'Rocks Glass', 'Martini Glass', 'Collins Glass', 'Tiki Mug']
+VERBS = ['Shake', 'Stir', 'Build', 'Muddle', 'Blend', 'Strain', 'Garnish', 'Top', 'Float', 'Rinse']
+UNITS = ['oz', 'tsp', 'dash', 'barspoon', 'ml']
+# Reviews skew positive, as they do on real recipe sites
+RATING_WEIGHTS = [5, 8, 17, 35, 35]
+SEED_USER_PREFIX = 'seeduser'
+SEED_PASSWORD = 'password'
+BATCH_SIZE = 10000
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+def zipf_weights(n, exponent=1.0):
+    """Popularity weights for ranks 1..n; a few items get most of the traffic."""
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, n + 1)))
+
+def insert_batches(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+def seed_scaled(n, seed=1, reviews_per_cocktail=5, likes_per_cocktail=10):
+    """Replace the catalog with ``n`` synthetic cocktails plus ``n`` users
+    and about ``reviews_per_cocktail`` reviews and ``likes_per_cocktail``
+    likes per cocktail, spread over cocktails and users with Zipf-like
+    popularity. Rows are written with multi-row Core inserts, the
+    denormalized counters are computed up front, and the search index is
+    rebuilt once at the end instead of by trigger for every row.
+
+    Every seeded user is named seeduser<N> and has the password "password".
+    """
+    rng = random.Random(seed)
+    logger.info(f"Seeding {n} synthetic cocktails...")
+
+    names = set()
+    while len(names) < max(50, n // 20):
+        names.add(f'{word(rng).title()} {word(rng)}')
+    ingredient_ids = list(resolve_ingredients(sorted(names)).values())
+
+    # One bcrypt hash shared by every seeded user; hashing n passwords would
+    # take n * ~250 ms
+    password_hash = password_hasher.hash(SEED_PASSWORD)
+    first_user = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    user_ids = list(range(first_user, first_user + n))
+    users = [{'id': user_id, 'username': f'{SEED_USER_PREFIX}{user_id}',
+              'email': f'{SEED_USER_PREFIX}{user_id}@example.com', 'password_hash': password_hash}
+             for user_id in user_ids]
+
+    cocktail_ids = list(range(1, n + 1))
+    cocktail_weights = zipf_weights(n)
+    user_weights = zipf_weights(n, exponent=0.8)
+    ingredient_weights = zipf_weights(len(ingredient_ids))
+
+    reviews = []
+    review_count = dict.fromkeys(cocktail_ids, 0)
+    rating_sum = dict.fromkeys(cocktail_ids, 0)
+    k = n * reviews_per_cocktail
+    for cocktail_id, user_id, rating in zip(rng.choices(cocktail_ids, cum_weights=cocktail_weights, k=k),
+                                            rng.choices(user_ids, cum_weights=user_weights, k=k),
+                                            rng.choices(range(1, 6), RATING_WEIGHTS, k=k)):
+        reviews.append({'content': f'{rng.choice(VERBS)}s nicely, {word(rng)} finish.',
+                        'rating': rating, 'user_id': user_id, 'cocktail_id': cocktail_id})
+        review_count[cocktail_id] += 1
+        rating_sum[cocktail_id] += rating
+
+    k = n * likes_per_cocktail
+    liked = set(zip(rng.choices(user_ids, cum_weights=user_weights, k=k),
+                    rng.choices(cocktail_ids, cum_weights=cocktail_weights, k=k)))
+    like_count = dict.fromkeys(cocktail_ids, 0)
+    for _, cocktail_id in liked:
+        like_count[cocktail_id] += 1
+
+    cocktails = [{'id': cocktail_id,
+                  'name': f'{word(rng).title()} {word(rng).title()}',
+                  'instructions': ' '.join(f'{rng.choice(VERBS)} with {word(rng)}.'
+                                           for _ in range(rng.randint(2, 5))),
+                  'image_url': f'/static/cocktails/{cocktail_id}.jpeg',
+                  'glass_type': rng.choice(GLASSES),
+                  'like_count': like_count[cocktail_id],
+                  'review_count': review_count[cocktail_id],
+                  'rating_sum': rating_sum[cocktail_id]}
+                 for cocktail_id in cocktail_ids]
+    recipes = [{'cocktail_id': cocktail_id, 'ingredient_id': ingredient_id,
+                'amount': f'{rng.randint(1, 4)} {rng.choice(UNITS)}'}
+               for cocktail_id in cocktail_ids
+               for ingredient_id in set(rng.choices(ingredient_ids, cum_weights=ingredient_weights,
+                                                    k=rng.randint(3, 8)))]
+
+    with search_index_rebuilt(db.session.connection()):
+        db.session.execute(delete(likes))
+        db.session.execute(delete(Review.__table__))
+        db.session.execute(delete(CocktailIngredient.__table__))
+        db.session.execute(delete(Cocktail.__table__))
+        db.session.execute(delete(User.__table__).where(User.username.startswith(SEED_USER_PREFIX)))
+        insert_batches(User.__table__, users)
+        insert_batches(Cocktail.__table__, cocktails)
+        insert_batches(CocktailIngredient.__table__, recipes)
+        insert_batches(Review.__table__, reviews)
+        insert_batches(likes, [{'user_id': user_id, 'cocktail_id': cocktail_id} for user_id, cocktail_id in liked])
+    db.session.commit()
+    logger.info(f"Seeded {n} cocktails, {n} users, {len(reviews)} reviews and {len(liked)} likes.")
+
 if __name__ == "__main__":
-    with app.app_context():
-        seed_data()
-        print("Cocktail data seeded successfully!")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed the cocktail database.")
+    parser.add_argument('--scale', type=int, help="generate N synthetic cocktails, users, reviews and likes")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for --scale")
+    args = parser.parse_args()
+    with create_app().app_context():
+        if args.scale:
+            seed_scaled(args.scale, seed=args.seed)
+        else:
+            seed_data()
+            print("Cocktail data seeded successfully!")
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""Session storage backends.
+
+SESSION_BACKEND selects one of:
+
+* ``cookie`` - Flask's signed cookie. Nothing is stored server side; the
+  cookie carries the (small) session itself, so SECRET_KEY must be set.
+* ``sqlalchemy`` (default) - the ``sessions`` table. Reads ignore expired rows, which
+  are deleted in batches by an occasional sweep (and ``flask sweep-sessions``).
+* ``redis`` - any server speaking the Redis protocol, with expiry handled by
+  the server's TTLs.
+
+Both server-side backends build on Flask-Session's ServerSideSessionInterface,
+so cookies, session ids and serialization behave as before.
+"""
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, unquote
+
+from flask import g
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from flask_session.defaults import Defaults
+from sqlalchemy import select, update, delete, insert
+
+from config import db
+from models import sessions
+
+
+def utcnow():
+    # Naive UTC, matching the DateTime column
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def upsert_session(connection, session_id, data, expiry):
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(sessions).values(session_id=session_id, data=data, expiry=expiry)
+        stmt = stmt.on_conflict_do_update(index_elements=['session_id'],
+                                          set_={'data': data, 'expiry': expiry})
+        connection.execute(stmt)
+        return
+    result = connection.execute(update(sessions)
+                                .where(sessions.c.session_id == session_id)
+                                .values(data=data, expiry=expiry))
+    if not result.rowcount:
+        connection.execute(insert(sessions).values(session_id=session_id, data=data, expiry=expiry))
+
+
+class SqlSessionInterface(ServerSideSessionInterface):
+    """Sessions in the ``sessions`` table.
+
+    Statements run on their own connection, so loading or saving a session
+    never commits (or rolls back) work pending on ``db.session``. An
+    unmodified session is only written back once more than half of its
+    lifetime has passed, instead of on every request.
+    """
+
+    session_class = ServerSideSession
+    ttl = False
+
+    def __init__(self, app, sweep_batch=1000, **kwargs):
+        self.sweep_batch = sweep_batch
+        super().__init__(app, **kwargs)
+
+    def _retrieve_session_data(self, store_id):
+        stmt = (select(sessions.c.data, sessions.c.expiry)
+                .where(sessions.c.session_id == store_id, sessions.c.expiry > utcnow()))
+        with db.engine.connect() as connection:
+            row = connection.execute(stmt).first()
+        if row is None:
+            return None
+        g.session_expiry = row.expiry
+        return self.serializer.decode(row.data)
+
+    def _delete_session(self, store_id):
+        with db.engine.begin() as connection:
+            connection.execute(delete(sessions).where(sessions.c.session_id == store_id))
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        data = self.serializer.encode(session)
+        with db.engine.begin() as connection:
+            upsert_session(connection, store_id, data, utcnow() + session_lifetime)
+
+    def should_set_storage(self, app, session):
+        if session.modified:
+            return True
+        if not app.config['SESSION_REFRESH_EACH_REQUEST']:
+            return False
+        expiry = g.get('session_expiry')
+        return expiry is None or expiry - utcnow() < app.permanent_session_lifetime / 2
+
+    def _delete_expired_sessions(self):
+        """Delete expired sessions ``sweep_batch`` rows per transaction, so a
+        large backlog never holds the write lock for long. Returns the count."""
+        expired = (select(sessions.c.session_id)
+                   .where(sessions.c.expiry <= utcnow())
+                   .limit(self.sweep_batch))
+        stmt = delete(sessions).where(sessions.c.session_id.in_(expired.scalar_subquery()))
+        total = 0
+        while True:
+            with db.engine.begin() as connection:
+                deleted = connection.execute(stmt).rowcount
+            total += deleted
+            if deleted < self.sweep_batch:
+                return total
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class RespClient:
+    """Minimal Redis protocol (RESP2) client covering what session storage
+    needs. Its get/set/delete take the same arguments as redis-py's, so a
+    ``redis.Redis`` client can be used in its place."""
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        parts = urlparse(url)
+        return cls(host=parts.hostname or 'localhost',
+                   port=parts.port or 6379,
+                   db=int(parts.path.lstrip('/') or 0),
+                   password=unquote(parts.password) if parts.password else None,
+                   **kwargs)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.reader.close()
+            sock.close()
+            self._local.sock = None
+
+    @staticmethod
+    def _encode(args):
+        out = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(out)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RespError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            return self._local.reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f'Unexpected reply: {line!r}')
+
+    def _call(self, *args):
+        self._local.sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def execute(self, *args):
+        # One connection per thread; reconnect once if it has gone away
+        for attempt in (1, 2):
+            if getattr(self._local, 'sock', None) is None:
+                self._connect()
+            try:
+                return self._call(*args)
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt == 2:
+                    raise
+
+    def get(self, name):
+        return self.execute('GET', name)
+
+    def set(self, name, value, ex=None):
+        args = ['SET', name, value]
+        if ex is not None:
+            args += ['EX', int(ex.total_seconds()) if isinstance(ex, timedelta) else int(ex)]
+        return self.execute(*args) == 'OK'
+
+    def delete(self, *names):
+        return self.execute('DEL', *names)
+
+    def ping(self):
+        return self.execute('PING') == 'PONG'
+
+
+class RedisSessionInterface(ServerSideSessionInterface):
+    """Sessions in a Redis-protocol server; the server expires them."""
+
+    session_class = ServerSideSession
+    ttl = True
+
+    def __init__(self, app, client, **kwargs):
+        self.client = client
+        super().__init__(app, **kwargs)
+
+    def _retrieve_session_data(self, store_id):
+        data = self.client.get(store_id)
+        return self.serializer.decode(data) if data else None
+
+    def _delete_session(self, store_id):
+        self.client.delete(store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        ttl = max(int(session_lifetime.total_seconds()), 1)
+        self.client.set(store_id, self.serializer.encode(session), ex=ttl)
+
+
+def init_session(app):
+    """Install the session interface selected by SESSION_BACKEND."""
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+        return  # Flask's default SecureCookieSessionInterface
+    options = dict(
+        key_prefix=app.config.get('SESSION_KEY_PREFIX', Defaults.SESSION_KEY_PREFIX),
+        use_signer=app.config.get('SESSION_USE_SIGNER', Defaults.SESSION_USE_SIGNER),
+        permanent=app.config.get('SESSION_PERMANENT', Defaults.SESSION_PERMANENT),
+        serialization_format=app.config.get('SESSION_SERIALIZATION_FORMAT',
+                                            Defaults.SESSION_SERIALIZATION_FORMAT),
+    )
+    app.config.setdefault('SESSION_REFRESH_EACH_REQUEST', True)
+    if backend == 'sqlalchemy':
+        app.session_interface = SqlSessionInterface(
+            app,
+            sweep_batch=app.config['SESSION_SWEEP_BATCH'],
+            cleanup_n_requests=app.config['SESSION_CLEANUP_N_REQUESTS'],
+            **options,
+        )
+    elif backend == 'redis':
+        client = app.config.get('SESSION_REDIS') or RespClient.from_url(app.config['SESSION_REDIS_URL'])
+        app.session_interface = RedisSessionInterface(app, client, **options)
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND: {backend!r}')
@@ -0,0 +1,245 @@
+"""In-process "users who liked this also liked" index.
+
+Two cocktails are similar when the same users liked both. The index keeps
+each cocktail's ``k`` most co-liked neighbours in two flat ``array('i')``
+tables (neighbour ids and co-like counts, ``k`` slots per cocktail id), so a
+lookup reads one fixed-size slice.
+
+A full build groups the likes table by user and by cocktail, then counts
+each cocktail's co-likes by feeding its likers' liked arrays to a Counter,
+which does the counting in C. The work is the sum of squared likes per
+user; about 8 s for 400k likes on one core. Users who liked more than
+``max_user_likes`` cocktails are left out of the counts: they say little
+about any one pair and would dominate the cost.
+
+Like and unlike events update the affected rows in place. A like raises
+the pair counts for every other cocktail the user likes, re-checking
+candidates against each row's weakest entry. An unlike lowers counts
+already in a row, so a neighbour that should move up into the top ``k``
+only shows up after a rebuild, as do users crossing ``max_user_likes``.
+Other worker processes' likes are also only picked up by a rebuild. The
+index is rebuilt in a background thread once it is older than
+``max_age`` seconds, and lookups keep using the old tables meanwhile.
+"""
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import select
+from werkzeug.local import LocalProxy
+
+from config import db
+from models import likes
+
+
+class SimilarIndex:
+    def __init__(self, k=20, max_user_likes=500, max_age=None):
+        self.k = k
+        self.max_user_likes = max_user_likes
+        self.max_age = max_age
+        self.app = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._rebuilding = False
+        self._replay = []             # like events seen while rebuilding
+        self.likers = {}              # cocktail id -> set of user ids
+        self.liked = {}               # user id -> set of cocktail ids
+        self.neighbours = array('i')  # k slots per cocktail id, 0 = empty
+        self.scores = array('i')      # co-like count of each slot
+
+    def init_app(self, app):
+        self.app = app
+        self.k = app.config.get('SIMILAR_TOP_K', self.k)
+        self.max_user_likes = app.config.get('SIMILAR_MAX_USER_LIKES', self.max_user_likes)
+        self.max_age = app.config.get('SIMILAR_INDEX_MAX_AGE', self.max_age)
+        app.extensions['similar_index'] = self
+
+    def build(self, pairs):
+        """Replace the index with (user id, cocktail id) like ``pairs``."""
+        likers, liked = {}, {}
+        for user_id, cocktail_id in pairs:
+            likers.setdefault(cocktail_id, set()).add(user_id)
+            liked.setdefault(user_id, set()).add(cocktail_id)
+        # Counter counts ints read from an array faster than from a set
+        counted = {user_id: array('i', cocktail_ids) for user_id, cocktail_ids in liked.items()
+                   if len(cocktail_ids) <= self.max_user_likes}
+        uncounted = array('i')
+
+        k = self.k
+        size = max(likers, default=0) + 1
+        neighbours = array('i', bytes(4 * k * size))
+        scores = array('i', bytes(4 * k * size))
+        for cocktail_id, user_ids in likers.items():
+            counts = Counter(chain.from_iterable([counted.get(user_id, uncounted) for user_id in user_ids]))
+            counts.pop(cocktail_id, None)
+            if len(counts) > k:
+                # Comparing bare counts keeps the heap in C; only the k-th
+                # count's ties need sorting by id
+                threshold = heapq.nlargest(k, counts.values())[-1]
+                top = [item for item in counts.items() if item[1] >= threshold]
+            else:
+                top = list(counts.items())
+            top.sort(key=lambda item: (-item[1], item[0]))
+            del top[k:]
+            start = cocktail_id * k
+            for i, (neighbour_id, score) in enumerate(top):
+                neighbours[start + i] = neighbour_id
+                scores[start + i] = score
+
+        with self._lock:
+            self.likers, self.liked = likers, liked
+            self.neighbours, self.scores = neighbours, scores
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+            self._rebuilding = False
+            replay, self._replay = self._replay, []
+            for event in replay:
+                self.set_like(*event)
+
+    def load(self):
+        """Build the index from the likes table."""
+        stmt = select(likes.c.user_id, likes.c.cocktail_id)
+        self.build(db.session.execute(stmt.execution_options(yield_per=10000)))
+
+    def is_fresh(self):
+        if not self._loaded:
+            return False
+        return self.max_age is None or time.monotonic() - self._loaded_at < self.max_age
+
+    def ensure_loaded(self):
+        if self.is_fresh():
+            return
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            elif not self.is_fresh() and not self._rebuilding and self.app is not None:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name='similar-index', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            with self.app.app_context():
+                self.load()
+        except Exception:
+            self.app.logger.exception('Rebuilding the similar cocktails index failed')
+            with self._lock:
+                # Keep serving the old index; retry after another max_age
+                # rather than on the next request
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._replay = []
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def similar(self, cocktail_id, limit=None):
+        """Up to ``limit`` (neighbour id, co-like count) pairs, most co-liked first."""
+        self.ensure_loaded()
+        k = self.k
+        limit = k if limit is None else min(limit, k)
+        start = cocktail_id * k
+        with self._lock:
+            ids = self.neighbours[start:start + limit]
+            counts = self.scores[start:start + limit]
+        return [(neighbour_id, count) for neighbour_id, count in zip(ids, counts) if neighbour_id]
+
+    # Incremental updates
+
+    def set_like(self, user_id, cocktail_id, liked):
+        """Record that the user now likes (or no longer likes) the cocktail.
+        Repeating an event already recorded does nothing."""
+        with self._lock:
+            if not self._loaded:
+                return  # picked up by the next full load
+            if self._rebuilding:
+                self._replay.append((user_id, cocktail_id, liked))
+            user_ids = self.likers.setdefault(cocktail_id, set())
+            if (user_id in user_ids) == liked:
+                return
+            cocktail_ids = self.liked.setdefault(user_id, set())
+            delta = 1 if liked else -1
+            if liked:
+                user_ids.add(user_id)
+            else:
+                user_ids.discard(user_id)
+            counted = len(cocktail_ids) + (1 if liked else 0) <= self.max_user_likes
+            if counted:
+                for other_id in cocktail_ids:
+                    if other_id != cocktail_id:
+                        self._adjust(cocktail_id, other_id, delta)
+                        self._adjust(other_id, cocktail_id, delta)
+            if liked:
+                cocktail_ids.add(cocktail_id)
+            else:
+                cocktail_ids.discard(cocktail_id)
+
+    def remove(self, cocktail_id):
+        """Forget a deleted cocktail. Other rows may still name it until the
+        next rebuild; callers skip neighbours that no longer exist."""
+        with self._lock:
+            for user_id in self.likers.pop(cocktail_id, ()):
+                self.liked[user_id].discard(cocktail_id)
+            if self._loaded and cocktail_id * self.k < len(self.neighbours):
+                self._write_row(cocktail_id, [])
+
+    def co_likes(self, cocktail_id, other_id):
+        """Users counted in the index who like both cocktails."""
+        both = self.likers.get(cocktail_id, set()) & self.likers.get(other_id, set())
+        return sum(1 for user_id in both if len(self.liked[user_id]) <= self.max_user_likes)
+
+    def _row(self, cocktail_id):
+        start = cocktail_id * self.k
+        if start >= len(self.neighbours):
+            return []
+        return [(neighbour_id, score)
+                for neighbour_id, score in zip(self.neighbours[start:start + self.k],
+                                               self.scores[start:start + self.k])
+                if neighbour_id]
+
+    def _write_row(self, cocktail_id, row):
+        k = self.k
+        start = cocktail_id * k
+        if start >= len(self.neighbours):
+            grow = start + k - len(self.neighbours)
+            self.neighbours.extend(array('i', bytes(4 * grow)))
+            self.scores.extend(array('i', bytes(4 * grow)))
+        row.sort(key=lambda item: (-item[1], item[0]))
+        padded = row[:k] + [(0, 0)] * (k - min(len(row), k))
+        self.neighbours[start:start + k] = array('i', (neighbour_id for neighbour_id, _ in padded))
+        self.scores[start:start + k] = array('i', (score for _, score in padded))
+
+    def _adjust(self, cocktail_id, other_id, delta):
+        """Apply a change of ``delta`` to the pair's co-like count in
+        ``cocktail_id``'s row."""
+        start = cocktail_id * self.k
+        end = start + self.k
+        if other_id in self.neighbours[start:end]:
+            row = self._row(cocktail_id)
+            i = [neighbour_id for neighbour_id, _ in row].index(other_id)
+            score = row[i][1] + delta
+            if score > 0:
+                row[i] = (other_id, score)
+            else:
+                del row[i]
+            self._write_row(cocktail_id, row)
+            return
+        if delta < 0:
+            return
+        weakest = self.scores[end - 1] if end <= len(self.scores) else 0
+        # Cheap upper bound before counting the pair exactly
+        if min(len(self.likers.get(cocktail_id, ())), len(self.likers.get(other_id, ()))) <= weakest:
+            return
+        score = self.co_likes(cocktail_id, other_id)
+        if score > weakest:
+            self._write_row(cocktail_id, self._row(cocktail_id) + [(other_id, score)])
+
+# The current app's index (see create_app)
+similar_index = LocalProxy(lambda: current_app.extensions['similar_index'])
@@ -0,0 +1,162 @@
+"""Static file serving from a manifest built at startup.
+
+``StaticManifest.build()`` walks the static folder once, recording every
+file's size, type and content hash along with any precompressed ``.br`` /
+``.gz`` sibling. ``flask compress-static`` writes those siblings. Requests
+are then answered from the manifest without touching the filesystem, except
+to open the file:
+
+* the .br copy is sent if the client's Accept-Encoding allows it, else the
+  .gz copy, else the file itself, with ``Vary: Accept-Encoding``
+* each variant has its own strong ETag, so If-None-Match gives a 304 and
+  Range / If-Range requests get 206 partial content
+* a URL from ``static_manifest.url()`` (``?v=<hash>``), or a file whose name already
+  carries a content hash (``main.3f9a1c2e.js``), is cached for a year as
+  ``immutable``; anything else (index.html) must be revalidated
+* files are handed to the server's ``wsgi.file_wrapper``, which sends them
+  with sendfile() where the server supports it; Flask's USE_X_SENDFILE
+  hands them to a fronting nginx/Apache instead
+
+Files added after startup are not served until the manifest is rebuilt.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_file, abort, url_for
+from werkzeug.local import LocalProxy
+
+try:
+    import brotli
+except ImportError:  # optional: only needed to write .br files
+    brotli = None
+
+# Preferred first when the client accepts several
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|xml|manifest\+json|wasm)|image/svg\+xml)')
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}\.')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class Asset:
+    __slots__ = ('path', 'size', 'mtime', 'mimetype', 'digest', 'variants')
+
+    def __init__(self, path, size, mtime, mimetype, digest):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.mimetype = mimetype
+        self.digest = digest
+        self.variants = {}  # content coding -> path
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StaticManifest:
+    def __init__(self):
+        self.folder = None
+        self.assets = {}  # path relative to the folder -> Asset
+
+    def init_app(self, app):
+        self.folder = app.static_folder
+        self.build()
+        # Flask's own /static/<filename> route is served the same way
+        app.view_functions['static'] = self.serve
+        app.extensions['static_manifest'] = self
+
+    def build(self):
+        assets = {}
+        if self.folder and os.path.isdir(self.folder):
+            for root, _, files in os.walk(self.folder):
+                for filename in files:
+                    if filename.endswith(('.br', '.gz')):
+                        continue
+                    path = os.path.join(root, filename)
+                    stat = os.stat(path)
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    asset = Asset(path, stat.st_size, stat.st_mtime, mimetype, file_digest(path))
+                    for coding, suffix in ENCODINGS:
+                        variant = path + suffix
+                        # A stale precompressed copy would serve old content
+                        if os.path.exists(variant) and os.stat(variant).st_mtime >= stat.st_mtime:
+                            asset.variants[coding] = variant
+                    assets[os.path.relpath(path, self.folder).replace(os.sep, '/')] = asset
+        self.assets = assets
+        return len(assets)
+
+    def url(self, filename):
+        """URL for a static file that changes whenever its content does, so
+        it can be cached as immutable."""
+        asset = self.assets.get(filename)
+        if asset is None:
+            return url_for('static', filename=filename)
+        return url_for('static', filename=filename, v=asset.digest[:12])
+
+    def serve(self, filename, fallback=None):
+        """Response for the static file ``filename``; unknown files get
+        ``fallback`` (the SPA shell) or a 404."""
+        asset = self.assets.get(filename)
+        if asset is None and fallback is not None:
+            filename, asset = fallback, self.assets.get(fallback)
+        if asset is None:
+            abort(404)
+
+        file_path, etag, encoding = asset.path, asset.digest, None
+        for coding, _ in ENCODINGS:
+            if coding in asset.variants and request.accept_encodings[coding]:
+                file_path, encoding = asset.variants[coding], coding
+                etag = f'{asset.digest}-{coding}'
+                break
+
+        response = send_file(file_path, mimetype=asset.mimetype, etag=etag, conditional=True,
+                             last_modified=asset.mtime, max_age=None)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        if self.is_immutable(filename, asset):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    @staticmethod
+    def is_immutable(filename, asset):
+        version = request.args.get('v')
+        if version is not None:
+            return len(version) >= 8 and asset.digest.startswith(version)
+        return bool(FINGERPRINTED.search(os.path.basename(filename)))
+
+    def compress(self, min_size=1024):
+        """Write .gz (and, with the brotli package, .br) copies of the
+        compressible assets; returns the number of files written."""
+        written = 0
+        for asset in self.assets.values():
+            if asset.size < min_size or not COMPRESSIBLE.match(asset.mimetype):
+                continue
+            with open(asset.path, 'rb') as f:
+                data = f.read()
+            compressors = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+            for suffix, compress in compressors:
+                compressed = compress(data)
+                if len(compressed) < asset.size:
+                    with open(asset.path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+        self.build()
+        return written
+
+
+# The current app's manifest (see create_app)
+static_manifest = LocalProxy(lambda: current_app.extensions['static_manifest'])